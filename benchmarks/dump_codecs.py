@@ -0,0 +1,200 @@
+"""
+Benchmarks the compression ratio and decompression speed of the scraping
+dump codecs, i.e. the legacy gzip members, the zlib records and the zstd
+records with and without the trained per-provider dictionaries.
+
+The codecs can be benchmarked on synthetic provider pages with:
+> python benchmarks/dump_codecs.py run
+
+or on the pings of an existing DUMP folder with:
+> python benchmarks/dump_codecs.py run --dump DUMP
+"""
+
+import gzip
+import pickle
+import random
+import string
+import time
+
+from collections import defaultdict
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import click
+
+from iaso.dump import PINGS_PATTERN
+from iaso.dump.codecs import ZSTD_LEVEL, ZstdDictionaries, ZstdProviderCodec
+from iaso.dump.reader import dump2pings
+from iaso.dump.records import CODEC_ZSTD, decode_record, encode_record
+
+
+class ZstdCodec:
+    """Compresses every record with zstd, but without any dictionary"""
+
+    def __init__(self):
+        import zstandard
+
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+    def compress(self, data):
+        return CODEC_ZSTD, self.compressor.compress(data)
+
+
+def random_words(rng, count):
+    return " ".join(
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+        for _ in range(count)
+    )
+
+
+def synthetic_pings(providers, pings):
+    """
+    Generates the pings of several providers, whose pages share a provider
+    specific boilerplate around a small resource specific body
+    """
+
+    rng = random.Random(42)
+
+    for rid in range(providers):
+        header = (
+            f"<html><head><title>Provider {rid}</title>"
+            + "".join(
+                f'<link rel="stylesheet" href="/static/{random_words(rng, 1)}.css">'
+                for _ in range(20)
+            )
+            + f"</head><body><nav>{random_words(rng, 400)}</nav>"
+        )
+        footer = f"<footer>{random_words(rng, 300)}</footer></body></html>"
+
+        for lui in range(pings):
+            body = "".join(
+                f"<tr><td>{random_words(rng, 1)}</td><td>{rng.random()}</td></tr>"
+                for _ in range(30)
+            )
+
+            yield rid, {
+                "lui": str(lui),
+                "date": "2020-08-01 12:00:00",
+                "redirects": [
+                    {
+                        "url": f"https://provider{rid}.org/resource/{lui}",
+                        "ip_port": "127.0.0.1:443",
+                        "response_time": rng.randint(50, 500),
+                        "status": 200,
+                        "dns_error": False,
+                        "ssl_error": False,
+                        "invalid_response": False,
+                    }
+                ],
+                "content": f"{header}<main><table>{body}</table></main>{footer}",
+                "content-type": "text/html; charset=utf-8",
+            }
+
+
+def dump_pings(dump):
+    errors = defaultdict(list)
+
+    for filename in sorted(Path(dump).iterdir()):
+        result = PINGS_PATTERN.fullmatch(filename.name)
+
+        if result is not None:
+            for ping in dump2pings(filename, errors):
+                yield int(result.group(1)), ping
+
+
+def encode_gzip(rid, pings, tempdir):
+    return [
+        gzip.compress(pickle.dumps(ping), compresslevel=9) for ping in pings
+    ], lambda record: pickle.loads(gzip.decompress(record))
+
+
+def encode_zlib(rid, pings, tempdir):
+    return [encode_record(ping) for ping in pings], decode_record
+
+
+def encode_zstd(rid, pings, tempdir):
+    codec = ZstdCodec()
+
+    dictionaries = ZstdDictionaries(tempdir)
+
+    return [encode_record(ping, codec) for ping in pings], (
+        lambda record: decode_record(record, dictionaries=dictionaries)
+    )
+
+
+def encode_zstd_dictionary(rid, pings, tempdir):
+    codec = ZstdProviderCodec(tempdir, rid)
+
+    dictionaries = ZstdDictionaries(tempdir)
+
+    return [encode_record(ping, codec) for ping in pings], (
+        lambda record: decode_record(record, dictionaries=dictionaries)
+    )
+
+
+CODECS = {
+    "gzip (legacy)": encode_gzip,
+    "zlib": encode_zlib,
+    "zstd": encode_zstd,
+    "zstd + dictionary": encode_zstd_dictionary,
+}
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("--dump", type=click.Path(exists=True, file_okay=False))
+@click.option("--providers", type=click.IntRange(min=1), default=10)
+@click.option("--pings", type=click.IntRange(min=1), default=500)
+def run(dump, providers, pings):
+    pings_per_provider = defaultdict(list)
+
+    for rid, ping in (
+        dump_pings(dump) if dump is not None else synthetic_pings(providers, pings)
+    ):
+        pings_per_provider[rid].append(ping)
+
+    raw_size = sum(
+        len(pickle.dumps(ping))
+        for provider_pings in pings_per_provider.values()
+        for ping in provider_pings
+    )
+
+    click.echo(
+        f"{len(pings_per_provider)} providers, "
+        + f"{sum(len(p) for p in pings_per_provider.values())} pings, "
+        + f"{raw_size / 1024 / 1024:.1f} MiB"
+    )
+
+    for name, encode in CODECS.items():
+        with TemporaryDirectory() as tempdir:
+            size = 0
+            decompression_time = 0.0
+
+            for rid, provider_pings in pings_per_provider.items():
+                records, decode = encode(rid, provider_pings, tempdir)
+
+                size += sum(len(record) for record in records)
+
+                start = time.perf_counter()
+
+                for record in records:
+                    decode(record)
+
+                decompression_time += time.perf_counter() - start
+
+            # The trained dictionaries are stored in the DUMP as well
+            size += sum(path.stat().st_size for path in Path(tempdir).iterdir())
+
+            click.echo(
+                f"{name}: {size / 1024 / 1024:.1f} MiB "
+                + f"(ratio {raw_size / size:.1f}x), "
+                + f"decompression {raw_size / 1024 / 1024 / decompression_time:.0f} MiB/s"
+            )
+
+
+if __name__ == "__main__":
+    cli()
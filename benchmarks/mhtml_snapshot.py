@@ -0,0 +1,97 @@
+"""
+Benchmarks the streaming MHTML snapshot extractor against the reference
+eml_parser + BeautifulSoup implementation on recorded snapshots, which
+requires the optional benchmark dependencies:
+> pip install -e .[benchmarks]
+
+Snapshots can be recorded with:
+> python benchmarks/mhtml_snapshot.py record URL SNAPSHOT.mhtml
+
+and benchmarked with:
+> python benchmarks/mhtml_snapshot.py run SNAPSHOT.mhtml [SNAPSHOT.mhtml ...]
+"""
+
+import asyncio
+import timeit
+
+import click
+
+from bs4 import BeautifulSoup
+
+from iaso.scraping.http.mhtml import extract_html_content
+from mhtml_reference import extract_html_content_eml
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("url")
+@click.argument("snapshot", type=click.Path(dir_okay=False, writable=True))
+@click.option("--wait", type=click.IntRange(min=0), default=5)
+def record(url, snapshot, wait):
+    import pyppeteer
+
+    async def record_snapshot():
+        browser = await pyppeteer.launch(headless=True, args=["--no-sandbox"])
+
+        try:
+            page = await browser.newPage()
+
+            await page.goto(url, waitUntil=["domcontentloaded"])
+            await page.waitFor(wait * 1000)
+
+            return (await page._client.send("Page.captureSnapshot"))["data"]
+        finally:
+            await browser.close()
+
+    with open(snapshot, "w", newline="") as file:
+        file.write(asyncio.get_event_loop().run_until_complete(record_snapshot()))
+
+
+@cli.command()
+@click.argument(
+    "snapshots", type=click.Path(exists=True, dir_okay=False), nargs=-1, required=True
+)
+@click.option("--repeat", type=click.IntRange(min=1), default=10)
+def run(snapshots, repeat):
+    for path in snapshots:
+        with open(path, "r", newline="") as file:
+            snapshot = file.read()
+
+        reference_time = (
+            min(
+                timeit.repeat(
+                    lambda: extract_html_content_eml(snapshot), number=1, repeat=repeat
+                )
+            )
+            * 1000
+        )
+        streaming_time = (
+            min(
+                timeit.repeat(
+                    lambda: extract_html_content(snapshot), number=1, repeat=repeat
+                )
+            )
+            * 1000
+        )
+
+        # Both implementations should extract the same visible text
+        same_text = (
+            BeautifulSoup(extract_html_content(snapshot), "lxml").get_text()
+            == BeautifulSoup(extract_html_content_eml(snapshot), "lxml").get_text()
+        )
+
+        click.echo(
+            f"{path}: {len(snapshot) / 1024:.0f} KiB, "
+            + f"eml_parser {reference_time:.2f} ms, "
+            + f"streaming {streaming_time:.2f} ms "
+            + f"({reference_time / max(streaming_time, 1e-6):.1f}x), "
+            + f"same text: {same_text}"
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,139 +1,83 @@
 import gc
 import json
-import os
-import re
-import signal
-import time
 
-from functools import partial
-from multiprocessing import Pipe, Process
-from pathlib import Path
-
-from tqdm import tqdm
-
-from .common_fragments import extract_common_fragments_per_lui
+from .common_fragments import (
+    create_common_fragments_pool,
+    extract_common_fragments_per_lui,
+)
 from .shared_fragments import extract_shared_fragments_from_tree
 from .suffix_tree import extract_shared_suffix_tree
 
-PINGS_PATTERN = re.compile(r"pings_(\d+)\.gz")
-
-
-class IPCProxy:
-    def __init__(self, name, pipe):
-        self.name = name
-        self.pipe = pipe
-
-    def __call_proxy(self, method, *args, **kwargs):
-        self.pipe.send((self.name, method, args, kwargs))
-
-    def __getattr__(self, attr):
-        return partial(self.__call_proxy, attr)
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, type, value, traceback):
-        self.pipe.close()
-
-
-def analyse_single_file_worker(outer_progress, inner_progress, filepath, rid, datamine):
-    with outer_progress, inner_progress:
-        outer_progress.set_postfix({"rid": rid})
-
-        luis, common_fragments_per_lui = extract_common_fragments_per_lui(
-            inner_progress, filepath
-        )
-
-        common_lengths = [len(fragments) for fragments in common_fragments_per_lui]
-        common_noise = [
-            fragments.count("NOISE") for fragments in common_fragments_per_lui
-        ]
-
-        gc.collect()
 
-        tree = extract_shared_suffix_tree(
-            outer_progress, inner_progress, rid, luis, common_fragments_per_lui
-        )
-
-        del common_fragments_per_lui
+def analyse_single_file(
+    pool, datamine, subdir, outer_progress, inner_progress, filename, rid, errors
+):
+    """
+    Analyses the records file of one provider in this process, while the
+    common fragments of its LUIs are extracted by the pool, which is shared
+    across the analyses of all providers. The LUIs which could not be
+    analysed are skipped, and their errors are collected in errors.
+    """
 
-        gc.collect()
+    outer_progress.set_postfix({"rid": rid})
 
-        shared_fragments = extract_shared_fragments_from_tree(
-            outer_progress, inner_progress, rid, luis, tree
-        )
+    luis, common_fragments_per_lui = extract_common_fragments_per_lui(
+        pool, inner_progress, subdir / filename, errors
+    )
 
-        del tree
+    common_lengths = [len(fragments) for fragments in common_fragments_per_lui]
+    common_noise = [fragments.count("NOISE") for fragments in common_fragments_per_lui]
 
-        gc.collect()
+    gc.collect()
 
-        datamine.write("[")
+    tree = extract_shared_suffix_tree(
+        outer_progress, inner_progress, rid, luis, common_fragments_per_lui
+    )
 
-        append_analysis = False
+    del common_fragments_per_lui
 
-        for l, (lui, fragments) in enumerate(zip(luis, shared_fragments)):
-            L = common_lengths[l]
+    gc.collect()
 
-            if L == 0:
-                continue
+    shared_fragments = extract_shared_fragments_from_tree(
+        outer_progress, inner_progress, rid, luis, tree
+    )
 
-            C = sum(len(fragment) for fragment in fragments)
-            n = len(fragments)
+    del tree
 
-            info = (L - C + n - 1.0) / L
+    gc.collect()
 
-            if append_analysis:
-                datamine.write(", ")
+    datamine.write("[")
 
-            json.dump(
-                {
-                    "lui": lui,
-                    "information_content": round(info, 5),
-                    "length": L,
-                    "noise": common_noise[l],
-                },
-                datamine,
-            )
+    append_analysis = False
 
-            append_analysis = True
+    # Providers without any LUIs have no shared fragments
+    for l, (lui, fragments) in enumerate(zip(luis, shared_fragments or [])):
+        L = common_lengths[l]
 
-        datamine.write("]")
+        if L == 0:
+            continue
 
+        C = sum(len(fragment) for fragment in fragments)
+        n = len(fragments)
 
-def analyse_single_file(
-    datamine, subdir, outer_progress, inner_progress, filename, rid
-):
-    pipe_read, pipe_write = Pipe(False)
-
-    process = Process(
-        target=analyse_single_file_worker,
-        args=(
-            IPCProxy("outer_progress", pipe_write),
-            IPCProxy("inner_progress", pipe_write),
-            subdir / filename,
-            rid,
-            IPCProxy("datamine", pipe_write),
-        ),
-    )
-    process.start()
+        info = (L - C + n - 1.0) / L
 
-    pipe_write.close()
+        if append_analysis:
+            datamine.write(", ")
 
-    proxies = {
-        "outer_progress": outer_progress,
-        "inner_progress": inner_progress,
-        "datamine": datamine,
-    }
+        json.dump(
+            {
+                "lui": lui,
+                "information_content": round(info, 5),
+                "length": L,
+                "noise": common_noise[l],
+            },
+            datamine,
+        )
 
-    while True:
-        try:
-            (proxy_name, method, args, kwargs) = pipe_read.recv()
+        append_analysis = True
 
-            getattr(proxies[proxy_name], method)(*args, **kwargs)
-        except EOFError:
-            break
+    datamine.write("]")
 
     inner_progress.set_description("Finalising resource analysis")
     inner_progress.reset(total=1)
-
-    process.join()
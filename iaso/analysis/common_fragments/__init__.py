@@ -1,38 +1,49 @@
-import gzip
-import mmap
 import multiprocessing as mp
 import os
-import pickle
-import re
+import queue
 import signal
-import time
 
-from collections import defaultdict
-from queue import Empty as EmptyQueueException
+from collections import defaultdict, deque
 
-from .worker import extract_common_fragments_per_lui_worker
+from requests import codes as status_code_values
 
+from ...dump.reader import read_dump_index
+from .worker import (
+    extract_common_fragments_per_lui_worker,
+    init_common_fragments_worker,
+)
+
+MAX_CHUNK_SIZE = 16
+
+
+def create_common_fragments_pool():
+    """
+    Creates the long-lived worker pool which extracts the common fragments
+    of the LUIs of all providers
+    """
+
+    return mp.Pool(os.cpu_count() or 1, initializer=init_common_fragments_worker)
+
+
+def extract_common_fragments_per_lui(pool, inner_progress, filepath, errors):
+    """
+    Extracts the common fragments of the LUIs of the provider's records file
+    at filepath in the pool. The LUIs of chunks which fail in the pool are
+    skipped, and their exceptions are collected in errors[filepath].
+    """
 
-def extract_common_fragments_per_lui(inner_progress, filepath):
     inner_progress.set_description("Extracting lui entry points")
     inner_progress.reset(total=1)
 
     lui_entry_points = defaultdict(list)
 
-    with open(filepath, "r+b") as raw:
-        with mmap.mmap(raw.fileno(), 0) as raw:
-            entry_points = [m.start() for m in re.finditer(b"\x1f\x8b", raw)]
-
-            for entry_point in entry_points:
-                raw.seek(entry_point)
+    # Only the successfully scraped pings with content are tokenised, but all
+    #  luis need to be excluded and reported
+    for entry in read_dump_index(filepath):
+        entry_points = lui_entry_points[entry.lui]
 
-                try:
-                    with gzip.GzipFile(fileobj=raw, mode="rb") as file:
-                        lui_entry_points[pickle.load(file)["lui"]].append(entry_point)
-                except OSError:
-                    pass
-                except Exception as err:
-                    pass
+        if entry.status == status_code_values.ok and not entry.empty_content:
+            entry_points.append(entry)
 
     extended_luis = set()
 
@@ -53,74 +64,83 @@ def extract_common_fragments_per_lui(inner_progress, filepath):
     inner_progress.set_description("Extracting common token fragments")
     inner_progress.reset(total=len(lui_entry_points))
 
-    common_fragments_per_lui = dict()
-
     workers = os.cpu_count() or 1
 
     jobs = list(lui_entry_points.items())
 
-    running_processes = set()
-    queue = mp.Queue()
+    # The jobs are submitted to the pool in chunks, of which only a few are
+    #  in flight at once, such that an interrupt stops the remaining chunks
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(jobs) // (workers * 4)))
 
-    try:
+    chunks = deque(jobs[i : (i + chunk_size)] for i in range(0, len(jobs), chunk_size))
 
-        def signal_handler(signal, frame):
-            jobs.clear()
+    results = queue.Queue()
+    running_chunks = 0
 
-            print()
-            print("Shutting down the common fragments worker pool ...")
-            print("Waiting for all running workers to complete ...")
-            print()
+    common_fragments_per_lui = dict()
 
-        signal.signal(signal.SIGINT, signal_handler)
+    def signal_handler(signal, frame):
+        chunks.clear()
 
-        while len(jobs) > 0 or len(running_processes) > 0:
-            active_processes = set(mp.active_children())
+        print()
+        print("Shutting down the common fragments worker pool ...")
+        print("Waiting for all running workers to complete ...")
+        print()
 
-            inner_progress.set_postfix({"workers": len(active_processes)})
+        if callable(previous_signal_handler):
+            previous_signal_handler(signal, frame)
 
-            finished_processes = []
+    previous_signal_handler = signal.signal(signal.SIGINT, signal_handler)
 
-            for process in running_processes:
-                if process not in active_processes:
-                    finished_processes.append(process)
+    try:
+        while len(chunks) > 0 or running_chunks > 0:
+            while len(chunks) > 0 and running_chunks < workers * 2:
+                chunk = chunks.popleft()
+
+                pool.apply_async(
+                    extract_common_fragments_per_lui_worker,
+                    (filepath, chunk, exclusions),
+                    callback=lambda chunk_results: results.put((chunk_results, None)),
+                    error_callback=lambda err, chunk=chunk: results.put((chunk, err)),
+                )
 
-            for _ in range(min(workers - len(active_processes), len(jobs))):
-                try:
-                    lui, entry_points = jobs.pop()
-                except IndexError:
-                    break
+                running_chunks += 1
 
-                process = mp.Process(
-                    target=extract_common_fragments_per_lui_worker,
-                    args=(queue, lui, filepath, entry_points, exclusions),
-                )
+            inner_progress.set_postfix({"workers": min(running_chunks, workers)})
 
-                running_processes.add(process)
+            try:
+                chunk_results, err = results.get(timeout=0.1)
+            except queue.Empty:
+                continue
 
-                process.start()
+            running_chunks -= 1
 
-            for process in finished_processes:
-                running_processes.remove(process)
+            # The LUIs of a failed chunk are skipped, but its error is reported
+            if err is not None:
+                errors[filepath].append(err)
 
-            while True:
-                try:
-                    lui, fragments = queue.get(False)
+                inner_progress.update(len(chunk_results))
 
-                    common_fragments_per_lui[lui] = fragments
+                continue
 
-                    inner_progress.update()
-                except EmptyQueueException:
-                    break
+            for lui, fragments in chunk_results:
+                common_fragments_per_lui[lui] = fragments
 
-            time.sleep(0.01)
+            inner_progress.update(len(chunk_results))
     finally:
-        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, previous_signal_handler)
 
     inner_progress.set_postfix(None)
 
+    # The results are ordered deterministically regardless of their completion
+    common_fragments_per_lui = [
+        (lui, common_fragments_per_lui[lui])
+        for lui in lui_entry_points
+        if lui in common_fragments_per_lui
+    ]
+
     if len(common_fragments_per_lui) > 0:
-        luis, common_fragments_per_lui = zip(*common_fragments_per_lui.items())
+        luis, common_fragments_per_lui = zip(*common_fragments_per_lui)
     else:
         luis, common_fragments_per_lui = [], []
 
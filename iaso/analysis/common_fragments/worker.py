@@ -1,48 +1,87 @@
-import gzip
-import mmap
-import pickle
-import re
 import signal
 
+from collections import defaultdict
+from contextlib import nullcontext
+from pathlib import Path
+
 from requests import codes as status_code_values
 
 from athena import SharedFragmentTree, tokenise_and_join_with_spaces
 
+from ...dump import blobs_path
+from ...dump.blobs import BlobStoreReader
+from ...dump.reader import read_pings
+from ...dump.records import RecordError
+
 
-def extract_common_fragments_per_lui_worker(
-    queue, lui, filepath, entry_points, exclusions
-):
+def init_common_fragments_worker():
+    # Running chunks are always completed, only the main process is interrupted
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    tokens = []
 
-    with open(filepath, "r+b") as raw:
-        with mmap.mmap(raw.fileno(), 0) as raw:
-            for entry_point in entry_points:
-                raw.seek(entry_point)
+def extract_common_fragments_per_lui_worker(filepath, chunk, exclusions):
+    """
+    Extracts the common fragments of a chunk of (lui, entry_points) jobs of
+    one provider, whose records file and blob store are only opened once per
+    chunk. Returns the list of (lui, fragments) results of the chunk.
+    """
+
+    tokens_per_lui = {lui: [] for lui, _entry_points in chunk}
+
+    # Pings with the same content digest are only resolved and tokenised once
+    tokens_per_digest = dict()
+
+    dump = Path(filepath).parent
+
+    with (
+        BlobStoreReader(dump) if blobs_path(dump).exists() else nullcontext()
+    ) as blobs:
+        for ping in read_pings(
+            filepath,
+            [entry for _lui, entry_points in chunk for entry in entry_points],
+            defaultdict(list),
+            resolve_content=False,
+        ):
+            tokens = tokens_per_lui.get(ping["lui"])
+            digest = ping.get("content_digest")
+            http = (
+                ping["redirects"][-1]["status"] if len(ping["redirects"]) > 0 else None
+            )
+
+            if tokens is None or http != status_code_values.ok:
+                continue
+
+            if digest in tokens_per_digest:
+                tokens.append(tokens_per_digest[digest])
+
+                continue
+
+            content = ping.get("content")
+
+            if content is None and digest is not None and blobs is not None:
+                try:
+                    content = blobs.get(digest)
+                except RecordError:
+                    continue
+
+            if content is not None:
+                tokens.append(
+                    tokenise_and_join_with_spaces(content, exclusions).split(" ")
+                )
 
-                with gzip.GzipFile(fileobj=raw, mode="rb") as file:
-                    ping = pickle.load(file)
+                if digest is not None:
+                    tokens_per_digest[digest] = tokens[-1]
 
-                    content = ping["content"]
-                    http = (
-                        ping["redirects"][-1]["status"]
-                        if len(ping["redirects"]) > 0
-                        else None
-                    )
+    results = []
 
-                    if content is not None and http == status_code_values.ok:
-                        tokens.append(
-                            tokenise_and_join_with_spaces(content, exclusions).split(
-                                " "
-                            )
-                        )
+    for lui, tokens in tokens_per_lui.items():
+        if len(tokens) > 0:
+            tree = SharedFragmentTree(tokens)
 
-    if len(tokens) > 0:
-        tree = SharedFragmentTree(tokens)
+            fragments = tree.extract_combination_of_all_common_fragments()
+        else:
+            fragments = []
 
-        fragments = tree.extract_combination_of_all_common_fragments()
-    else:
-        fragments = []
+        results.append((lui, fragments))
 
-    queue.put((lui, fragments), True)
+    return results
@@ -49,7 +49,10 @@ def get_version():
             "jobs",
             "proxy3",
             "scrape",
+            "scrape-coordinator",
             "dump2datamine",
+            "legacy2dump",
+            "shards2dump",
             "dedup4institutions",
             "curate",
         ],
@@ -59,7 +59,10 @@ def check_athena_callback(ctx, param, value):
 @click.command()
 @click.pass_context
 @click.argument(
-    "dump", type=click.Path(exists=DockerPathExists(), readable=True, file_okay=False)
+    "dumps",
+    type=click.Path(exists=DockerPathExists(), readable=True, file_okay=False),
+    nargs=-1,
+    required=True,
 )
 @click.argument(
     "datamine", type=click.Path(exists=False, writable=True, dir_okay=False)
@@ -68,6 +71,17 @@ def check_athena_callback(ctx, param, value):
     "--analyse",
     is_flag=True,
 )
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_envvar=True,
+)
+@click.option(
+    "--cache",
+    type=click.Path(writable=True, file_okay=False),
+    show_envvar=True,
+)
 @click.option(
     "--check-athena",
     is_flag=True,
@@ -76,9 +90,9 @@ def check_athena_callback(ctx, param, value):
     is_eager=True,
 )
 @wrap_docker()
-def dump2datamine(ctx, dump, datamine, analyse):
+def dump2datamine(ctx, dumps, datamine, analyse, jobs, cache):
     """
-    Generates the DATAMINE file from the DUMP folder.
+    Generates the DATAMINE file from one or more DUMPS folders.
 
     \b
     This helper command bridges the gap between the DUMP generated by
@@ -86,6 +100,23 @@ def dump2datamine(ctx, dump, datamine, analyse):
     and the interactive curation process
     > cmd-iaso curate [...] start resources DATAMINE [...]
 
+    \b
+    Several DUMP folders, e.g. from the shards of
+    > cmd-iaso scrape --shard I/N [...] JOBS DUMP_I [...]
+    are merged into one DATAMINE file in a single pass.
+
+    --jobs specifies the number of processes which convert the pings of
+    different providers in parallel. The converted providers are written
+    to the DATAMINE file in the same order as with a single process.
+    By default, all providers are converted by one process.
+
+    --cache specifies a folder in which the converted pings and the analysis
+    of every provider are cached. The cache is keyed by the size, mtime and
+    content hash of the provider's records files, such that a later run only
+    converts and analyses the providers whose records have changed, e.g.
+    after new providers were added to the DUMPS or an interrupted --analyse
+    run. By default, no cache is used.
+
     If the --analyse flag is passed, the scraped responses in the DUMP
     folder are analysed to check if the resource providers are working
     as expected. The analysis provides data for the information-content
@@ -115,12 +146,12 @@ def dump2datamine(ctx, dump, datamine, analyse):
             abort=True,
         )
 
-    errors = generate_datamine_from_dump(dump, datamine, analyse)
+    errors = generate_datamine_from_dump(dumps, datamine, analyse, jobs, cache)
 
     if len(errors) == 0:
         click.echo(
             click.style(
-                f"The scraping DUMP at {dump} was successfully converted into a DATAMINE file at {datamine}.",
+                f"The scraping DUMPS at {', '.join(dumps)} were successfully converted into a DATAMINE file at {datamine}.",
                 fg="green",
             )
         )
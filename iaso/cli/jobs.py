@@ -13,6 +13,7 @@ lazy_import(
     """
 from ..namespace_ids import NamespaceIds
 from ..scraping.jobs.generate import generate_scraping_jobs
+from ..scraping.jobs.shards import shard_jobs_path, split_jobs_into_shards
 """,
 )
 
@@ -49,8 +50,13 @@ from ..scraping.jobs.generate import generate_scraping_jobs
     not_required_if=["valid<2"],
     show_envvar=True,
 )
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
 @wrap_docker()
-def jobs(ctx, jobs, valid, random, pings, valid_namespace_ids):
+def jobs(ctx, jobs, valid, random, pings, valid_namespace_ids, shards):
     """
     Generates the jobs for the data scraping subcommand and stores them at the
     JOBS file path.
@@ -68,24 +74,50 @@ def jobs(ctx, jobs, valid, random, pings, valid_namespace_ids):
 
     Iff --valid VALID is greater than 1, --valid-namespace-ids VALID_NAMESPACE_IDS
     must specify the file path to a namespace ids file.
+
+    --shards N additionally splits the jobs into N balanced shards, which are
+    stored next to the JOBS file, e.g. jobs.json is split into
+    jobs.1-of-N.json, ..., jobs.N-of-N.json. All jobs of a host belong to the
+    same shard.
+
+    \b
+    Every shard contains exactly the jobs which
+    > cmd-iaso scrape --shard I/N JOBS [...]
+    would run on the complete JOBS file.
     """
 
-    if os.path.exists(jobs):
-        click.confirm(
-            f"{jobs} already exists. Do you want to overwrite {jobs} with the new JOBS file?",
-            abort=True,
+    if shards is not None and jobs == "-":
+        raise click.UsageError(
+            click.style("You can only use --shards if JOBS is a file path.", fg="red")
         )
 
+    paths = [jobs] + (
+        [shard_jobs_path(jobs, index, shards) for index in range(1, shards + 1)]
+        if shards is not None
+        else []
+    )
+
+    for path in paths:
+        if os.path.exists(path):
+            click.confirm(
+                f"{path} already exists. Do you want to overwrite {path} with the new JOBS file?",
+                abort=True,
+            )
+
+    scraping_jobs = generate_scraping_jobs(
+        ensure_registry(ctx),
+        valid,
+        random,
+        pings,
+        NamespaceIds(valid_namespace_ids) if valid_namespace_ids is not None else None,
+    )
+
     with click.open_file(jobs, "w") as file:
-        json.dump(
-            generate_scraping_jobs(
-                ensure_registry(ctx),
-                valid,
-                random,
-                pings,
-                NamespaceIds(valid_namespace_ids)
-                if valid_namespace_ids is not None
-                else None,
-            ),
-            file,
-        )
+        json.dump(scraping_jobs, file)
+
+    if shards is not None:
+        for path, shard in zip(
+            paths[1:], split_jobs_into_shards(scraping_jobs, shards)
+        ):
+            with click.open_file(path, "w") as file:
+                json.dump(shard, file)
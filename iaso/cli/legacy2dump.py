@@ -0,0 +1,102 @@
+import os
+
+from collections import defaultdict
+from pathlib import Path
+
+import click
+
+from ..click.docker import DockerPathExists, wrap_docker
+from ..click.lazy import lazy_import
+
+lazy_import(
+    globals(),
+    """
+from tqdm import tqdm
+
+from ..dump import LEGACY_PINGS_PATTERN, records_path
+from ..dump.legacy import convert_legacy_dump_file
+""",
+)
+
+
+@click.command()
+@click.pass_context
+@click.argument(
+    "dump",
+    type=click.Path(
+        exists=DockerPathExists(), readable=True, writable=True, file_okay=False
+    ),
+)
+@click.option(
+    "--delete",
+    is_flag=True,
+)
+@wrap_docker()
+def legacy2dump(ctx, dump, delete):
+    """
+    Converts the scraping dumps inside the DUMP folder from the legacy gzip
+    format into the indexed records format.
+
+    \b
+    Every pings_RID.gz file is converted into a pings_RID.rec records file
+    and its pings_RID.idx sidecar index, which are used by
+    > cmd-iaso scrape [...] DUMP [...]
+    > cmd-iaso dump2datamine DUMP [...]
+
+    --delete removes the legacy files after they have been converted.
+    Legacy files which contained erroneous entries are always kept.
+    """
+
+    legacy_files = [
+        filename
+        for filename in sorted(os.listdir(dump))
+        if LEGACY_PINGS_PATTERN.fullmatch(filename) is not None
+    ]
+
+    errors = defaultdict(list)
+    kept_files = []
+
+    for filename in tqdm(legacy_files, desc="Converting legacy scraping dumps"):
+        rid = int(LEGACY_PINGS_PATTERN.fullmatch(filename).group(1))
+
+        legacy_path = Path(dump) / filename
+
+        convert_legacy_dump_file(legacy_path, records_path(dump, rid), errors=errors)
+
+        if delete:
+            # Erroneous entries might still be recovered from the legacy file
+            if len(errors.get(legacy_path, [])) > 0:
+                kept_files.append(legacy_path)
+            else:
+                os.remove(legacy_path)
+
+    if len(errors) == 0:
+        click.echo(
+            click.style(
+                f"The {len(legacy_files)} legacy scraping dumps at {dump} were successfully converted.",
+                fg="green",
+            )
+        )
+    else:
+        num_errors = sum(len(errs) for file, errs in errors.items())
+
+        click.echo(
+            click.style(
+                f"ERROR: There were a total of {num_errors} erroneous entries in the following files:",
+                fg="red",
+            )
+        )
+
+        for file in errors.keys():
+            click.echo(f"- {file}")
+
+    if len(kept_files) > 0:
+        click.echo(
+            click.style(
+                f"WARNING: The following {len(kept_files)} legacy scraping dumps were not deleted as they contained erroneous entries:",
+                fg="yellow",
+            )
+        )
+
+        for file in kept_files:
+            click.echo(f"- {file}")
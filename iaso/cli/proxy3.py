@@ -4,13 +4,15 @@ from functools import partial
 
 import click
 
-from ..click.docker import wrap_docker
+from ..click.docker import DockerPathExists, wrap_docker
 from ..click.lazy import lazy_import
 
 lazy_import(
     globals(),
     """
+from ..scraping.http.certificates import collect_https_hostnames
 from ..scraping.http.proxy3 import serve as serve_proxy
+from ..scraping.jobs import ScrapingJobs
 """,
 )
 
@@ -19,6 +21,43 @@ from ..scraping.http.proxy3 import serve as serve_proxy
 @click.pass_context
 @click.option("--port", default=8080, show_envvar=True)
 @click.option("--timeout", default=10, show_envvar=True)
+@click.option(
+    "--engine",
+    type=click.Choice(["threading", "asyncio"]),
+    default="threading",
+    show_envvar=True,
+)
+@click.option(
+    "--certificate-cache",
+    type=click.Path(writable=True, file_okay=False),
+    show_envvar=True,
+)
+@click.option(
+    "--prewarm",
+    type=click.Path(
+        exists=DockerPathExists(), readable=True, dir_okay=False, allow_dash=True
+    ),
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+)
+@click.option(
+    "--max-body-size",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--cache-disk-size",
+    type=click.IntRange(min=0),
+    default=0,
+    show_envvar=True,
+)
 @click.option(
     "--log",
     type=click.Choice(["null", "stderr", "proxy3.log"]),
@@ -26,7 +65,19 @@ from ..scraping.http.proxy3 import serve as serve_proxy
     show_envvar=True,
 )
 @wrap_docker()
-def proxy3(ctx, port, timeout, log):
+def proxy3(
+    ctx,
+    port,
+    timeout,
+    engine,
+    certificate_cache,
+    prewarm,
+    stream,
+    max_body_size,
+    cache_size,
+    cache_disk_size,
+    log,
+):
     """
     Launches a new instance of the HTTPS intercepting data scraping proxy.
 
@@ -37,17 +88,61 @@ def proxy3(ctx, port, timeout, log):
     requesting resources from the Internet.
     By default, a timeout of 10 seconds is used.
 
+    --engine specifies how the proxy serves its connections. 'threading'
+    uses one thread per connection, while 'asyncio' serves all connections
+    from a single event loop and shares the upstream keep-alive connections
+    between them. By default, the 'threading' engine is used.
+
+    --certificate-cache specifies a directory in which the proxy keeps its
+    certificate authority and the certificates it has minted, such that they
+    can be reused across runs. By default, the certificates are stored in a
+    temporary directory which is removed when the proxy is closed.
+
+    --prewarm specifies a JOBS file whose https hostnames will have their
+    certificates minted in the background while the proxy is already serving.
+
+    --stream relays the headers of every response as soon as they have been
+    received and forwards its body in large chunks using chunked transfer
+    encoding. By default, every response is read completely before it is
+    forwarded. As a streamed response has already been forwarded when its body
+    turns out to be invalid, this is then only reported in its trailers.
+
+    --max-body-size specifies the maximum size in bytes of a forwarded response
+    body. Longer bodies are truncated and flagged with an X-Truncated-Response
+    header. By default, the body size is not limited.
+
+    --cache-size enables a cache for static sub-resources, i.e. scripts,
+    stylesheets, fonts and images, and specifies the size of its in-memory
+    tier in MiB. Only responses which their Cache-Control (or Expires) headers
+    allow to be cached are stored, while the main documents are always
+    requested from the Internet. Cached responses are marked with an X-Cache
+    header. By default, no responses are cached.
+    --cache-disk-size specifies the size in MiB of the cache's on-disk tier,
+    to which entries are demoted when they are evicted from memory.
+    By default, the cache only resides in memory.
+
     --log specifies which logging output to use. 'null' discards all messages,
     'stderr' redirects them to stderr and 'proxy3.log' appends them to the
     proxy3.log file in the current working directory. By default, all messages
     are discarded.
 
-    As this proxy generates a new self-signed SSL certificate to intercept
+    As this proxy generates its own self-signed SSL certificates to intercept
     HTTPS requests, you might get security warnings when you use this proxy.
     """
     serve_proxy(
         port,
         timeout,
+        engine=engine,
+        certificate_cache=certificate_cache,
+        prewarm=collect_https_hostnames(
+            url for rid, lui, random, url in ScrapingJobs(prewarm)
+        )
+        if prewarm is not None
+        else None,
+        stream=stream,
+        max_body_size=max_body_size,
+        cache_size=cache_size * 1024 * 1024 if cache_size is not None else None,
+        cache_disk_size=cache_disk_size * 1024 * 1024,
         log={
             "null": logging.NullHandler,
             "stderr": logging.StreamHandler,
@@ -10,15 +10,20 @@ from ..click.chrome import ChromeChoice
 from ..click.coroutine import coroutine
 from ..click.docker import DockerPathExists, wrap_docker
 from ..click.lazy import lazy_import
+from ..click.shard import ShardParamType
 
 lazy_import(
     globals(),
     """
+from ..dump import LEGACY_PINGS_PATTERN
+from ..dump.codecs import has_zstd
 from ..environment import collect_environment_description
 
 from ..scraping import scrape_resources
+from ..scraping.http.blocking import create_blocking_profile
 from ..scraping.jobs import ScrapingJobs
 from ..scraping.jobs.resume import filter_completed_jobs
+from ..scraping.jobs.shards import shard_jobs
 """,
 )
 
@@ -47,22 +52,140 @@ from ..scraping.jobs.resume import filter_completed_jobs
     default="launch",
     show_envvar=True,
 )
+@click.option(
+    "--proxy-engine",
+    type=click.Choice(["threading", "asyncio"]),
+    default="threading",
+    show_envvar=True,
+)
+@click.option(
+    "--certificate-cache",
+    type=click.Path(writable=True, file_okay=False),
+    show_envvar=True,
+)
+@click.option(
+    "--prewarm-certificates",
+    is_flag=True,
+)
+@click.option(
+    "--proxy-stream",
+    is_flag=True,
+)
+@click.option(
+    "--proxy-max-body-size",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--proxy-cache-size",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--proxy-cache-disk-size",
+    type=click.IntRange(min=0),
+    default=0,
+    show_envvar=True,
+)
 @click.option(
     "--chrome",
     type=click.Path(exists=DockerPathExists(), readable=True, dir_okay=False),
 )
+@click.option(
+    "--engine",
+    type=click.Choice(["browser", "auto", "http"]),
+    default="browser",
+    show_envvar=True,
+)
+@click.option(
+    "--block",
+    type=click.Choice(["image", "media", "font", "stylesheet", "trackers"]),
+    multiple=True,
+)
+@click.option(
+    "--block-hosts",
+    type=click.Path(exists=DockerPathExists(), readable=True, dir_okay=False),
+)
 @click.option(
     "--workers",
     type=click.IntRange(min=1),
     default=32,
     show_envvar=True,
 )
+@click.option(
+    "--host-concurrency",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--host-gap",
+    type=click.FloatRange(min=0.0),
+    default=0.0,
+    show_envvar=True,
+)
+@click.option(
+    "--circuit-breaker",
+    type=click.IntRange(min=1),
+    show_envvar=True,
+)
+@click.option(
+    "--circuit-cooldown",
+    type=click.FloatRange(min=0.0),
+    default=300.0,
+    show_envvar=True,
+)
 @click.option(
     "--timeout",
     type=click.IntRange(min=5),
     default=30,
     show_envvar=True,
 )
+@click.option(
+    "--adaptive-timeout",
+    is_flag=True,
+)
+@click.option(
+    "--timeout-seed",
+    type=click.Path(exists=DockerPathExists(), readable=True, dir_okay=False),
+)
+@click.option(
+    "--recycle-jobs",
+    type=click.IntRange(min=1),
+    default=100,
+    show_envvar=True,
+)
+@click.option(
+    "--recycle-memory",
+    type=click.IntRange(min=256),
+    default=2048,
+    show_envvar=True,
+)
+@click.option(
+    "--flush-interval",
+    type=click.IntRange(min=1),
+    default=5,
+    show_envvar=True,
+)
+@click.option(
+    "--codec",
+    type=click.Choice(["zlib", "zstd"]),
+    default="zlib",
+    show_envvar=True,
+)
+@click.option(
+    "--zstd-dictionaries",
+    type=click.Path(exists=DockerPathExists(), readable=True, file_okay=False),
+    show_envvar=True,
+)
+@click.option(
+    "--shard",
+    type=ShardParamType(),
+    show_envvar=True,
+)
+@click.option(
+    "--coordinator",
+    show_envvar=True,
+)
 @click.option(
     "--log",
     type=click.Choice(["null", "stderr", "scrape.log"]),
@@ -71,7 +194,40 @@ from ..scraping.jobs.resume import filter_completed_jobs
 )
 @wrap_docker()
 @coroutine
-async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
+async def scrape(
+    ctx,
+    jobs,
+    dump,
+    resume,
+    proxy,
+    proxy_engine,
+    certificate_cache,
+    prewarm_certificates,
+    proxy_stream,
+    proxy_max_body_size,
+    proxy_cache_size,
+    proxy_cache_disk_size,
+    chrome,
+    engine,
+    block,
+    block_hosts,
+    workers,
+    host_concurrency,
+    host_gap,
+    circuit_breaker,
+    circuit_cooldown,
+    timeout,
+    adaptive_timeout,
+    timeout_seed,
+    recycle_jobs,
+    recycle_memory,
+    flush_interval,
+    codec,
+    zstd_dictionaries,
+    shard,
+    coordinator,
+    log,
+):
     """
     Runs the data scraping pipeline to gather information on the jobs
     defined in the JOBS file and stores them inside the DUMP folder.
@@ -91,9 +247,49 @@ async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
     to a running proxy instance at the specified address. The proxy will not
     automatically be closed after the scraping has finished.
 
+    --proxy-engine specifies the engine of a proxy launched with
+    --proxy launch, either 'threading' or 'asyncio'. The 'asyncio' engine
+    shares the upstream keep-alive connections between all workers.
+    By default, the 'threading' engine is used.
+
+    --certificate-cache specifies a directory in which a proxy launched with
+    --proxy launch keeps the certificates it mints to intercept HTTPS requests,
+    such that they can be reused across runs. By default, the certificates are
+    discarded after the scraping has finished.
+
+    --prewarm-certificates lets a proxy launched with --proxy launch mint the
+    certificates for all https hostnames in the JOBS file in the background.
+
+    --proxy-stream lets a proxy launched with --proxy launch stream the
+    responses to the browser instead of reading them completely first.
+    --proxy-max-body-size specifies the maximum size in bytes of a response
+    body which such a proxy forwards, beyond which it truncates the body.
+    By default, the body size is not limited.
+
+    --proxy-cache-size lets a proxy launched with --proxy launch cache static
+    sub-resources, e.g. scripts and stylesheets, which are shared between the
+    workers, in an in-memory tier of the specified size in MiB. The main
+    documents are never cached. --proxy-cache-disk-size specifies the size in
+    MiB of the cache's on-disk tier. By default, no responses are cached.
+
     --chrome specifies the path to the Chrome browser executable.
     If not specified, the Chromium browser shipped with pyppeteer will be used instead.
 
+    --engine specifies how http and https resources are scraped:
+    'browser' renders every resource in the headless browser,
+    'http' only fetches every resource with a plain HTTP client, and
+    'auto' first fetches every resource with the plain HTTP client and only
+    renders it in the browser if the page seems to require JavaScript.
+    By default, every resource is rendered in the browser.
+
+    --block lets the browser abort all sub-resource requests of the given
+    kind, which can be specified multiple times. 'image', 'media', 'font' and
+    'stylesheet' block the resources of that type, while 'trackers' blocks
+    requests to well-known analytics and advertising hosts.
+    --block-hosts specifies a file with one additional hostname to block per
+    line, including its subdomains. The main-frame navigations are never
+    blocked. By default, no requests are blocked.
+
     --workers specifies the number of concurrent processes to launch to work
     on scraping requests. A value of 1 is equivalent to running the scraping
     sequentially, while higher values can pipeline the scraping and increase
@@ -101,12 +297,81 @@ async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
     as the proxy might otherwise be overwhelmed and some requests might time out.
     By default, 32 workers are used.
 
+    --host-concurrency specifies how many jobs may be scraped from the same
+    host at the same time. Jobs of other hosts are handed out to the workers
+    while a host is at its limit. By default, the number of concurrent jobs
+    per host is not limited.
+    --host-gap specifies the minimum time in seconds between starting two
+    jobs on the same host. By default, there is no such gap.
+
+    --circuit-breaker specifies after how many consecutive connection failures,
+    e.g. DNS errors or refused connections, a host's jobs are short-circuited.
+    Short-circuited jobs are not scraped but recorded as synthetic pings which
+    repeat the host's connection failure. --circuit-cooldown specifies for how
+    many seconds a host is short-circuited before a single job probes it again.
+    By default, hosts are never short-circuited, and the cooldown is 300 seconds.
+
+    Each worker is a long-lived process which keeps one browser open and
+    runs every job in a fresh incognito browser context.
+    --recycle-jobs specifies after how many jobs a worker is replaced with
+    a fresh one. By default, workers are recycled after 100 jobs.
+    --recycle-memory specifies the memory in MiB that a worker and its
+    browser may use before the worker is recycled.
+    By default, workers are recycled once they use more than 2048 MiB.
+
+    --flush-interval specifies in seconds how often the scraped pings are
+    flushed to the DUMP folder. Only flushed pings are recorded as completed
+    for --resume. By default, pings are flushed every 5 seconds.
+
+    --codec specifies how the pings and contents in the DUMP folder are
+    compressed. 'zlib' compresses every record on its own. 'zstd' trains a
+    compression dictionary for every provider from its first pings, which
+    captures the boilerplate shared by the provider's pages and is stored
+    alongside the provider's pings in the DUMP folder. 'zstd' requires the
+    zstandard package. The codec is detected when the DUMP is read, such that
+    both codecs can be mixed. By default, 'zlib' is used.
+    --zstd-dictionaries specifies a previous DUMP folder whose zstd
+    dictionaries are reused instead of training new ones.
+
     --timeout specifies the timeout in seconds that will be used to cull
     unresponsive scraping requests. Setting a larger value allows slower websites
     to load, especially dynamically loaded websites using JavaScript to provide
     their content. The timeout is also used to cull left-over processes.
     By default, a timeout of 30 seconds is used.
 
+    --adaptive-timeout learns the response times of every host during the
+    scraping and derives the timeout of each job from the 95th percentile
+    of its host's response times plus a margin, which is capped by --timeout.
+    --timeout-seed specifies a DATAMINE file from a previous run whose
+    response times are used to seed the adaptive timeouts.
+    By default, every job uses the same timeout.
+
+    --shard I/N only runs the I-th of N shards of the jobs in the JOBS file,
+    such that N machines can each scrape one shard independently. The jobs are
+    partitioned by their host, such that all jobs of a host belong to the same
+    shard and --host-concurrency and --host-gap still hold, and the shards are
+    balanced by their number of jobs. The partition only depends on the JOBS
+    file. By default, all jobs are scraped.
+
+    \b
+    The shards can also be written up front using:
+    > cmd-iaso jobs --shards N [...] JOBS
+    The shard is recorded in the DUMP's ENVIRONMENT, and the DUMP folders of
+    all shards can be combined using:
+    > cmd-iaso dump2datamine DUMP_1 [...] DUMP_N DATAMINE
+
+    \b
+    --coordinator HOST:PORT connects to a scraping coordinator, which can be
+    launched using:
+    > cmd-iaso scrape-coordinator JOBS --port PORT
+    Instead of running all jobs in the JOBS file, this scraper then leases
+    batches of jobs from the coordinator, which must serve the same JOBS file,
+    and stores their pings in its own DUMP folder. The DUMP folders of all
+    scrapers can be merged afterwards using:
+    > cmd-iaso shards2dump DUMP SHARDS...
+    With --resume, the DUMP folder is kept, but only the coordinator decides
+    which jobs still have to be run.
+
     --log specifies which logging output to use. 'null' discards all messages,
     'stderr' redirects them to stderr and 'scrape.log' appends them to the
     scrape.log file in the current working directory. By default, all messages
@@ -133,6 +398,16 @@ async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
                 fg="red",
             )
         )
+    elif resume and any(
+        LEGACY_PINGS_PATTERN.fullmatch(filename) is not None
+        for filename in os.listdir(dump)
+    ):
+        raise click.UsageError(
+            click.style(
+                f"You cannot use --resume here as {dump} contains scraping dumps in the legacy gzip format. Please convert them first using: cmd-iaso legacy2dump {dump}",
+                fg="red",
+            )
+        )
 
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
@@ -150,20 +425,99 @@ async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
         finally:
             s.close()
 
+    if shard is not None and coordinator is not None:
+        raise click.UsageError(
+            click.style("You cannot use --shard together with --coordinator.", fg="red")
+        )
+
+    shard_name = str(shard) if shard is not None else None
+
+    if resume and (Path(dump) / "ENVIRONMENT").exists():
+        with open(Path(dump) / "ENVIRONMENT", "r") as file:
+            previous_shard = json.load(file).get("shard")
+
+        if previous_shard != shard_name:
+            raise click.UsageError(
+                click.style(
+                    f"You cannot use --resume here as {dump} contains the scraping dump of shard {previous_shard or 'ALL'} instead of {shard_name or 'ALL'}.",
+                    fg="red",
+                )
+            )
+
+    if codec == "zstd" and not has_zstd():
+        raise click.UsageError(
+            click.style(
+                "You can only use --codec zstd if the zstandard package is installed.",
+                fg="red",
+            )
+        )
+
+    if zstd_dictionaries is not None and codec != "zstd":
+        raise click.UsageError(
+            click.style(
+                "You can only use --zstd-dictionaries together with --codec zstd.",
+                fg="red",
+            )
+        )
+
+    if timeout_seed is not None and not adaptive_timeout:
+        raise click.UsageError(
+            click.style(
+                "You can only use --timeout-seed together with --adaptive-timeout.",
+                fg="red",
+            )
+        )
+
+    block_options = "".join(f" --block {kind}" for kind in block) + (
+        f" --block-hosts {block_hosts}" if block_hosts is not None else ""
+    )
+
+    host_options = (
+        f" --host-concurrency {host_concurrency}"
+        if host_concurrency is not None
+        else ""
+    )
+
+    circuit_options = (
+        f" --circuit-breaker {circuit_breaker} --circuit-cooldown {circuit_cooldown}"
+        if circuit_breaker is not None
+        else ""
+    )
+
+    codec_options = f" --codec {codec}" + (
+        f" --zstd-dictionaries {zstd_dictionaries}"
+        if zstd_dictionaries is not None
+        else ""
+    )
+
+    shard_options = f" --shard {shard_name}" if shard is not None else ""
+
+    coordinator_options = (
+        f" --coordinator {coordinator}" if coordinator is not None else ""
+    )
+
     with click.open_file(Path(dump) / "ENVIRONMENT", "w") as file:
         environment = collect_environment_description()
         environment[
             "cmd"
-        ] = f"scrape {jobs} {dump} --proxy {proxy} --workers {workers} --timeout {timeout}"
+        ] = f"scrape {jobs} {dump} --proxy {proxy} --proxy-engine {proxy_engine} --engine {engine}{block_options} --workers {workers}{host_options} --host-gap {host_gap}{circuit_options} --timeout {timeout}{' --adaptive-timeout' if adaptive_timeout else ''}{codec_options}{shard_options}{coordinator_options}"
+
+        if shard is not None:
+            environment["shard"] = shard_name
 
         json.dump(environment, file)
 
     click.echo(f"Loading the scraping jobs from {jobs} ...")
 
     jobs = ScrapingJobs(jobs)
+
+    if shard is not None:
+        jobs = shard_jobs(jobs, *shard)
+
     total_jobs = len(jobs)
 
-    if resume:
+    # The coordinator keeps track of the completed jobs itself
+    if resume and coordinator is None:
         jobs = filter_completed_jobs(jobs, Path(dump) / "PROGRESS")
 
     await scrape_resources(
@@ -175,4 +529,25 @@ async def scrape(ctx, jobs, dump, resume, proxy, chrome, workers, timeout, log):
         workers,
         timeout,
         log,
+        recycle_jobs,
+        recycle_memory,
+        flush_interval,
+        engine,
+        create_blocking_profile(block, block_hosts),
+        host_concurrency,
+        host_gap,
+        circuit_breaker,
+        circuit_cooldown,
+        adaptive_timeout,
+        timeout_seed,
+        proxy_engine,
+        certificate_cache,
+        prewarm_certificates,
+        proxy_stream,
+        proxy_max_body_size,
+        proxy_cache_size,
+        proxy_cache_disk_size,
+        coordinator,
+        codec,
+        zstd_dictionaries,
     )
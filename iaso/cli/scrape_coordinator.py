@@ -0,0 +1,71 @@
+import click
+
+from ..click.docker import DockerPathExists, wrap_docker
+from ..click.lazy import lazy_import
+
+lazy_import(
+    globals(),
+    """
+from ..scraping.coordinator import serve_coordinator
+from ..scraping.jobs import ScrapingJobs
+""",
+)
+
+
+@click.command()
+@click.pass_context
+@click.argument(
+    "jobs",
+    type=click.Path(
+        exists=DockerPathExists(), readable=True, dir_okay=False, allow_dash=True
+    ),
+)
+@click.option("--port", default=8090, show_envvar=True)
+@click.option(
+    "--lease-timeout",
+    type=click.IntRange(min=10),
+    default=120,
+    show_envvar=True,
+)
+@click.option(
+    "--progress",
+    type=click.Path(writable=True, dir_okay=False),
+    default="PROGRESS",
+    show_envvar=True,
+)
+@wrap_docker()
+def scrape_coordinator(ctx, jobs, port, lease_timeout, progress):
+    """
+    Launches a coordinator which distributes the jobs defined in the JOBS
+    file between several scrapers, which can run on different machines.
+
+    \b
+    Every scraper connects to the coordinator using
+    > cmd-iaso scrape JOBS DUMP --coordinator HOST:PORT [...]
+    with the same JOBS file and leases batches of jobs from it. The DUMP
+    folders of all scrapers can then be merged using
+    > cmd-iaso shards2dump DUMP SHARDS...
+
+    --port specifies the port to run the coordinator on.
+    By default, port 8090 is used.
+
+    --lease-timeout specifies the time in seconds after which the jobs leased
+    to a scraper are handed out again if the scraper has stopped renewing its
+    lease, e.g. because it has crashed. By default, leases time out after
+    120 seconds.
+
+    --progress specifies the journal in which the coordinator records the
+    completed jobs. When the coordinator is restarted with the same journal,
+    only the jobs that have not been completed yet are handed out again.
+    By default, the PROGRESS file in the current directory is used.
+
+    Jobs that could not be scraped, e.g. because they timed out or their
+    worker crashed, are handed out again until they have been attempted
+    three times.
+
+    The coordinator exits once all jobs have been completed.
+    """
+
+    click.echo(f"Loading the scraping jobs from {jobs} ...")
+
+    serve_coordinator(ScrapingJobs(jobs), port, lease_timeout, progress)
@@ -0,0 +1,138 @@
+import os
+
+from collections import defaultdict
+from pathlib import Path
+
+import click
+
+from ..click.docker import DockerPathExists, wrap_docker
+from ..click.lazy import lazy_import
+
+lazy_import(
+    globals(),
+    """
+from tqdm import tqdm
+
+from ..dump import LEGACY_PINGS_PATTERN, PINGS_PATTERN, blobs_path, index_path
+from ..dump.codecs import ZSTD_DICTIONARY_PATTERN
+from ..dump.merge import merge_dump_shards
+""",
+)
+
+
+def is_merged_file(filename):
+    """Returns whether the file at filename is written by merging the SHARDS"""
+
+    path = Path(filename)
+
+    return (
+        (
+            path.suffix in (".rec", ".idx")
+            and PINGS_PATTERN.fullmatch(path.with_suffix(".rec").name) is not None
+        )
+        or ZSTD_DICTIONARY_PATTERN.fullmatch(filename) is not None
+        or filename in (blobs_path("").name, index_path(blobs_path("")).name)
+        or filename in ("ENVIRONMENT", "PROGRESS")
+    )
+
+
+@click.command()
+@click.pass_context
+@click.argument(
+    "dump",
+    type=click.Path(
+        exists=DockerPathExists(), readable=True, writable=True, file_okay=False
+    ),
+)
+@click.argument(
+    "shards",
+    type=click.Path(exists=DockerPathExists(), readable=True, file_okay=False),
+    nargs=-1,
+    required=True,
+)
+@wrap_docker()
+def shards2dump(ctx, dump, shards):
+    """
+    Merges the DUMP folders of several scrapers, the SHARDS, into the
+    DUMP folder.
+
+    \b
+    The SHARDS are created by scrapers which share their jobs using
+    > cmd-iaso scrape JOBS SHARD --coordinator HOST:PORT [...]
+    and the merged DUMP can be used by
+    > cmd-iaso dump2datamine DUMP [...]
+
+    The pings of every provider are copied from all SHARDS without being
+    decoded. The PROGRESS journals of the SHARDS are merged as well, while
+    the ENVIRONMENT of the first shard is kept.
+
+    If DUMP is not empty, only the files that are written by the merge are
+    cleared after a confirmation. DUMP must not be one of the SHARDS.
+    """
+
+    for shard in shards:
+        if os.path.samefile(dump, shard):
+            raise click.UsageError(
+                click.style(
+                    f"The DUMP {dump} cannot also be one of the SHARDS.",
+                    fg="red",
+                )
+            )
+
+        if any(
+            LEGACY_PINGS_PATTERN.fullmatch(filename) is not None
+            for filename in os.listdir(shard)
+        ):
+            raise click.UsageError(
+                click.style(
+                    f"The shard {shard} contains scraping dumps in the legacy gzip format. Please convert them first using: cmd-iaso legacy2dump {shard}",
+                    fg="red",
+                )
+            )
+
+    merged_files = [
+        filename
+        for filename in os.listdir(dump)
+        if is_merged_file(filename) and (Path(dump) / filename).is_file()
+    ]
+
+    if len(merged_files) > 0:
+        click.confirm(
+            f"{dump} already contains scraping dumps. Do you want to continue and clear them in {dump}?",
+            abort=True,
+        )
+
+        for filename in merged_files:
+            os.remove(Path(dump) / filename)
+
+    errors = defaultdict(list)
+
+    with tqdm(
+        total=sum(
+            PINGS_PATTERN.fullmatch(filename) is not None
+            for shard in shards
+            for filename in os.listdir(shard)
+        ),
+        desc="Merging scraping shards",
+    ) as progress:
+        merge_dump_shards(dump, shards, errors, progress)
+
+    if len(errors) == 0:
+        click.echo(
+            click.style(
+                f"The {len(shards)} scraping shards were successfully merged into {dump}.",
+                fg="green",
+            )
+        )
+    else:
+        num_errors = sum(len(errs) for file, errs in errors.items())
+
+        click.echo(
+            click.style(
+                f"ERROR: There were a total of {num_errors} erroneous entries in the following files:",
+                fg="red",
+            )
+        )
+
+        for file in errors.keys():
+            click.echo(f"- {file}")
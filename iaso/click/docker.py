@@ -57,7 +57,12 @@ def wrap_docker(exit=True):
                 if not value:
                     continue
 
-                if isinstance(param, click.Argument):
+                if isinstance(param, click.Argument) and param.nargs != 1:
+                    for i, val in enumerate(value):
+                        ctx.obj["docker"].append(
+                            docker_transform_path(ctx, f"{p}/{i}", param, val)
+                        )
+                elif isinstance(param, click.Argument):
                     ctx.obj["docker"].append(
                         docker_transform_path(ctx, p, param, value)
                     )
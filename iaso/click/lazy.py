@@ -17,6 +17,9 @@ def LazyCommandGroup(package, subcommands):
             if name not in subcommands:
                 return None
 
+            # Subcommands with dashes are defined in modules with underscores
+            name = name.replace("-", "_")
+
             return getattr(importlib.import_module(f".{name}", package=package), name)
 
     return LazyCommandGroup
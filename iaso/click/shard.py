@@ -0,0 +1,32 @@
+from collections import namedtuple
+
+import click
+
+
+class Shard(namedtuple("Shard", ["index", "num_shards"])):
+    def __str__(self):
+        return f"{self.index}/{self.num_shards}"
+
+
+class ShardParamType(click.ParamType):
+    name = "I/N"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, Shard):
+            return value
+
+        index, _, num_shards = value.partition("/")
+
+        try:
+            index, num_shards = int(index), int(num_shards)
+        except ValueError:
+            self.fail(f"{value} is not of the form I/N.", param, ctx)
+
+        if num_shards < 1 or not (1 <= index <= num_shards):
+            self.fail(
+                f"{value} must select a shard I with 1 <= I <= N and N >= 1.",
+                param,
+                ctx,
+            )
+
+        return Shard(index, num_shards)
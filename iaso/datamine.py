@@ -18,6 +18,7 @@ Datamine.SCHEMA = {
                 "memory": {"type": "string"},
                 "storage": {"type": "string"},
                 "cmd": {"type": "string"},
+                "shard": {"type": "string"},
             },
             "required": [],
             "additionalProperties": False,
@@ -50,6 +51,7 @@ Datamine.SCHEMA = {
                                             "dns_error": {"type": "boolean"},
                                             "ssl_error": {"type": "boolean"},
                                             "invalid_response": {"type": "boolean"},
+                                            "truncated_response": {"type": "boolean"},
                                         },
                                         "required": [
                                             "url",
@@ -65,6 +67,7 @@ Datamine.SCHEMA = {
                                     "additionalItems": False,
                                 },
                                 "empty_content": {"type": "boolean"},
+                                "short_circuited": {"type": "boolean"},
                             },
                             "required": [
                                 "lui",
@@ -0,0 +1,18 @@
+import re
+
+from pathlib import Path
+
+PINGS_PATTERN = re.compile(r"pings_(\d+)\.rec")
+LEGACY_PINGS_PATTERN = re.compile(r"pings_(\d+)\.gz")
+
+
+def records_path(dump, rid):
+    return Path(dump) / f"pings_{rid}.rec"
+
+
+def index_path(records):
+    return Path(records).with_suffix(".idx")
+
+
+def blobs_path(dump):
+    return Path(dump) / "blobs.rec"
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import mmap
+import os
+
+from . import blobs_path, index_path
+from .codecs import ZstdDictionaries
+from .records import RecordError, decode_record, encode_record, read_record
+
+BLOB_DIGEST_SIZE = 32
+
+
+def content_digest(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8", "surrogatepass")
+
+    return hashlib.blake2b(content, digest_size=BLOB_DIGEST_SIZE).hexdigest()
+
+
+class BinaryContent(str):
+    """
+    The reference blob:MIME;blake2b=DIGEST;length=LENGTH to a binary
+    content, which is stored in the pings instead of the content itself.
+    The referenced data is carried along with the reference until it is
+    stored in the DUMP's blob store under its DIGEST.
+    """
+
+    def __new__(cls, data, mime_type):
+        content = super().__new__(
+            cls, f"blob:{mime_type};blake2b={content_digest(data)};length={len(data)}"
+        )
+
+        content.data = data
+        content.mime_type = mime_type
+
+        return content
+
+    def __reduce__(self):
+        return (BinaryContent, (self.data, self.mime_type))
+
+
+def read_blob_index(dump):
+    """
+    Reads the complete entries of the blob store's index in dump as a dict
+    from the content digests to the offset and length of their records
+    """
+
+    entries = dict()
+
+    path = index_path(blobs_path(dump))
+
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+
+            entry = json.loads(line)
+
+            entries[entry["digest"]] = (entry["offset"], entry["length"])
+
+    return entries
+
+
+class BlobStoreWriter:
+    """
+    Stores every unique scraped content of a DUMP once as a framed record in
+    its content-addressed blob store, such that the pings only need to keep
+    the digest of their content. Like the providers' records files, only
+    flushed blobs are added to the index.
+    """
+
+    def __init__(self, dump):
+        self.records_path = blobs_path(dump)
+        self.index_path = index_path(self.records_path)
+
+        self.entries = read_blob_index(dump)
+
+        end = max(
+            (offset + length for offset, length in self.entries.values()), default=0
+        )
+
+        # Discard any unindexed data left behind by an interrupted run
+        if os.path.exists(self.records_path):
+            os.truncate(self.records_path, min(end, os.path.getsize(self.records_path)))
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as file:
+                content = file.read()
+
+            os.truncate(self.index_path, content.rfind(b"\n") + 1)
+
+        self.records = open(self.records_path, "ab")
+        self.index = open(self.index_path, "a")
+
+        self.offset = self.records.tell()
+
+        self.unflushed_entries = dict()
+
+    def __contains__(self, digest):
+        return digest in self.entries or digest in self.unflushed_entries
+
+    def put(self, content, codec=None):
+        """
+        Stores the content unless it is already stored and returns its digest.
+        New blobs are compressed with the codec of the provider which first
+        scraped them, if any.
+        """
+
+        digest = content_digest(content)
+
+        if digest not in self:
+            self.write_record(digest, encode_record(content, codec))
+
+        return digest
+
+    def write_record(self, digest, record):
+        self.records.write(record)
+
+        self.unflushed_entries[digest] = (self.offset, len(record))
+
+        self.offset += len(record)
+
+    def flush(self):
+        if len(self.unflushed_entries) == 0:
+            return
+
+        self.records.flush()
+        os.fsync(self.records.fileno())
+
+        for digest, (offset, length) in self.unflushed_entries.items():
+            json.dump(
+                {"digest": digest, "offset": offset, "length": length}, self.index
+            )
+            self.index.write("\n")
+
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+        self.entries.update(self.unflushed_entries)
+        self.unflushed_entries.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.records.close()
+            self.index.close()
+
+
+class BlobStoreReader:
+    """Resolves the content digests of the pings in a DUMP to their contents"""
+
+    def __init__(self, dump):
+        self.records_path = blobs_path(dump)
+
+        self.entries = read_blob_index(dump)
+        self.dictionaries = ZstdDictionaries(dump)
+
+        self.file = None
+        self.raw = None
+
+    def __enter__(self):
+        if len(self.entries) > 0 and os.path.getsize(self.records_path) > 0:
+            self.file = open(self.records_path, "rb")
+            self.raw = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.raw is not None:
+            self.raw.close()
+            self.file.close()
+
+    def get(self, digest):
+        entry = self.entries.get(digest)
+
+        if entry is None or self.raw is None:
+            raise RecordError(f"Missing content blob {digest}")
+
+        offset, length = entry
+
+        return decode_record(self.raw, offset, length, self.dictionaries)
+
+    def get_record(self, digest):
+        offset, length = self.entries[digest]
+
+        return read_record(self.raw, offset, length)
+
+    def resolve(self, ping):
+        """Fills in the content of a ping which only stores its digest"""
+
+        digest = ping.get("content_digest")
+
+        if digest is not None and ping.get("content") is None:
+            ping["content"] = self.get(digest)
+
+        return ping
+
+
+def externalise_content(ping, blobs, codec=None):
+    """
+    Returns a copy of the ping whose content has been moved into the blob
+    store, or the ping itself if it has no content. The data of a binary
+    content is stored as a separate blob, which can be looked up using the
+    digest in the content's reference.
+    """
+
+    if ping.get("content") is None:
+        return ping
+
+    ping = dict(ping)
+
+    content = ping.pop("content")
+
+    # The data of a binary content is stored under the digest of its reference
+    if isinstance(content, BinaryContent):
+        blobs.put(content.data, codec)
+
+        content = str(content)
+
+    ping["content_digest"] = blobs.put(content, codec)
+
+    return ping
+
+
+def merge_blobs(dump, blobs, errors):
+    """Copies all blobs of the dump which blobs does not yet store"""
+
+    with BlobStoreReader(dump) as reader:
+        for digest in reader.entries:
+            if digest in blobs:
+                continue
+
+            try:
+                blobs.write_record(digest, reader.get_record(digest))
+            except RecordError as err:
+                errors[reader.records_path].append(err)
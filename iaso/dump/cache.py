@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from . import index_path
+
+CACHE_VERSION = 1
+CACHE_CHUNK_SIZE = 1024 * 1024
+
+
+def write_atomically(path, text):
+    with NamedTemporaryFile("w", dir=Path(path).parent, delete=False) as file:
+        file.write(text)
+
+    os.replace(file.name, path)
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=32)
+
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CACHE_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class DatamineCache:
+    """
+    Caches the converted pings and the analysis of every provider in the
+    cache folder, keyed by the contents of the provider's records files and
+    their indices. The content hash of a file is only recomputed if its size
+    or mtime have changed since it was last hashed.
+
+    Only providers whose records could be read without errors are cached,
+    such that their errors are reported again on every run.
+    """
+
+    def __init__(self, cache):
+        self.cache = Path(cache)
+        self.cache.mkdir(parents=True, exist_ok=True)
+
+        self.files_path = self.cache / "FILES"
+
+        if self.files_path.exists():
+            with open(self.files_path, "r") as file:
+                self.files = json.load(file)
+        else:
+            self.files = dict()
+
+    def file_digest(self, path):
+        path = Path(path).resolve()
+
+        if not path.exists():
+            return None
+
+        stat = path.stat()
+
+        entry = self.files.get(str(path))
+
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+
+        digest = file_digest(path)
+
+        self.files[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        return digest
+
+    def provider_key(self, records):
+        """Returns the cache key of a provider from its records files"""
+
+        return hashlib.blake2b(
+            json.dumps(
+                [CACHE_VERSION]
+                + [
+                    [self.file_digest(path), self.file_digest(index_path(path))]
+                    for path in records
+                ]
+            ).encode("utf-8"),
+            digest_size=16,
+        ).hexdigest()
+
+    def entry_path(self, rid, key, kind):
+        return self.cache / f"provider_{rid}.{key}.{kind}.json"
+
+    def get(self, rid, key, kind):
+        """Returns the path of the cached pings or analysis, if any"""
+
+        path = self.entry_path(rid, key, kind)
+
+        return path if path.exists() else None
+
+    def evict(self, rid, key, kind):
+        for path in self.cache.glob(f"provider_{rid}.*.{kind}.json"):
+            if path != self.entry_path(rid, key, kind):
+                os.remove(path)
+
+    def put(self, rid, key, kind, fragment):
+        """
+        Copies the fragment file into the cache and evicts the entries of the
+        provider's previous records
+        """
+
+        self.evict(rid, key, kind)
+
+        with open(fragment, "r") as source, NamedTemporaryFile(
+            "w", dir=self.cache, delete=False
+        ) as file:
+            shutil.copyfileobj(source, file)
+
+        os.replace(file.name, self.entry_path(rid, key, kind))
+
+    def put_text(self, rid, key, kind, text):
+        self.evict(rid, key, kind)
+
+        write_atomically(self.entry_path(rid, key, kind), text)
+
+    def save(self):
+        # Files which no longer exist will never be looked up again
+        files = {
+            path: entry for path, entry in self.files.items() if os.path.exists(path)
+        }
+
+        write_atomically(self.files_path, json.dumps(files))
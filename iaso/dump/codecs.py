@@ -0,0 +1,202 @@
+import os
+import re
+import shutil
+
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .records import CODEC_ZSTD, RecordError
+
+ZSTD_DICTIONARY_PATTERN = re.compile(r"pings_(\d+)\.(\d+)\.zdict")
+
+ZSTD_LEVEL = 3
+ZSTD_DICTIONARY_SIZE = 64 * 1024
+ZSTD_TRAINING_SAMPLES = 64
+ZSTD_SAMPLE_SIZE = 16 * 1024
+
+
+def has_zstd():
+    return zstandard is not None
+
+
+def check_zstd():
+    if zstandard is None:
+        raise RecordError(
+            "The zstd dump codec requires the zstandard package, which can be installed using: pip install zstandard"
+        )
+
+
+def dictionary_path(dump, rid, dict_id):
+    return Path(dump) / f"pings_{rid}.{dict_id}.zdict"
+
+
+def find_dictionaries(dump):
+    """Returns the paths of all zstd dictionaries in dump by their rid and id"""
+
+    dictionaries = dict()
+
+    if dump is None or not os.path.exists(dump):
+        return dictionaries
+
+    for filename in os.listdir(dump):
+        result = ZSTD_DICTIONARY_PATTERN.fullmatch(filename)
+
+        if result is not None:
+            dictionaries[(int(result.group(1)), int(result.group(2)))] = (
+                Path(dump) / filename
+            )
+
+    return dictionaries
+
+
+def load_provider_dictionary(dump, rid):
+    """Returns the newest zstd dictionary of the provider rid in dump, if any"""
+
+    paths = [
+        path
+        for (dict_rid, _dict_id), path in find_dictionaries(dump).items()
+        if dict_rid == rid
+    ]
+
+    if len(paths) == 0:
+        return None
+
+    with open(max(paths, key=os.path.getmtime), "rb") as file:
+        return zstandard.ZstdCompressionDict(file.read())
+
+
+def copy_dictionaries(source, dump):
+    for (rid, dict_id), path in find_dictionaries(source).items():
+        target = dictionary_path(dump, rid, dict_id)
+
+        if not target.exists():
+            shutil.copyfile(path, target)
+
+
+class ZstdDictionaries:
+    """
+    Decompresses the zstd records of a DUMP, whose frames name the id of the
+    provider dictionary they were compressed with, if any
+    """
+
+    def __init__(self, dump):
+        self.dump = dump
+
+        self.decompressors = dict()
+
+    def decompress(self, payload):
+        check_zstd()
+
+        try:
+            dict_id = zstandard.get_frame_parameters(payload).dict_id
+        except zstandard.ZstdError as err:
+            raise RecordError(f"Invalid zstd frame: {err}")
+
+        decompressor = self.decompressors.get(dict_id)
+
+        if decompressor is None:
+            if dict_id == 0:
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                paths = [
+                    path
+                    for (_rid, path_dict_id), path in find_dictionaries(
+                        self.dump
+                    ).items()
+                    if path_dict_id == dict_id
+                ]
+
+                if len(paths) == 0:
+                    raise RecordError(f"Missing zstd dictionary {dict_id}")
+
+                with open(paths[0], "rb") as file:
+                    decompressor = zstandard.ZstdDecompressor(
+                        dict_data=zstandard.ZstdCompressionDict(file.read())
+                    )
+
+            self.decompressors[dict_id] = decompressor
+
+        try:
+            return decompressor.decompress(payload)
+        except zstandard.ZstdError as err:
+            raise RecordError(f"Corrupted zstd frame: {err}")
+
+
+class ZstdProviderCodec:
+    """
+    Compresses the records of one provider with zstd. The first records are
+    compressed without a dictionary and used to train the provider's
+    dictionary, with which all following records are compressed. The
+    dictionary is stored in the DUMP before the first record which uses it.
+    If a dictionary of the provider exists in the DUMP or in the previous
+    DUMP, it is used right away instead.
+    """
+
+    def __init__(self, dump, rid, previous=None):
+        check_zstd()
+
+        self.dump = dump
+        self.rid = rid
+
+        self.samples = []
+
+        dictionary = load_provider_dictionary(dump, rid)
+
+        if dictionary is None and previous is not None:
+            dictionary = load_provider_dictionary(previous, rid)
+
+            if dictionary is not None:
+                self.save_dictionary(dictionary)
+
+        self.use_dictionary(dictionary)
+
+    def use_dictionary(self, dictionary):
+        self.trained = dictionary is not None
+
+        self.compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL, dict_data=dictionary, write_dict_id=True
+        )
+
+    def save_dictionary(self, dictionary):
+        path = dictionary_path(self.dump, self.rid, dictionary.dict_id())
+
+        with open(path, "wb") as file:
+            file.write(dictionary.as_bytes())
+
+            file.flush()
+            os.fsync(file.fileno())
+
+    def train(self):
+        samples, self.samples = self.samples, []
+
+        try:
+            dictionary = zstandard.train_dictionary(
+                min(ZSTD_DICTIONARY_SIZE, sum(len(sample) for sample in samples)),
+                samples,
+                level=ZSTD_LEVEL,
+            )
+        except zstandard.ZstdError:
+            # Too little or too uniform data to train a dictionary from
+            self.trained = True
+
+            return
+
+        self.save_dictionary(dictionary)
+        self.use_dictionary(dictionary)
+
+    def compress(self, data):
+        payload = self.compressor.compress(data)
+
+        # Only the start of every record is kept as a sample, which bounds the
+        #  memory of the codec and is where the dictionary helps the most
+        if not self.trained:
+            self.samples.append(data[:ZSTD_SAMPLE_SIZE])
+
+            if len(self.samples) >= ZSTD_TRAINING_SAMPLES:
+                self.train()
+
+        return CODEC_ZSTD, payload
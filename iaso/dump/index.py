@@ -0,0 +1,52 @@
+import json
+import os
+
+from collections import namedtuple
+
+IndexEntry = namedtuple(
+    "IndexEntry",
+    ["lui", "ping", "offset", "length", "random", "status", "empty_content"],
+)
+
+
+def index_entry_for_ping(ping, ping_number, offset, length):
+    return IndexEntry(
+        lui=ping["lui"],
+        ping=ping_number,
+        offset=offset,
+        length=length,
+        random=ping["random"],
+        status=(
+            ping["redirects"][-1]["status"] if len(ping["redirects"]) > 0 else None
+        ),
+        empty_content=(
+            ping.get("content", None) is None
+            and ping.get("content_digest", None) is None
+        ),
+    )
+
+
+def write_index_entry(file, entry):
+    json.dump(entry._asdict(), file)
+    file.write("\n")
+
+
+def read_index(path):
+    """
+    Reads all complete entries from the index file at path. A truncated final
+    line, e.g. from an interrupted scraping run, is ignored.
+    """
+
+    entries = []
+
+    if not os.path.exists(path):
+        return entries
+
+    with open(path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+
+            entries.append(IndexEntry(**json.loads(line)))
+
+    return entries
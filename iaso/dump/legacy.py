@@ -0,0 +1,133 @@
+import io
+import mmap
+import os
+import pickle
+import re
+import zlib
+
+from . import index_path
+from .writer import ProviderDumpWriter
+
+GZIP_MAGIC = re.compile(b"\x1f\x8b")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def decompress_salvageable_prefix(decompressor, chunk):
+    """
+    Returns the output of the longest prefix of chunk that decompressor can
+    decompress without an error. The decompressor itself is left untouched.
+    """
+
+    lo, hi = 0, len(chunk)
+
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+
+        try:
+            decompressor.copy().decompress(chunk[:mid])
+
+            lo = mid
+        except zlib.error:
+            hi = mid - 1
+
+    return decompressor.copy().decompress(chunk[:lo]), lo
+
+
+def iter_gzip_members(raw, offset=0):
+    """
+    Walks the gzip members inside the bytes-like object raw, starting at
+    offset, and yields (offset, data) for every member, where data is its
+    decompressed content.
+
+    Members which were cut short, e.g. because the scraping was interrupted,
+    yield the part of their content that could still be decompressed.
+    """
+
+    while True:
+        match = GZIP_MAGIC.search(raw, offset)
+
+        if match is None:
+            return
+
+        offset = match.start()
+
+        decompressor = zlib.decompressobj(wbits=(16 + zlib.MAX_WBITS))
+
+        data = []
+        position = offset
+
+        try:
+            while not decompressor.eof and position < len(raw):
+                chunk = raw[position : (position + CHUNK_SIZE)]
+                checkpoint = decompressor.copy()
+
+                try:
+                    data.append(decompressor.decompress(chunk))
+                except zlib.error:
+                    salvaged, length = decompress_salvageable_prefix(checkpoint, chunk)
+
+                    data.append(salvaged)
+                    position += max(length, 1)
+
+                    break
+
+                position += len(chunk)
+            else:
+                position -= len(decompressor.unused_data)
+        except zlib.error:
+            # The gzip header itself is broken, e.g. a false positive match
+            position = offset + 1
+
+        if len(data) > 0:
+            yield offset, b"".join(data)
+
+        offset = max(position, offset + 1)
+
+
+def iter_pickles(data):
+    """
+    Yields all pickled objects from data. A truncated final object, e.g.
+    from an interrupted scraping run, is silently skipped.
+    """
+
+    file = io.BytesIO(data)
+
+    while file.tell() < len(data):
+        try:
+            yield pickle.load(file)
+        except EOFError:
+            return
+        except pickle.UnpicklingError as err:
+            if "truncated" in str(err):
+                return
+
+            raise err
+
+
+def convert_legacy_dump_file(legacy_path, records_path, errors):
+    """
+    Converts the gzip-appended pings file at legacy_path into a records
+    file at records_path with its sidecar index.
+    """
+
+    for path in [records_path, index_path(records_path)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    writer = ProviderDumpWriter(records_path)
+
+    try:
+        if os.path.getsize(legacy_path) == 0:
+            return
+
+        with open(legacy_path, "rb") as raw:
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+                for _offset, data in iter_gzip_members(raw):
+                    try:
+                        for ping in iter_pickles(data):
+                            writer.write(ping)
+                    except Exception as err:
+                        errors[legacy_path].append(err)
+    finally:
+        writer.close()
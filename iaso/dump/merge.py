@@ -0,0 +1,109 @@
+import mmap
+import os
+import shutil
+
+from pathlib import Path
+
+from ..scraping.jobs.resume import (
+    is_legacy_progress,
+    read_completed_jobs,
+    read_legacy_completed_jobs,
+)
+from . import PINGS_PATTERN, records_path
+from .blobs import BlobStoreWriter, merge_blobs
+from .codecs import copy_dictionaries
+from .reader import read_dump_index
+from .records import RecordError, read_record
+from .writer import ProviderDumpWriter
+
+
+def merge_shard_records(shard_records, writer, errors):
+    """
+    Copies all indexed records of one provider's records file from a shard
+    into the provider's writer of the merged dump without decoding them
+    """
+
+    entries = read_dump_index(shard_records)
+
+    if len(entries) == 0 or os.path.getsize(shard_records) == 0:
+        return
+
+    with open(shard_records, "rb") as raw:
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+            for entry in entries:
+                try:
+                    record = read_record(raw, entry.offset, entry.length)
+                except RecordError as err:
+                    errors[shard_records].append(err)
+
+                    continue
+
+                writer.write_record(record, entry)
+
+
+def merge_shard_progress(shard_progress, progress):
+    if is_legacy_progress(shard_progress):
+        completed_jobs = read_legacy_completed_jobs(shard_progress)
+    else:
+        completed_jobs = read_completed_jobs(shard_progress)
+
+    for job, count in completed_jobs.items():
+        for _ in range(count):
+            progress.write(job)
+            progress.write("\n")
+
+
+def merge_dump_shards(dump, shards, errors, progress=None):
+    """
+    Merges the DUMP folders of several scraping shards into the dump folder,
+    such that it contains the pings, content blobs and zstd dictionaries of
+    all shards, the completed jobs of all their PROGRESS journals and the
+    ENVIRONMENT of the first shard
+    """
+
+    dump = Path(dump)
+
+    blobs = BlobStoreWriter(dump)
+
+    try:
+        with open(dump / "PROGRESS", "a") as dump_progress:
+            for shard in shards:
+                shard = Path(shard)
+
+                # The blobs are flushed before any pings which reference them
+                merge_blobs(shard, blobs, errors)
+
+                # The records are copied as they are, so their zstd
+                #  dictionaries must be copied along with them
+                copy_dictionaries(shard, dump)
+
+                for filename in sorted(os.listdir(shard)):
+                    result = PINGS_PATTERN.fullmatch(filename)
+
+                    if result is None:
+                        continue
+
+                    writer = ProviderDumpWriter(
+                        records_path(dump, int(result.group(1))), blobs
+                    )
+
+                    try:
+                        merge_shard_records(shard / filename, writer, errors)
+                    finally:
+                        writer.close()
+
+                    if progress is not None:
+                        progress.update()
+
+                if (shard / "PROGRESS").exists():
+                    merge_shard_progress(shard / "PROGRESS", dump_progress)
+
+                if (shard / "ENVIRONMENT").exists() and not (
+                    dump / "ENVIRONMENT"
+                ).exists():
+                    shutil.copyfile(shard / "ENVIRONMENT", dump / "ENVIRONMENT")
+
+            dump_progress.flush()
+            os.fsync(dump_progress.fileno())
+    finally:
+        blobs.close()
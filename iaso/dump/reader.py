@@ -0,0 +1,91 @@
+import mmap
+import os
+
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+
+from . import blobs_path, index_path
+from .blobs import BlobStoreReader
+from .codecs import ZstdDictionaries
+from .index import index_entry_for_ping, read_index
+from .records import decode_record, iter_records
+
+
+def scan_index_entries(records_path):
+    """
+    Reconstructs the index entries of the valid records in the records file
+    at records_path by scanning the records
+    """
+
+    if os.path.getsize(records_path) == 0:
+        return []
+
+    ping_numbers = Counter()
+    entries = []
+
+    with open(records_path, "rb") as raw:
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+            for offset, length, ping in iter_records(
+                raw, ZstdDictionaries(Path(records_path).parent)
+            ):
+                entries.append(
+                    index_entry_for_ping(
+                        ping, ping_numbers[ping["lui"]], offset, length
+                    )
+                )
+
+                ping_numbers[ping["lui"]] += 1
+
+    return entries
+
+
+def read_dump_index(records_path):
+    """
+    Returns the index entries of the records file at records_path. If the
+    sidecar index is missing, it is reconstructed by scanning the records.
+    """
+
+    if os.path.exists(index_path(records_path)):
+        return read_index(index_path(records_path))
+
+    return scan_index_entries(records_path)
+
+
+def read_pings(records_path, entries, errors, resolve_content=True):
+    """
+    Yields the pings referenced by entries from the records file at
+    records_path. Unreadable records are collected in errors[records_path].
+
+    The contents of pings which only store their digest are resolved through
+    the blob store of the records file's DUMP, unless resolve_content is False.
+    Records compressed with zstd are detected by their codec and decompressed
+    using the zstd dictionaries stored in the DUMP.
+    """
+
+    if len(entries) == 0 or os.path.getsize(records_path) == 0:
+        return
+
+    dump = Path(records_path).parent
+
+    dictionaries = ZstdDictionaries(dump)
+
+    with open(records_path, "rb") as raw, (
+        BlobStoreReader(dump)
+        if resolve_content and blobs_path(dump).exists()
+        else nullcontext()
+    ) as blobs:
+        with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as raw:
+            for entry in entries:
+                try:
+                    ping = decode_record(raw, entry.offset, entry.length, dictionaries)
+
+                    yield blobs.resolve(ping) if blobs is not None else ping
+                except Exception as err:
+                    errors[records_path].append(err)
+
+
+def dump2pings(records_path, errors, resolve_content=True):
+    yield from read_pings(
+        records_path, read_dump_index(records_path), errors, resolve_content
+    )
@@ -0,0 +1,113 @@
+import pickle
+import struct
+import zlib
+
+# Every record is framed as magic, codec, payload length and payload crc32
+RECORD_HEADER = struct.Struct("<2sBII")
+RECORD_MAGIC = b"\xa7\x1d"
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+
+class RecordError(Exception):
+    pass
+
+
+def encode_record(ping, codec=None):
+    """
+    Encodes the ping as a framed record, which is compressed with zlib
+    unless a codec is given whose compress(data) returns the codec id and
+    the compressed payload. Every zlib record is compressed on its own, so
+    that it can be read at its indexed offset, and cannot share any context
+    with the other records of its provider.
+    """
+
+    data = pickle.dumps(ping, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if codec is None:
+        codec_id, payload = CODEC_ZLIB, zlib.compress(data)
+    else:
+        codec_id, payload = codec.compress(data)
+
+    return (
+        RECORD_HEADER.pack(RECORD_MAGIC, codec_id, len(payload), zlib.crc32(payload))
+        + payload
+    )
+
+
+def read_record(raw, offset=0, length=None):
+    """
+    Returns the complete framed record at offset in raw after checking its
+    framing and payload checksum, without decoding its ping
+    """
+
+    read_record_payload(raw, offset, length)
+
+    _magic, _codec, payload_length, _crc = RECORD_HEADER.unpack_from(raw, offset)
+
+    return bytes(raw[offset : (offset + RECORD_HEADER.size + payload_length)])
+
+
+def decode_record(raw, offset=0, length=None, dictionaries=None):
+    """
+    Decodes the ping of the record at offset in raw. Records compressed with
+    zstd are decompressed by the zstd dictionaries of their DUMP.
+    """
+
+    codec, payload = read_record_payload(raw, offset, length)
+
+    if codec == CODEC_ZLIB:
+        return pickle.loads(zlib.decompress(payload))
+
+    if codec == CODEC_ZSTD and dictionaries is not None:
+        return pickle.loads(dictionaries.decompress(payload))
+
+    raise RecordError(f"Unknown record codec {codec} at offset {offset}")
+
+
+def read_record_payload(raw, offset, length):
+    if (offset + RECORD_HEADER.size) > len(raw):
+        raise RecordError(f"Truncated record header at offset {offset}")
+
+    magic, codec, payload_length, crc = RECORD_HEADER.unpack_from(raw, offset)
+
+    if magic != RECORD_MAGIC:
+        raise RecordError(f"Invalid record magic at offset {offset}")
+
+    if length is not None and length != (RECORD_HEADER.size + payload_length):
+        raise RecordError(f"Record length mismatch at offset {offset}")
+
+    start = offset + RECORD_HEADER.size
+    payload = raw[start : (start + payload_length)]
+
+    if len(payload) != payload_length:
+        raise RecordError(f"Truncated record payload at offset {offset}")
+
+    if zlib.crc32(payload) != crc:
+        raise RecordError(f"Corrupted record payload at offset {offset}")
+
+    return codec, payload
+
+
+def iter_records(raw, dictionaries=None):
+    """
+    Sequentially yields (offset, length, ping) for all records in raw,
+    stopping at the first truncated or corrupted record.
+    """
+
+    offset = 0
+
+    while offset < len(raw):
+        try:
+            ping = decode_record(raw, offset, dictionaries=dictionaries)
+        except RecordError:
+            return
+
+        _magic, _codec, payload_length, _crc = RECORD_HEADER.unpack_from(raw, offset)
+
+        length = RECORD_HEADER.size + payload_length
+
+        yield offset, length, ping
+
+        offset += length
@@ -0,0 +1,123 @@
+import os
+
+from collections import Counter
+
+from . import index_path
+from .blobs import externalise_content
+from .index import index_entry_for_ping, read_index, write_index_entry
+from .reader import scan_index_entries
+from .records import encode_record
+
+
+class ProviderDumpWriter:
+    """
+    Appends pings as framed records to a provider's records file and
+    maintains its sidecar index. Only records which have been flushed are
+    added to the index, such that the index never references data which has
+    not reached the disk. If the index has been lost, it is rebuilt from the
+    valid records when the writer is opened.
+
+    If a blob store writer is given, the contents of the pings are stored in
+    the blob store and the pings only keep their digest.
+
+    If a codec is given, e.g. a ZstdProviderCodec, it compresses the new
+    records of the provider and its new blobs instead of zlib.
+    """
+
+    def __init__(self, records_path, blobs=None, codec=None):
+        self.records_path = records_path
+        self.blobs = blobs
+        self.codec = codec
+        self.index_path = index_path(records_path)
+
+        rebuild_index = not os.path.exists(self.index_path) and os.path.exists(
+            self.records_path
+        )
+
+        # A missing index is rebuilt from the records, like read_dump_index,
+        #  instead of discarding all of them
+        if rebuild_index:
+            entries = scan_index_entries(self.records_path)
+        else:
+            entries = read_index(self.index_path)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as file:
+                content = file.read()
+
+            os.truncate(self.index_path, content.rfind(b"\n") + 1)
+
+        self.ping_numbers = Counter(entry.lui for entry in entries)
+
+        end = max((entry.offset + entry.length for entry in entries), default=0)
+
+        # Discard any unindexed data left behind by an interrupted run, as its
+        #  blobs and PROGRESS journal entries have not been flushed either
+        if os.path.exists(self.records_path):
+            os.truncate(self.records_path, min(end, os.path.getsize(records_path)))
+
+        self.records = open(self.records_path, "ab")
+        self.index = open(self.index_path, "a")
+
+        self.offset = self.records.tell()
+
+        if rebuild_index:
+            for entry in entries:
+                write_index_entry(self.index, entry)
+
+            self.index.flush()
+
+        self.unflushed_entries = []
+
+    def write(self, ping):
+        if self.blobs is not None:
+            ping = externalise_content(ping, self.blobs, self.codec)
+
+        record = encode_record(ping, self.codec)
+
+        self.write_record(record, index_entry_for_ping(ping, 0, 0, len(record)))
+
+    def write_record(self, record, entry):
+        """
+        Appends an already encoded record, e.g. copied from another dump,
+        whose index entry is renumbered to fit into this provider's dump
+        """
+
+        self.records.write(record)
+
+        self.unflushed_entries.append(
+            entry._replace(
+                ping=self.ping_numbers[entry.lui],
+                offset=self.offset,
+                length=len(record),
+            )
+        )
+
+        self.ping_numbers[entry.lui] += 1
+        self.offset += len(record)
+
+    def flush(self):
+        if len(self.unflushed_entries) == 0:
+            return
+
+        # The indexed pings must never reference blobs which are not on disk
+        if self.blobs is not None:
+            self.blobs.flush()
+
+        self.records.flush()
+        os.fsync(self.records.fileno())
+
+        for entry in self.unflushed_entries:
+            write_index_entry(self.index, entry)
+
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+        self.unflushed_entries.clear()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.records.close()
+            self.index.close()
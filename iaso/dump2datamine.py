@@ -1,127 +1,368 @@
-import gzip
+import io
 import json
-import mmap
+import multiprocessing as mp
 import os
-import pickle
-import re
+import shutil
 import signal
-import time
 
 from collections import defaultdict
+from contextlib import nullcontext
 from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import click
 
 from tqdm import tqdm
 
-PINGS_PATTERN = re.compile(r"pings_(\d+)\.gz")
+from .dump import LEGACY_PINGS_PATTERN, PINGS_PATTERN, records_path
+from .dump.reader import dump2pings
 
 
-def dump2pings(filepath, errors):
-    with open(filepath, "r+b") as raw:
-        with mmap.mmap(raw.fileno(), 0) as raw:
-            entry_points = [m.start() for m in re.finditer(b"\x1f\x8b", raw)]
+def check_dump(dump):
+    if not os.path.exists(Path(dump) / "ENVIRONMENT"):
+        raise click.UsageError(f"No ENVIRONMENT file could be found in DUMP {dump}.")
 
-            for entry_point in entry_points:
-                raw.seek(entry_point)
+    for filename in os.listdir(dump):
+        result = LEGACY_PINGS_PATTERN.fullmatch(filename)
 
-                try:
-                    with gzip.GzipFile(fileobj=raw, mode="rb") as file:
-                        yield pickle.load(file)
-                except OSError:
-                    pass
-                except Exception as err:
-                    errors[filepath].append(err)
+        if (
+            result is not None
+            and not (Path(dump) / f"pings_{result.group(1)}.rec").exists()
+        ):
+            raise click.UsageError(
+                f"DUMP {dump} contains scraping dumps in the legacy gzip format. Please convert them first using: cmd-iaso legacy2dump {dump}"
+            )
 
 
-def generate_datamine_from_dump(dump, datamine_path, analysis):
-    if not os.path.exists(Path(dump) / "ENVIRONMENT"):
-        raise click.UsageError(f"No ENVIRONMENT file could be found in DUMP {dump}.")
+def load_environment(dumps):
+    """
+    Returns the ENVIRONMENT of the first DUMP folder, which records the
+    shards of all DUMP folders if there are several of them
+    """
 
-    if analysis:
-        from .analysis import analyse_single_file
+    environments = []
 
-    with open(Path(dump) / "ENVIRONMENT", "r") as file:
-        environment = json.load(file)
+    for dump in dumps:
+        with open(Path(dump) / "ENVIRONMENT", "r") as file:
+            environments.append(json.load(file))
 
-    with open(datamine_path, "w") as file:
-        file.write('{"environment": ')
-        json.dump(environment, file)
-        file.write(', "providers": [')
+    environment = environments[0]
 
-        errors = defaultdict(list)
+    if len(environments) > 1:
+        environment["shard"] = ", ".join(
+            env.get("shard", "ALL") for env in environments
+        )
 
-        append_provider = False
+    return environment
 
-        for subdir, dirs, files in os.walk(dump):
-            subdir = Path(subdir)
-
-            outer_progress = tqdm(
-                position=0,
-                total=len(files),
-                desc=(
-                    "Combining "
-                    + ("and Analysing " if analysis else "")
-                    + "scraping dumps"
-                ),
-            )
-            inner_progress = tqdm(position=1, desc="Loading scraped resource")
 
-            analysis_interrupted = [False]
+def collect_provider_records(dumps):
+    """
+    Returns the records files of every provider across all DUMP folders in
+    the order in which the providers first appear
+    """
 
-            def signal_handler(signal, frame):
-                analysis_interrupted[0] = True
+    records = dict()
 
-                print()
-                print("Interrupting the dump2datamine command ...")
-                print("Waiting for the current task to finish ...")
-                print()
+    for dump in dumps:
+        for filename in sorted(os.listdir(dump)):
+            result = PINGS_PATTERN.fullmatch(filename)
 
-            signal.signal(signal.SIGINT, signal_handler)
+            if result is not None:
+                records.setdefault(int(result.group(1)), []).append(
+                    Path(dump) / filename
+                )
 
-            for i, filename in enumerate(files):
-                inner_progress.set_description("Loading scraped resource")
-                inner_progress.reset(total=1)
+    return records
+
+
+def merge_provider_records(tempdir, rid, records, blobs, errors):
+    from .dump.merge import merge_shard_records
+    from .dump.writer import ProviderDumpWriter
+
+    merged = records_path(tempdir, rid)
+
+    writer = ProviderDumpWriter(merged, blobs)
+
+    try:
+        for filepath in records:
+            merge_shard_records(filepath, writer, errors)
+    finally:
+        writer.close()
+
+    return merged
+
+
+def merge_dump_blobs(tempdir, dumps, errors):
+    from .dump.blobs import BlobStoreWriter, merge_blobs
+    from .dump.codecs import copy_dictionaries
+
+    blobs = BlobStoreWriter(tempdir)
+
+    for dump in dumps:
+        merge_blobs(dump, blobs, errors)
+
+        # The copied zstd records still need their providers' dictionaries
+        copy_dictionaries(dump, tempdir)
+
+    blobs.flush()
+
+    return blobs
+
+
+def convert_provider_pings(file, records, errors):
+    """
+    Writes the pings of one provider from its records files as a JSON list
+    into the file, collecting unreadable records in errors
+    """
+
+    file.write("[")
+
+    append_ping = False
+
+    for filepath in records:
+        try:
+            # The contents are dropped, so they are not read from the
+            #  blob store at all
+            for ping in dump2pings(filepath, errors=errors, resolve_content=False):
+                if append_ping:
+                    file.write(", ")
+
+                ping["empty_content"] = (
+                    ping.get("content", None) is None
+                    and ping.get("content_digest", None) is None
+                )
+
+                ping.pop("content", None)
+                ping.pop("content_digest", None)
+                ping.pop("content-type", None)
+
+                json.dump(ping, file)
+
+                append_ping = True
+        except StopIteration:
+            pass
+
+    file.write("]")
 
-                result = PINGS_PATTERN.fullmatch(filename)
 
-                if result is None:
-                    continue
+def convert_provider_fragment(task):
+    """
+    Converts the pings of one provider inside a worker process into a JSON
+    fragment file in the temporary directory and returns the fragment's path
+    together with the provider's errors
+    """
 
-                rid = int(result.group(1))
+    tempdir, rid, records = task
+
+    errors = defaultdict(list)
+
+    fragment = Path(tempdir) / f"provider_{rid}.json"
+
+    with open(fragment, "w") as file:
+        convert_provider_pings(file, records, errors)
+
+    return fragment, dict(errors)
+
+
+def init_conversion_worker():
+    # Only the main process handles interrupts, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def generate_datamine_from_dump(dumps, datamine_path, analysis, jobs=1, cache=None):
+    """
+    Generates the DATAMINE file at datamine_path from the DUMP folders and
+    returns the erroneous entries of every records file.
+
+    With several jobs, a process pool converts the pings of the providers
+    into JSON fragments in parallel, which are stitched into the DATAMINE in
+    the same provider order as with a single job. The optional analysis is
+    still run for one provider after the other.
+
+    If a cache folder is given, the converted pings and the analysis of every
+    provider are cached in it and only recomputed for providers whose
+    records files have changed.
+    """
+
+    if isinstance(dumps, (str, Path)):
+        dumps = [dumps]
+
+    for dump in dumps:
+        check_dump(dump)
+
+    if analysis:
+        from .analysis import analyse_single_file, create_common_fragments_pool
+
+    environment = load_environment(dumps)
+    provider_records = collect_provider_records(dumps)
+
+    if cache is not None:
+        from .dump.cache import DatamineCache
+
+        cache = DatamineCache(cache)
+
+    with open(datamine_path, "w") as file, TemporaryDirectory() as tempdir:
+        file.write('{"environment": ')
+        json.dump(environment, file)
+        file.write(', "providers": [')
+
+        errors = defaultdict(list)
+
+        append_provider = False
+
+        outer_progress = tqdm(
+            position=0,
+            total=len(provider_records),
+            desc=(
+                "Combining " + ("and Analysing " if analysis else "") + "scraping dumps"
+            ),
+        )
+        inner_progress = tqdm(position=1, desc="Loading scraped resource")
+
+        analysis_interrupted = [False]
+
+        def signal_handler(signal, frame):
+            analysis_interrupted[0] = True
+
+            print()
+            print("Interrupting the dump2datamine command ...")
+            print("Waiting for the current task to finish ...")
+            print()
+
+        signal.signal(signal.SIGINT, signal_handler)
+
+        temp_blobs = None
+
+        # The cache keys depend on the original records files of a provider
+        if cache is not None:
+            keys = {
+                rid: cache.provider_key(records)
+                for rid, records in provider_records.items()
+            }
+
+        def get_cached(rid, kind):
+            return cache.get(rid, keys[rid], kind) if cache is not None else None
+
+        # The analysis needs all pings of a provider in one records file,
+        #  whose content blobs are stored in the same folder
+        if analysis:
+            for rid, records in provider_records.items():
+                if len(records) > 1 and get_cached(rid, "analysis") is None:
+                    if temp_blobs is None:
+                        temp_blobs = merge_dump_blobs(tempdir, dumps, errors)
+
+                    provider_records[rid] = [
+                        merge_provider_records(
+                            tempdir, rid, records, temp_blobs, errors
+                        )
+                    ]
+
+        uncached_tasks = (
+            (tempdir, rid, records)
+            for rid, records in provider_records.items()
+            if get_cached(rid, "pings") is None
+        )
+
+        # One long-lived pool analyses the LUIs of all providers
+        with (
+            create_common_fragments_pool() if analysis else nullcontext()
+        ) as analysis_pool, (
+            mp.get_context("spawn").Pool(jobs, initializer=init_conversion_worker)
+            if jobs > 1
+            else nullcontext()
+        ) as pool:
+            if pool is not None:
+                fragments = pool.imap(convert_provider_fragment, uncached_tasks)
+            elif cache is not None:
+                fragments = map(convert_provider_fragment, uncached_tasks)
+            else:
+                fragments = None
+
+            for rid, records in provider_records.items():
+                inner_progress.set_description("Loading scraped resource")
+                inner_progress.reset(total=1)
 
                 # Combining dump
 
                 if append_provider:
                     file.write(", ")
 
-                file.write(f'{{"id": {rid}, "pings": [')
+                file.write(f'{{"id": {rid}, "pings": ')
 
-                try:
-                    append_ping = False
+                cached_pings = get_cached(rid, "pings")
 
-                    for ping in dump2pings(subdir / filename, errors=errors):
-                        if append_ping:
-                            file.write(", ")
+                if cached_pings is not None:
+                    with open(cached_pings, "r") as cached_file:
+                        shutil.copyfileobj(cached_file, file)
+                elif fragments is None:
+                    convert_provider_pings(file, records, errors)
+                else:
+                    fragment, fragment_errors = next(fragments)
 
-                        ping["empty_content"] = ping.get("content", None) is None
+                    with open(fragment, "r") as fragment_file:
+                        shutil.copyfileobj(fragment_file, file)
 
-                        ping.pop("content", None)
-                        ping.pop("content-type", None)
+                    # Only providers without errors are cached, such that
+                    #  their errors are reported on every run
+                    if cache is not None and len(fragment_errors) == 0:
+                        cache.put(rid, keys[rid], "pings", fragment)
 
-                        json.dump(ping, file)
+                    os.remove(fragment)
 
-                        append_ping = True
-                except StopIteration:
-                    pass
+                    for filepath, errs in fragment_errors.items():
+                        errors[filepath].extend(errs)
 
                 # Optional analysis
 
-                file.write('], "analysis": ')
+                file.write(', "analysis": ')
+
+                cached_analysis = get_cached(rid, "analysis") if analysis else None
+
+                if cached_analysis is not None:
+                    with open(cached_analysis, "r") as cached_file:
+                        shutil.copyfileobj(cached_file, file)
+                elif analysis and cache is not None:
+                    interrupted = analysis_interrupted[0]
+
+                    analysis_output = io.StringIO()
+                    analysis_errors = defaultdict(list)
 
-                if analysis:
                     analyse_single_file(
-                        file, subdir, outer_progress, inner_progress, filename, rid
+                        analysis_pool,
+                        analysis_output,
+                        records[0].parent,
+                        outer_progress,
+                        inner_progress,
+                        records[0].name,
+                        rid,
+                        analysis_errors,
+                    )
+
+                    file.write(analysis_output.getvalue())
+
+                    # An interrupted or failed analysis is incomplete and not
+                    #  cached
+                    if (
+                        analysis_interrupted[0] == interrupted
+                        and len(analysis_errors) == 0
+                    ):
+                        cache.put_text(
+                            rid, keys[rid], "analysis", analysis_output.getvalue()
+                        )
+
+                    for filepath, errs in analysis_errors.items():
+                        errors[filepath].extend(errs)
+                elif analysis:
+                    analyse_single_file(
+                        analysis_pool,
+                        file,
+                        records[0].parent,
+                        outer_progress,
+                        inner_progress,
+                        records[0].name,
+                        rid,
+                        errors,
                     )
                 else:
                     file.write("null")
@@ -137,11 +378,12 @@ def generate_datamine_from_dump(dump, datamine_path, analysis):
                 if analysis_interrupted[0]:
                     break
 
-                if analysis:
-                    time.sleep(1)
+        file.write("]}")
 
-            break
+        if temp_blobs is not None:
+            temp_blobs.close()
 
-        file.write("]}")
+    if cache is not None:
+        cache.save()
 
     return errors
@@ -4,19 +4,53 @@ import multiprocessing as mp
 import os
 import warnings
 
+from contextlib import nullcontext
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 os.environ["PYPPETEER_CHROMIUM_REVISION"] = "782078"
 
+from .breaker import HostCircuitBreaker
+from .coordinator import CoordinatorFeed
+from .http.certificates import collect_https_hostnames
 from .http.proxy_launcher import ProxyLauncher
 from .pool import scrape_resources_pool
+from .sink import DumpSink
+from .timeouts import AdaptiveTimeouts
 
 
 async def scrape_resources(
-    jobs, total_jobs, dump, proxy_address, chrome, workers, timeout, log
+    jobs,
+    total_jobs,
+    dump,
+    proxy_address,
+    chrome,
+    workers,
+    timeout,
+    log,
+    recycle_jobs,
+    recycle_memory,
+    flush_interval,
+    engine,
+    block,
+    host_concurrency,
+    host_gap,
+    circuit_breaker,
+    circuit_cooldown,
+    adaptive_timeout,
+    timeout_seed,
+    proxy_engine,
+    certificate_cache,
+    prewarm_certificates,
+    proxy_stream,
+    proxy_max_body_size,
+    proxy_cache_size,
+    proxy_cache_disk_size,
+    coordinator,
+    codec,
+    zstd_dictionaries,
 ):
-    if chrome is None:
+    if chrome is None and engine != "http":
         from pyppeteer.chromium_downloader import check_chromium, download_chromium
 
         # from .http.patch_pyppeteer import patch_pyppeteer
@@ -25,6 +59,20 @@ async def scrape_resources(
             # patch_pyppeteer()
             download_chromium()
 
+    if adaptive_timeout:
+        timeouts = AdaptiveTimeouts(timeout)
+
+        if timeout_seed is not None:
+            timeouts.seed_from_datamine(timeout_seed)
+    else:
+        timeouts = None
+
+    breaker = (
+        HostCircuitBreaker(circuit_breaker, circuit_cooldown)
+        if circuit_breaker is not None
+        else None
+    )
+
     ctx = mp.get_context("spawn")
 
     logging.getLogger("asyncio").setLevel(logging.CRITICAL + 1)
@@ -35,22 +83,55 @@ async def scrape_resources(
         dump = Path(dump)
         tempdir = Path(tempdir)
 
-        with ProxyLauncher(ctx, timeout / 3, proxy_address, tempdir) as (
+        # With a coordinator, the jobs are leased from it while scraping
+        with (
+            CoordinatorFeed(coordinator, jobs)
+            if coordinator is not None
+            else nullcontext()
+        ) as feed, ProxyLauncher(
+            ctx,
+            timeout / 3,
+            proxy_address,
+            tempdir,
+            proxy_engine,
+            certificate_cache,
+            collect_https_hostnames(url for rid, lui, random, url in jobs)
+            if prewarm_certificates
+            else None,
+            proxy_stream,
+            proxy_max_body_size,
+            proxy_cache_size * 1024 * 1024 if proxy_cache_size is not None else None,
+            proxy_cache_disk_size * 1024 * 1024,
+        ) as (
             proxy,
             proxy_address,
-        ):
+        ), DumpSink(
+            dump,
+            flush_interval,
+            feed.complete if feed is not None else None,
+            codec,
+            Path(zstd_dictionaries) if zstd_dictionaries is not None else None,
+        ) as sink:
             await asyncio.sleep(5)
 
             await scrape_resources_pool(
                 ctx,
-                dump,
+                sink,
                 tempdir,
-                proxy,
                 proxy_address,
                 chrome,
-                jobs,
-                total_jobs,
+                jobs if feed is None else [],
+                total_jobs if feed is None else 0,
                 workers,
                 timeout,
                 log,
+                recycle_jobs,
+                recycle_memory,
+                engine,
+                block,
+                host_concurrency,
+                host_gap,
+                timeouts,
+                breaker,
+                feed,
             )
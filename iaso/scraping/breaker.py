@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+
+from .scheduler import job_host
+
+
+def is_connection_failure(ping):
+    """
+    Returns whether the first request of a ping could not even connect to the
+    host, e.g. because its name could not be resolved or the connection was
+    refused, which the scraping proxy reports as a DNS error
+    """
+
+    return len(ping["redirects"]) > 0 and ping["redirects"][0]["dns_error"]
+
+
+class HostCircuitBreaker:
+    """
+    Stops sending jobs to hosts which have failed to connect threshold times
+    in a row. The jobs of such an open host are short-circuited for cooldown
+    seconds, after which a single probe job is let through. If the probe
+    connects, the host is closed again, otherwise it stays open for another
+    cooldown.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self.failures = dict()
+        self.opened = dict()
+        self.probes = dict()
+
+        self.short_circuited = 0
+
+    def allows(self, job, now):
+        host = job_host(job)
+
+        if host not in self.opened:
+            return True
+
+        reopen_at, _ = self.opened[host]
+
+        if now < reopen_at or host in self.probes:
+            return False
+
+        self.probes[host] = job
+
+        return True
+
+    def record(self, job, ping, now):
+        """
+        Records the outcome of a job, where ping is None if the job produced
+        no ping at all
+        """
+
+        host = job_host(job)
+
+        if self.probes.get(host) is job:
+            del self.probes[host]
+
+        if ping is None:
+            return
+
+        if is_connection_failure(ping):
+            self.failures[host] = self.failures.get(host, 0) + 1
+
+            if self.failures[host] >= self.threshold:
+                self.opened[host] = (now + self.cooldown, ping["redirects"][0])
+        else:
+            self.failures.pop(host, None)
+            self.opened.pop(host, None)
+
+    def short_circuit(self, job):
+        """
+        Creates the synthetic ping of a short-circuited job, which repeats the
+        connection failure that has opened its host
+        """
+
+        rid, lui, random, url = job
+
+        _, failure = self.opened[job_host(job)]
+
+        self.short_circuited += 1
+
+        return {
+            "lui": lui,
+            "random": random,
+            "date": str(datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)),
+            "redirects": [dict(failure, url=url, ip_port=None, response_time=None)],
+            "content": None,
+            "content-type": None,
+            "short_circuited": True,
+        }
+
+    def open_hosts(self):
+        return len(self.opened)
@@ -1,11 +1,16 @@
-import base64
+import codecs
+import mimetypes
 import os
+import re
 
+from collections import OrderedDict
 from urllib.parse import urlparse
 
 import chardet
 import puremagic
 
+from ..dump.blobs import BinaryContent
+
 
 def patch_puremagic():
     def _confidence(matches, ext=None):
@@ -31,15 +36,148 @@ def patch_puremagic():
 
 patch_puremagic()
 
+CONTENT_PREFIX_SIZE = 64 * 1024
+CONTENT_SUFFIX_SIZE = 4 * 1024
+CONTENT_MEMO_SIZE = 4096
+CONTENT_CHUNK_SIZE = 64 * 1024
 
-def get_mime_type(content, url):
-    return puremagic.from_string(
-        content, mime=True, filename=os.path.basename(urlparse(url).path)
+CHARSET_PATTERN = re.compile(r"charset\s*=\s*[\"']?([^\s;\"']+)", re.IGNORECASE)
+DIGITS_PATTERN = re.compile(r"[0-9]+")
+
+TEXT_MIME_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+}
+
+UNICODE_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+UTF8_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+def is_text_mime_type(mime_type):
+    return (
+        mime_type.startswith("text/")
+        or mime_type.endswith("+xml")
+        or mime_type.endswith("+json")
+        or mime_type in TEXT_MIME_TYPES
+    )
+
+
+def content_sample(content):
+    """
+    Returns the bounded prefix and suffix of the content which are used to
+    detect its MIME type and encoding
+    """
+
+    if len(content) <= CONTENT_PREFIX_SIZE + CONTENT_SUFFIX_SIZE:
+        return content
+
+    # The suffix should not start inside a UTF-8 character
+    suffix = content[-CONTENT_SUFFIX_SIZE:].lstrip(UTF8_CONTINUATION_BYTES)
+
+    return content[:CONTENT_PREFIX_SIZE] + suffix
+
+
+def file_sample(file):
+    """
+    Returns the same bounded sample as content_sample for the content of a
+    file, but only reads the sampled prefix and suffix from the file
+    """
+
+    size = file.seek(0, os.SEEK_END)
+
+    file.seek(0)
+
+    if size <= CONTENT_PREFIX_SIZE + CONTENT_SUFFIX_SIZE:
+        return file.read()
+
+    prefix = file.read(CONTENT_PREFIX_SIZE)
+
+    file.seek(-CONTENT_SUFFIX_SIZE, os.SEEK_END)
+
+    return prefix + file.read().lstrip(UTF8_CONTINUATION_BYTES)
+
+
+def looks_binary(sample):
+    return b"\x00" in sample and not sample.startswith(UNICODE_BOMS)
+
+
+def decodes_as(sample, encoding):
+    # The sample may end inside a multi-byte character
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+    return True
+
+
+def parse_content_type(content_type):
+    """Returns the MIME type and charset of a Content-Type header, if any"""
+
+    mime_type, _, parameters = (content_type or "").partition(";")
+
+    charset = CHARSET_PATTERN.search(parameters)
+
+    return (
+        mime_type.strip().lower() or None,
+        charset.group(1) if charset is not None else None,
     )
 
 
+def url_pattern(url):
+    """
+    Generalises a URL into the pattern of the resources of its provider by
+    dropping the last path segment and its query, except for the extension,
+    and by generalising all numbers
+    """
+
+    parsed = urlparse(url)
+
+    directory, _, filename = parsed.path.rpartition("/")
+
+    return (
+        parsed.scheme,
+        parsed.netloc,
+        DIGITS_PATTERN.sub("#", directory),
+        os.path.splitext(filename)[1].lower(),
+    )
+
+
+def content_reference(content, mime_type):
+    """
+    Returns the reference to a binary content, which is stored instead of
+    the content itself such that the pings stay small, while the content is
+    kept in the DUMP's blob store
+    """
+
+    return BinaryContent(content, mime_type)
+
+
+def get_mime_type(content, url):
+    filename = os.path.basename(urlparse(url).path)
+
+    try:
+        return puremagic.from_string(
+            content_sample(content), mime=True, filename=filename
+        )
+    except (puremagic.PureError, IndexError, ValueError):
+        # Content without any known magic number, e.g. plain text
+        return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
 def get_encoding(content):
-    return chardet.detect(content)["encoding"] or "binary"
+    sample = content_sample(content)
+
+    # Most contents are ASCII or UTF-8, which is much cheaper to check. As
+    #  only the sample is checked, ASCII is widened to its superset UTF-8.
+    if sample.isascii():
+        return "utf-8"
+
+    if not looks_binary(sample) and decodes_as(sample, "utf-8"):
+        return "utf-8"
+
+    return chardet.detect(sample)["encoding"] or "binary"
 
 
 def get_content_type(mime_type, encoding):
@@ -48,8 +186,120 @@ def get_content_type(mime_type, encoding):
 
 def decode_content(content, mime_type, encoding):
     if encoding == "binary":
-        return "data:{};base64,{}".format(
-            mime_type, base64.b64encode(content).decode("utf-8")
-        )
+        return content_reference(content, mime_type)
     else:
         return content.decode(encoding)
+
+
+class ContentDetector:
+    """
+    Detects the MIME type and encoding of downloaded contents from a bounded
+    sample. Consistent Content-Type headers are trusted, and the detected
+    types are memoised per provider URL pattern, such that similar resources
+    only need a cheap check whether the memoised encoding still applies.
+    """
+
+    def __init__(self, memo_size=CONTENT_MEMO_SIZE):
+        self.memo_size = memo_size
+
+        self.memo = OrderedDict()
+
+    def detect(self, content, url, header_content_type=None):
+        sample = content_sample(content)
+        binary = looks_binary(sample)
+
+        header_mime_type, header_charset = parse_content_type(header_content_type)
+
+        key = (url_pattern(url), header_mime_type)
+
+        memo_mime_type, memo_encoding = self.memo.get(key, (None, None))
+
+        # A MIME type is inconsistent if it declares text for binary content
+        #  or vice versa
+        if (
+            header_mime_type is not None
+            and header_mime_type != "application/octet-stream"
+            and is_text_mime_type(header_mime_type) != binary
+        ):
+            mime_type = header_mime_type
+        elif memo_mime_type is not None and is_text_mime_type(memo_mime_type) != binary:
+            mime_type = memo_mime_type
+        else:
+            mime_type = get_mime_type(sample, url)
+
+        if binary and not is_text_mime_type(mime_type):
+            encoding = "binary"
+        elif header_charset is not None and decodes_as(sample, header_charset):
+            encoding = header_charset
+        elif memo_encoding not in (None, "binary") and decodes_as(
+            sample, memo_encoding
+        ):
+            encoding = memo_encoding
+        else:
+            encoding = get_encoding(sample)
+
+        self.memo[key] = (mime_type, encoding)
+        self.memo.move_to_end(key)
+
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+
+        return mime_type, encoding
+
+    def decode(self, content, url, header_content_type=None):
+        """
+        Returns the content type and the decoded content, or the reference
+        to the content if it is binary
+        """
+
+        mime_type, encoding = self.detect(content, url, header_content_type)
+
+        try:
+            decoded = decode_content(content, mime_type, encoding)
+        except (UnicodeDecodeError, LookupError):
+            # The sample was misleading, so the entire content is checked
+            encoding = chardet.detect(content)["encoding"] or "binary"
+
+            try:
+                decoded = decode_content(content, mime_type, encoding)
+            except (UnicodeDecodeError, LookupError):
+                encoding = "binary"
+
+                decoded = decode_content(content, mime_type, encoding)
+
+        return get_content_type(mime_type, encoding), decoded
+
+    def decode_file(self, file, url, header_content_type=None):
+        """
+        Returns the content type and the decoded content of a binary file,
+        whose type is detected from a bounded sample. Text is decoded chunk
+        by chunk, such that the raw file is only read into memory as a whole
+        if it is binary or the sample was misleading.
+        """
+
+        mime_type, encoding = self.detect(file_sample(file), url, header_content_type)
+
+        file.seek(0)
+
+        if encoding != "binary":
+            decoded = []
+
+            try:
+                decoder = codecs.getincrementaldecoder(encoding)()
+
+                for chunk in iter(lambda: file.read(CONTENT_CHUNK_SIZE), b""):
+                    decoded.append(decoder.decode(chunk))
+
+                decoded.append(decoder.decode(b"", final=True))
+
+                return get_content_type(mime_type, encoding), "".join(decoded)
+            except (UnicodeDecodeError, LookupError):
+                del decoded
+
+                file.seek(0)
+
+        return self.decode(file.read(), url, header_content_type)
+
+
+# Every scraping worker process memoises the content types of its jobs
+content_detector = ContentDetector()
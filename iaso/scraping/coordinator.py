@@ -0,0 +1,574 @@
+import hashlib
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+
+from tqdm import tqdm
+
+from .jobs.resume import (
+    job_hash,
+    read_completed_jobs,
+    truncate_incomplete_progress,
+    write_completed_job,
+)
+
+COORDINATOR_POLL_INTERVAL = 5.0
+COORDINATOR_REPORT_INTERVAL = 1.0
+COORDINATOR_PATIENCE = 60.0
+COORDINATOR_REQUEST_TIMEOUT = 10.0
+COORDINATOR_MAX_ATTEMPTS = 3
+
+
+def jobs_digest(jobs):
+    """
+    Returns the digest of a JOBS list, which the coordinator and its workers
+    use to check that they refer to the jobs by the same indices
+    """
+
+    return hashlib.blake2b(
+        json.dumps([list(job) for job in jobs]).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+class JobLeases:
+    """
+    Hands out the indices of the jobs in batches which are leased to one
+    worker for lease_timeout seconds. Leases which are not renewed in time
+    are expired, and their outstanding jobs are handed out again. Jobs which
+    have failed are retried until they have been attempted max_attempts
+    times, after which they are given up and count as completed.
+    """
+
+    def __init__(self, total, lease_timeout, max_attempts=COORDINATOR_MAX_ATTEMPTS):
+        self.total = total
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+
+        self.pending = deque(range(total))
+        self.completed = bytearray(total)
+        self.num_completed = 0
+
+        self.attempts = dict()
+        self.num_failed = 0
+
+        self.leases = dict()
+        self.owners = dict()
+
+        self.lease_ids = itertools.count()
+
+    def finished(self):
+        return self.num_completed == self.total
+
+    def expire(self, now):
+        for lease_id, lease in list(self.leases.items()):
+            if lease["expires"] <= now:
+                self.release(lease_id, list(lease["jobs"]))
+
+    def lease(self, worker, size, now):
+        self.expire(now)
+
+        jobs = []
+
+        while len(self.pending) > 0 and len(jobs) < size:
+            index = self.pending.popleft()
+
+            if not self.completed[index] and index not in self.owners:
+                jobs.append(index)
+
+        if len(jobs) == 0:
+            return None, jobs
+
+        lease_id = str(next(self.lease_ids))
+
+        self.leases[lease_id] = {
+            "worker": worker,
+            "expires": now + self.lease_timeout,
+            "jobs": set(jobs),
+        }
+
+        for index in jobs:
+            self.owners[index] = lease_id
+
+        return lease_id, jobs
+
+    def renew(self, lease_ids, now):
+        renewed = []
+
+        for lease_id in lease_ids:
+            lease = self.leases.get(lease_id)
+
+            if lease is not None:
+                lease["expires"] = now + self.lease_timeout
+
+                renewed.append(lease_id)
+
+        return renewed
+
+    def disown(self, index):
+        lease_id = self.owners.pop(index, None)
+
+        if lease_id is None:
+            return
+
+        lease = self.leases[lease_id]
+        lease["jobs"].discard(index)
+
+        if len(lease["jobs"]) == 0:
+            del self.leases[lease_id]
+
+    def complete(self, jobs):
+        """Marks the jobs as completed and returns the newly completed ones"""
+
+        completed = []
+
+        # Late completions of expired leases are accepted as well
+        for index in jobs:
+            if 0 <= index < self.total and not self.completed[index]:
+                self.completed[index] = 1
+                self.num_completed += 1
+
+                completed.append(index)
+
+            self.disown(index)
+
+        return completed
+
+    def fail(self, failures):
+        """
+        Releases the failed (lease_id, index) jobs to be retried after all
+        other pending jobs, and returns the jobs which have been given up
+        """
+
+        retried = []
+        given_up = []
+
+        for lease_id, index in failures:
+            # Failures of expired leases are ignored as the job is reissued
+            if self.owners.get(index) != lease_id:
+                continue
+
+            self.disown(index)
+
+            self.attempts[index] = self.attempts.get(index, 0) + 1
+
+            if self.attempts[index] < self.max_attempts:
+                retried.append(index)
+            else:
+                given_up.append(index)
+
+        self.pending.extend(retried)
+
+        self.num_failed += len(given_up)
+
+        return self.complete(given_up)
+
+    def release(self, lease_id, jobs):
+        released = []
+
+        for index in jobs:
+            if self.owners.get(index) == lease_id:
+                self.disown(index)
+
+                released.append(index)
+
+        # Released jobs are handed out again before all others
+        self.pending.extendleft(reversed(released))
+
+    def status(self):
+        return {
+            "total": self.total,
+            "completed": self.num_completed,
+            "failed": self.num_failed,
+            "leased": len(self.owners),
+            "leases": len(self.leases),
+        }
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+        with self.server.lock:
+            status = self.server.leases.status()
+
+        self.send_json(200, status)
+
+    def do_POST(self):
+        try:
+            request = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            )
+        except ValueError:
+            return self.send_json(400, {"error": "Invalid JSON request"})
+
+        if self.path == "/lease" and request.get("digest") != self.server.digest:
+            return self.send_json(
+                409, {"error": "The worker has loaded a different JOBS file."}
+            )
+
+        leases = self.server.leases
+
+        with self.server.lock:
+            now = time.time()
+
+            if self.path == "/lease":
+                lease_id, jobs = leases.lease(request["worker"], request["size"], now)
+
+                response = {
+                    "lease": lease_id,
+                    "jobs": jobs,
+                    "finished": leases.finished(),
+                    "lease_timeout": leases.lease_timeout,
+                }
+            elif self.path == "/renew":
+                response = {"renewed": leases.renew(request["leases"], now)}
+            elif self.path == "/complete":
+                self.server.journal(leases.complete(request["jobs"]))
+
+                response = {"finished": leases.finished()}
+            elif self.path == "/fail":
+                self.server.journal(leases.fail(request["jobs"]))
+
+                response = {"finished": leases.finished()}
+            elif self.path == "/release":
+                leases.release(request["lease"], request["jobs"])
+
+                response = {}
+            else:
+                response = None
+
+        if response is None:
+            return self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+        self.send_json(200, response)
+
+
+def restore_completed_jobs(leases, jobs, progress_path):
+    """
+    Marks the jobs which are recorded in the PROGRESS journal of completed
+    job hashes as completed, respecting their multiplicity in the jobs
+    """
+
+    truncate_incomplete_progress(progress_path)
+
+    if not os.path.exists(progress_path):
+        return
+
+    completed_jobs = read_completed_jobs(progress_path)
+
+    completed = []
+
+    for index, job in enumerate(jobs):
+        hashed_job = job_hash(job)
+
+        if completed_jobs[hashed_job] > 0:
+            completed_jobs[hashed_job] -= 1
+
+            completed.append(index)
+
+    leases.complete(completed)
+
+
+def journal_completed_jobs(progress, jobs, completed):
+    if len(completed) == 0:
+        return
+
+    for index in completed:
+        write_completed_job(progress, jobs[index])
+
+    progress.flush()
+    os.fsync(progress.fileno())
+
+
+def serve_coordinator(jobs, port, lease_timeout, progress_path):
+    server = ThreadingHTTPServer(("", port), CoordinatorHandler)
+    server.daemon_threads = True
+
+    server.leases = JobLeases(len(jobs), lease_timeout)
+    server.digest = jobs_digest(jobs)
+    server.lock = threading.Lock()
+
+    # The completed jobs survive a restart of the coordinator
+    restore_completed_jobs(server.leases, jobs, progress_path)
+
+    progress_journal = open(progress_path, "a")
+
+    server.journal = lambda completed: journal_completed_jobs(
+        progress_journal, jobs, completed
+    )
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    print(f"Serving the scraping coordinator on port {port} ...")
+
+    try:
+        with tqdm(
+            initial=server.leases.status()["completed"], total=len(jobs)
+        ) as progress:
+            finished_at = None
+
+            # Keep serving for a while such that all workers learn that the
+            #  scraping has finished
+            while finished_at is None or time.time() < finished_at + lease_timeout:
+                time.sleep(1)
+
+                with server.lock:
+                    server.leases.expire(time.time())
+
+                    status = server.leases.status()
+
+                    if finished_at is None and server.leases.finished():
+                        finished_at = time.time()
+
+                progress.update(status["completed"] - progress.n)
+                progress.set_postfix(
+                    {
+                        "failed": status["failed"],
+                        "leased": status["leased"],
+                        "leases": status["leases"],
+                    }
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+        progress_journal.close()
+
+
+class CoordinatorFeed:
+    """
+    Client of a scraping coordinator which leases batches of jobs for the
+    scraping pool. Completed and failed jobs are reported and the held
+    leases renewed by a background thread. All jobs which have not been completed by the
+    time the feed is closed are released to the coordinator again.
+    """
+
+    def __init__(self, address, jobs):
+        self.address = address if "://" in address else f"http://{address}"
+        self.jobs = jobs
+        self.digest = jobs_digest(jobs)
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+        self.lock = threading.Lock()
+
+        self.held = dict()
+        self.job_ids = dict()
+        self.unreported = []
+        self.unreported_failures = []
+
+        self.finished = False
+        self.next_poll = 0.0
+        self.lease_timeout = None
+        self.last_contact = time.time()
+
+        self.closing = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.closing.set()
+        self.thread.join()
+
+        self.report()
+
+        with self.lock:
+            held = list(self.held.items())
+
+            self.held.clear()
+            self.job_ids.clear()
+
+        for lease_id, jobs in held:
+            try:
+                self.request("/release", {"lease": lease_id, "jobs": list(jobs)})
+            except OSError:
+                pass
+
+    def request(self, endpoint, content):
+        request = urllib.request.Request(
+            self.address + endpoint,
+            data=json.dumps(content).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+
+        try:
+            with self.opener.open(
+                request, timeout=COORDINATOR_REQUEST_TIMEOUT
+            ) as response:
+                response = json.load(response)
+        except urllib.error.HTTPError as err:
+            if err.code == 409:
+                raise click.UsageError(
+                    click.style(
+                        f"The scraping coordinator at {self.address} has rejected this worker: {json.load(err)['error']}",
+                        fg="red",
+                    )
+                )
+
+            raise
+
+        self.last_contact = time.time()
+
+        return response
+
+    def lease(self, size):
+        """
+        Leases up to size more jobs from the coordinator, and returns them as
+        a list which is empty if there are no jobs to be handed out right now
+        """
+
+        try:
+            response = self.request(
+                "/lease", {"worker": self.worker, "digest": self.digest, "size": size}
+            )
+        except OSError:
+            # The coordinator might only be restarting
+            self.next_poll = time.time() + COORDINATOR_POLL_INTERVAL
+            self.finished = time.time() > self.last_contact + COORDINATOR_PATIENCE
+
+            return []
+
+        self.lease_timeout = response["lease_timeout"]
+
+        if response["lease"] is None:
+            self.next_poll = time.time() + COORDINATOR_POLL_INTERVAL
+            self.finished = response["finished"]
+
+            return []
+
+        jobs = []
+
+        with self.lock:
+            held = self.held[response["lease"]] = dict()
+
+            for index in response["jobs"]:
+                # Every leased job is a distinct object, even if the JOBS
+                #  contain it multiple times
+                job = tuple(self.jobs[index])
+
+                held[index] = job
+                self.job_ids[id(job)] = (response["lease"], index)
+
+                jobs.append(job)
+
+        return jobs
+
+    def close(self):
+        """Stops leasing new jobs, e.g. because the scraping was interrupted"""
+
+        self.finished = True
+
+    def disown(self, job):
+        lease_index = self.job_ids.pop(id(job), None)
+
+        if lease_index is None:
+            return None
+
+        lease_id, index = lease_index
+
+        held = self.held[lease_id]
+        del held[index]
+
+        if len(held) == 0:
+            del self.held[lease_id]
+
+        return lease_index
+
+    def complete(self, jobs):
+        """Reports the jobs whose pings have been written to the DUMP"""
+
+        with self.lock:
+            for job in jobs:
+                lease_index = self.disown(job)
+
+                if lease_index is not None:
+                    self.unreported.append(lease_index[1])
+
+    def fail(self, jobs):
+        """
+        Reports the jobs which did not produce a ping, e.g. because they timed
+        out or their worker crashed, such that the coordinator retries them
+        """
+
+        with self.lock:
+            for job in jobs:
+                lease_index = self.disown(job)
+
+                if lease_index is not None:
+                    self.unreported_failures.append(lease_index)
+
+    def report(self):
+        with self.lock:
+            unreported, self.unreported = self.unreported, []
+            failures, self.unreported_failures = self.unreported_failures, []
+
+        if len(unreported) > 0:
+            try:
+                self.request("/complete", {"jobs": unreported})
+            except OSError:
+                with self.lock:
+                    self.unreported.extend(unreported)
+
+        if len(failures) > 0:
+            try:
+                self.request("/fail", {"jobs": failures})
+            except OSError:
+                with self.lock:
+                    self.unreported_failures.extend(failures)
+
+    def renew(self):
+        with self.lock:
+            lease_ids = list(self.held.keys())
+
+        if len(lease_ids) > 0:
+            try:
+                self.request("/renew", {"leases": lease_ids})
+            except OSError:
+                pass
+
+    def run(self):
+        last_renewal = time.time()
+
+        while not self.closing.wait(COORDINATOR_REPORT_INTERVAL):
+            self.report()
+
+            if (
+                self.lease_timeout is not None
+                and time.time() >= last_renewal + self.lease_timeout / 3
+            ):
+                self.renew()
+
+                last_renewal = time.time()
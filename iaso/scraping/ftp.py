@@ -1,23 +1,328 @@
+import asyncio
 import re
+import socket
+import tempfile
 import time
-import urllib
 
-from contextlib import closing
+from collections import defaultdict, deque
 from datetime import datetime, timezone
+from urllib.parse import unquote, urlparse
 
-from .content_type import decode_content, get_content_type, get_encoding, get_mime_type
+from .content_type import content_detector
 
-FTP_STATUS_PATTERN = re.compile(r"([1-6][0-9][0-9])")
+FTP_REPLY_PATTERN = re.compile(r"^([1-6][0-9][0-9])([ -])(.*)$")
+FTP_PASV_PATTERN = re.compile(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)")
+FTP_EPSV_PATTERN = re.compile(r"\(([^\d])\1\1(\d+)\1\)")
+FTP_PWD_PATTERN = re.compile(r'"((?:[^"]|"")*)"')
 
+FTP_MAX_SIZE = 16 * 1024 * 1024
+FTP_CHUNK_SIZE = 64 * 1024
 
-async def scrape_ftp_resource(url, timeout):
+FTP_MAX_IDLE_PER_HOST = 2
+FTP_IDLE_TIMEOUT = 60.0
+
+
+class FtpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status} {message}")
+
+        self.status = status
+
+
+class FtpControlConnection:
+    """
+    A logged-in FTP control connection, which remembers its initial working
+    directory such that it can be reused for the relative paths of any URL
+    """
+
+    def __init__(self, key, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+
+        self.home = None
+        self.reusable = True
+        self.last_used = time.monotonic()
+
+    @staticmethod
+    async def open(key, timeout):
+        host, port, user, password = key
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout
+        )
+
+        connection = FtpControlConnection(key, reader, writer)
+
+        try:
+            await connection.expect(None, (220,), timeout)
+
+            status, _ = await connection.command(f"USER {user}", timeout)
+
+            if status == 331:
+                await connection.expect(f"PASS {password}", (230, 202), timeout)
+            elif status != 230:
+                raise FtpError(status, "Login failed")
+
+            status, message = await connection.command("PWD", timeout)
+
+            match = FTP_PWD_PATTERN.search(message)
+
+            if status == 257 and match is not None:
+                connection.home = match.group(1).replace('""', '"')
+        except BaseException:
+            connection.close()
+
+            raise
+
+        return connection
+
+    def close(self):
+        self.reusable = False
+
+        self.writer.close()
+
+    async def reply(self, timeout):
+        status = None
+        lines = []
+
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), timeout)
+
+            if not line:
+                self.reusable = False
+
+                raise ConnectionResetError("The FTP control connection was closed")
+
+            line = line.decode("latin-1").rstrip("\r\n")
+
+            match = FTP_REPLY_PATTERN.match(line)
+
+            if status is None:
+                if match is None:
+                    raise FtpError(500, f"Invalid FTP reply {line!r}")
+
+                status = match.group(1)
+
+            lines.append(line if match is None else match.group(3))
+
+            # Multi-line replies end with the same status and a space
+            if match is not None and match.group(1) == status and match.group(2) == " ":
+                return int(status), "\n".join(lines)
+
+    async def command(self, line, timeout):
+        if line is not None:
+            self.writer.write(line.encode("latin-1") + b"\r\n")
+
+            await asyncio.wait_for(self.writer.drain(), timeout)
+
+        return await self.reply(timeout)
+
+    async def expect(self, line, statuses, timeout):
+        status, message = await self.command(line, timeout)
+
+        if status not in statuses:
+            raise FtpError(status, message)
+
+        return message
+
+    async def passive(self, timeout):
+        """Opens a passive data connection, preferring EPSV over PASV"""
+
+        host = self.key[0]
+
+        status, message = await self.command("EPSV", timeout)
+
+        match = FTP_EPSV_PATTERN.search(message)
+
+        if status == 229 and match is not None:
+            port = int(match.group(2))
+        else:
+            message = await self.expect("PASV", (227,), timeout)
+
+            match = FTP_PASV_PATTERN.search(message)
+
+            if match is None:
+                raise FtpError(500, f"Invalid PASV reply {message!r}")
+
+            numbers = [int(number) for number in match.groups()]
+
+            port = numbers[4] * 256 + numbers[5]
+
+        return await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+
+
+class FtpConnectionPool:
+    """
+    Keeps the idle, logged-in FTP control connections of one worker per
+    host and user, such that consecutive jobs on the same FTP server do
+    not have to connect and login again
+    """
+
+    def __init__(self, max_idle_per_host=FTP_MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+
+        self.idle = defaultdict(deque)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        for connections in self.idle.values():
+            for connection in connections:
+                connection.close()
+
+        self.idle.clear()
+
+    async def acquire(self, key, timeout):
+        connections = self.idle[key]
+
+        while len(connections) > 0:
+            connection = connections.pop()
+
+            # The server has most likely closed stale connections already
+            if time.monotonic() - connection.last_used < FTP_IDLE_TIMEOUT:
+                return connection
+
+            connection.close()
+
+        return await FtpControlConnection.open(key, timeout)
+
+    def release(self, connection):
+        connections = self.idle[connection.key]
+
+        if (
+            not connection.reusable
+            or connection.reader.at_eof()
+            or len(connections) >= self.max_idle_per_host
+        ):
+            return connection.close()
+
+        connection.last_used = time.monotonic()
+
+        connections.append(connection)
+
+
+def ftp_connection_key(url):
+    parsed = urlparse(url)
+
+    return (
+        parsed.hostname,
+        parsed.port or 21,
+        unquote(parsed.username or "anonymous"),
+        unquote(parsed.password or "anonymous@"),
+    )
+
+
+def ftp_path(url):
+    # Paths are relative to the login directory, and the ;type= attribute
+    #  is ignored as all files are transferred in binary mode
+    path = urlparse(url).path.split(";")[0]
+
+    return "/".join(unquote(part) for part in path.split("/") if len(part) > 0)
+
+
+async def transfer(connection, command, file, max_size, timeout):
+    """
+    Runs a data transfer command and streams at most max_size bytes of its
+    data into the file. Returns the FTP status of the command and the number
+    of bytes that were transferred.
+    """
+
+    data_reader, data_writer = await connection.passive(timeout)
+
+    size = 0
+
+    try:
+        status, _ = await connection.command(command, timeout)
+
+        if status not in (125, 150):
+            return status, size
+
+        while size < max_size:
+            chunk = await asyncio.wait_for(
+                data_reader.read(min(FTP_CHUNK_SIZE, max_size - size)), timeout
+            )
+
+            if not chunk:
+                break
+
+            file.write(chunk)
+            size += len(chunk)
+    finally:
+        data_writer.close()
+
+    # The remaining data is discarded together with the connection, as
+    #  servers differ in how they acknowledge an aborted transfer
+    if size >= max_size:
+        connection.close()
+
+        return 226, size
+
+    status, message = await connection.reply(timeout)
+
+    if status not in (226, 250):
+        raise FtpError(status, message)
+
+    return status, size
+
+
+async def retrieve(connection, path, file, max_size, timeout):
+    await connection.expect("TYPE I", (200,), timeout)
+
+    if len(path) > 0:
+        status, size = await transfer(
+            connection, f"RETR {path}", file, max_size, timeout
+        )
+
+        if status in (226, 250):
+            return size
+
+        if status != 550:
+            raise FtpError(status, f"RETR {path} failed")
+
+        # The path might be a directory, whose listing is scraped instead
+        status, message = await connection.command(f"CWD {path}", timeout)
+
+        if status != 250:
+            raise FtpError(550, message)
+
+    try:
+        status, size = await transfer(connection, "LIST", file, max_size, timeout)
+
+        if status not in (226, 250):
+            raise FtpError(status, "LIST failed")
+    finally:
+        if len(path) > 0 and connection.reusable:
+            if connection.home is None:
+                connection.reusable = False
+            else:
+                await connection.expect(f"CWD {connection.home}", (250,), timeout)
+
+    return size
+
+
+async def scrape_ftp_resource(pool, tempdir, url, timeout, max_size=FTP_MAX_SIZE):
     request_date = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
 
     request_time = time.perf_counter()
 
+    connection = None
+
     try:
-        with closing(urllib.request.urlopen(url, timeout=timeout)) as r:
-            content = r.read()
+        connection = await pool.acquire(ftp_connection_key(url), timeout)
+
+        with tempfile.TemporaryFile(dir=tempdir) as file:
+            try:
+                size = await retrieve(
+                    connection, ftp_path(url), file, max_size, timeout
+                )
+            except (OSError, asyncio.TimeoutError, asyncio.CancelledError):
+                connection.close()
+
+                raise
+            finally:
+                pool.release(connection)
 
             response_time = time.perf_counter() - request_time
 
@@ -26,23 +331,26 @@ async def scrape_ftp_resource(url, timeout):
                     "url": url,
                     "ip_port": None,
                     "response_time": int(round(response_time, 3) * 1000),
-                    "status": r.getcode() or 200,
+                    "status": 200,
                     "dns_error": False,
                     "ssl_error": False,
                     "invalid_response": False,
                 }
             ]
 
-            mime_type = get_mime_type(content, url)
-            encoding = get_encoding(content)
+            # Downloads are cut off at max_size, like the proxy's bodies
+            if size >= max_size:
+                redirects[0]["truncated_response"] = True
 
-            content_type = get_content_type(mime_type, encoding)
-            content = decode_content(content, mime_type, encoding)
+            # Only a bounded sample of the file is inspected to detect its type
+            content_type, content = content_detector.decode_file(file, url)
     except Exception as err:
-        match = FTP_STATUS_PATTERN.search(repr(err))
-
-        status = None if match is None else int(match.group(1))
-        status = 408 if status == 115 else status  # FTP timeout
+        if isinstance(err, FtpError):
+            status = err.status
+        elif isinstance(err, asyncio.TimeoutError):
+            status = 408
+        else:
+            status = None
 
         redirects = [
             {
@@ -50,7 +358,11 @@ async def scrape_ftp_resource(url, timeout):
                 "ip_port": None,
                 "response_time": None,
                 "status": status,
-                "dns_error": status == 434,
+                "dns_error": status == 434
+                or (
+                    connection is None
+                    and isinstance(err, (socket.gaierror, ConnectionRefusedError))
+                ),
                 "ssl_error": False,
                 "invalid_response": True,
             }
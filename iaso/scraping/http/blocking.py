@@ -0,0 +1,139 @@
+import asyncio
+
+from urllib.parse import urlparse
+
+import pyppeteer
+
+BLOCKABLE_RESOURCE_TYPES = {
+    "image": "Image",
+    "media": "Media",
+    "font": "Font",
+    "stylesheet": "Stylesheet",
+}
+
+# Analytics and advertising hosts which never contribute to the content
+TRACKER_HOSTS = (
+    "addthis.com",
+    "adnxs.com",
+    "amplitude.com",
+    "clarity.ms",
+    "criteo.com",
+    "crazyegg.com",
+    "doubleclick.net",
+    "facebook.net",
+    "google-analytics.com",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "hotjar.com",
+    "matomo.cloud",
+    "mc.yandex.ru",
+    "mixpanel.com",
+    "nr-data.net",
+    "outbrain.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+    "segment.io",
+    "sharethis.com",
+    "statcounter.com",
+    "taboola.com",
+)
+
+
+class BlockingProfile:
+    """
+    Describes which sub-resource requests of a page the browser aborts, i.e.
+    requests of the blocked resource types and requests to the blocked hosts
+    (and their subdomains). The main-frame navigations are never blocked.
+    """
+
+    def __init__(self, resource_types=(), hosts=()):
+        self.resource_types = frozenset(resource_types)
+        self.hosts = frozenset(host.lower().strip(".") for host in hosts)
+
+    def blocks_host(self, hostname):
+        labels = (hostname or "").lower().strip(".").split(".")
+
+        return any(".".join(labels[i:]) in self.hosts for i in range(len(labels)))
+
+    def blocks(self, resource_type, url):
+        return resource_type in self.resource_types or self.blocks_host(
+            urlparse(url).hostname
+        )
+
+    def patterns(self):
+        patterns = [
+            {"urlPattern": "*", "resourceType": resource_type}
+            for resource_type in sorted(self.resource_types)
+        ]
+
+        # Only requests which might go to a blocked host need to be paused
+        for host in sorted(self.hosts):
+            patterns.append({"urlPattern": f"*://{host}*"})
+            patterns.append({"urlPattern": f"*://*.{host}*"})
+
+        return patterns
+
+
+def load_blocked_hosts(filepath):
+    with open(filepath, "r") as file:
+        return [
+            line.strip()
+            for line in file
+            if len(line.strip()) > 0 and not line.strip().startswith("#")
+        ]
+
+
+def create_blocking_profile(block, block_hosts):
+    """
+    Creates the BlockingProfile for the --block choices and the --block-hosts
+    file of the scrape command, or None if nothing should be blocked
+    """
+
+    resource_types = [
+        BLOCKABLE_RESOURCE_TYPES[choice]
+        for choice in block
+        if choice in BLOCKABLE_RESOURCE_TYPES
+    ]
+
+    hosts = list(TRACKER_HOSTS) if "trackers" in block else []
+
+    if block_hosts is not None:
+        hosts.extend(load_blocked_hosts(block_hosts))
+
+    if len(resource_types) == 0 and len(hosts) == 0:
+        return None
+
+    return BlockingProfile(resource_types, hosts)
+
+
+async def setup_request_blocking(page, profile):
+    async def onRequestPaused(event):
+        # The main-frame redirection chain must stay untouched
+        main_frame_navigation = (
+            event.get("resourceType") == "Document"
+            and event.get("frameId") == page.mainFrame._id
+        )
+
+        try:
+            if not main_frame_navigation and profile.blocks(
+                event.get("resourceType"), event["request"]["url"]
+            ):
+                await page._client.send(
+                    "Fetch.failRequest",
+                    {"requestId": event["requestId"], "errorReason": "BlockedByClient"},
+                )
+            else:
+                await page._client.send(
+                    "Fetch.continueRequest", {"requestId": event["requestId"]}
+                )
+        except pyppeteer.errors.NetworkError:
+            # The page has already been closed
+            pass
+
+    page._client.on(
+        "Fetch.requestPaused",
+        lambda event: asyncio.ensure_future(onRequestPaused(event)),
+    )
+
+    await page._client.send("Fetch.enable", {"patterns": profile.patterns()})
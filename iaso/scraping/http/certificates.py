@@ -0,0 +1,204 @@
+import datetime
+import ipaddress
+import os
+import ssl
+import threading
+
+from collections import OrderedDict
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+CERTIFICATE_VALIDITY = datetime.timedelta(days=3650)
+MAX_CACHED_CONTEXTS = 1024
+
+
+def certificate_hostname(hostname):
+    hostname = hostname.strip("[]")
+
+    # In the (very infrequent) case that the hostname is longer than
+    # 64 characters, truncate it with a wildcard
+    if len(hostname) > 64:
+        hostname = f"*{hostname[-63:]}"
+
+    return hostname
+
+
+def collect_https_hostnames(urls):
+    hostnames = set()
+
+    for url in urls:
+        parsed = urlparse(url)
+
+        if parsed.scheme == "https" and parsed.hostname is not None:
+            hostnames.add(parsed.hostname)
+
+    return sorted(hostnames)
+
+
+def write_atomically(path, data):
+    with NamedTemporaryFile(dir=Path(path).parent, delete=False) as file:
+        file.write(data)
+
+    os.replace(file.name, path)
+
+
+def load_or_generate_key(path):
+    if path.exists():
+        with open(path, "rb") as file:
+            return serialization.load_pem_private_key(
+                file.read(), password=None, backend=default_backend()
+            )
+
+    key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048, backend=default_backend()
+    )
+
+    write_atomically(
+        path,
+        key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption(),
+        ),
+    )
+
+    return key
+
+
+class CertificateAuthority:
+    """
+    Mints the certificates with which the proxy intercepts HTTPS connections.
+    All leaf certificates share one reusable key and are stored by hostname
+    inside the certdir, which also holds the CA so that it can be used as a
+    persistent on-disk cache across runs. The server-side SSLContexts are
+    kept in an in-memory LRU cache.
+    """
+
+    def __init__(self, certdir):
+        self.certdir = Path(certdir)
+        self.certdir.mkdir(parents=True, exist_ok=True)
+
+        self.cakey = load_or_generate_key(self.certdir / "ca.key")
+        self.certkey = load_or_generate_key(self.certdir / "cert.key")
+
+        self.cacert = self.load_or_generate_ca_certificate(self.certdir / "ca.crt")
+
+        self.lock = threading.Lock()
+        self.hostname_locks = dict()
+
+        self.contexts = OrderedDict()
+
+    def load_or_generate_ca_certificate(self, path):
+        if path.exists():
+            with open(path, "rb") as file:
+                return x509.load_pem_x509_certificate(file.read(), default_backend())
+
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "proxy3 CA")])
+
+        now = datetime.datetime.utcnow()
+
+        cacert = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.cakey.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + CERTIFICATE_VALIDITY)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+            .sign(self.cakey, hashes.SHA256(), default_backend())
+        )
+
+        write_atomically(path, cacert.public_bytes(serialization.Encoding.PEM))
+
+        return cacert
+
+    def mint_certificate(self, hostname):
+        now = datetime.datetime.utcnow()
+
+        try:
+            alternative_name = x509.IPAddress(ipaddress.ip_address(hostname))
+        except ValueError:
+            alternative_name = x509.DNSName(hostname)
+
+        return (
+            x509.CertificateBuilder()
+            .subject_name(
+                x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+            )
+            .issuer_name(self.cacert.subject)
+            .public_key(self.certkey.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + CERTIFICATE_VALIDITY)
+            .add_extension(
+                x509.SubjectAlternativeName([alternative_name]), critical=False
+            )
+            .sign(self.cakey, hashes.SHA256(), default_backend())
+        )
+
+    def cached_context(self, hostname):
+        hostname = certificate_hostname(hostname)
+
+        with self.lock:
+            context = self.contexts.get(hostname)
+
+            if context is not None:
+                self.contexts.move_to_end(hostname)
+
+            return context
+
+    def certificate(self, hostname):
+        hostname = certificate_hostname(hostname)
+
+        certpath = self.certdir / f"{hostname}.crt"
+
+        if certpath.exists():
+            return certpath
+
+        with self.lock:
+            hostname_lock = self.hostname_locks.setdefault(hostname, threading.Lock())
+
+        # Only connections to the same hostname wait for each other
+        with hostname_lock:
+            if not certpath.exists():
+                write_atomically(
+                    certpath,
+                    self.mint_certificate(hostname).public_bytes(
+                        serialization.Encoding.PEM
+                    ),
+                )
+
+        return certpath
+
+    def context(self, hostname):
+        hostname = certificate_hostname(hostname)
+
+        context = self.cached_context(hostname)
+
+        if context is not None:
+            return context
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS)  # ssl.PROTOCOL_TLSv1_2
+        context.load_cert_chain(
+            self.certificate(hostname), keyfile=self.certdir / "cert.key"
+        )
+
+        with self.lock:
+            self.contexts[hostname] = context
+
+            if len(self.contexts) > MAX_CACHED_CONTEXTS:
+                self.contexts.popitem(last=False)
+
+        return context
+
+    def prewarm(self, hostnames):
+        for hostname in hostnames:
+            self.certificate(hostname)
@@ -0,0 +1,175 @@
+import base64
+import binascii
+import re
+
+HEADER_END_PATTERN = re.compile(r"\r?\n\r?\n")
+HEADER_FOLD_PATTERN = re.compile(r"\r?\n[ \t]+")
+BOUNDARY_PATTERN = re.compile(r"boundary\s*=\s*\"?([^\";\r\n]+)\"?", re.IGNORECASE)
+CHARSET_PATTERN = re.compile(r"charset\s*=\s*\"?([^\";\s]+)\"?", re.IGNORECASE)
+CID_LINK_PATTERN = re.compile(r'(?:src|href)="cid:([^"]+)"')
+
+MAX_FRAME_DEPTH = 32
+
+
+class MHTMLPart:
+    """
+    A lazily decoded part of an MHTML snapshot, which only stores the span of
+    its body inside the snapshot
+    """
+
+    __slots__ = ("snapshot", "headers", "start", "end")
+
+    def __init__(self, snapshot, headers, start, end):
+        self.snapshot = snapshot
+        self.headers = headers
+        self.start = start
+        self.end = end
+
+    def decode(self):
+        body = self.snapshot[self.start : self.end]
+
+        encoding = self.headers.get("content-transfer-encoding", "").lower()
+
+        if encoding == "quoted-printable":
+            body = binascii.a2b_qp(body.encode("utf-8", "ignore"))
+        elif encoding == "base64":
+            body = base64.b64decode(body)
+        else:
+            return body
+
+        charset = CHARSET_PATTERN.search(self.headers.get("content-type", ""))
+
+        try:
+            return body.decode(
+                charset.group(1) if charset is not None else "utf-8", "ignore"
+            )
+        except LookupError:
+            return body.decode("utf-8", "ignore")
+
+
+def parse_headers(block):
+    headers = dict()
+
+    for line in HEADER_FOLD_PATTERN.sub(" ", block).splitlines():
+        name, _, value = line.partition(":")
+
+        if len(value) > 0:
+            headers.setdefault(name.strip().lower(), value.strip())
+
+    return headers
+
+
+def split_headers(snapshot, start, end):
+    match = HEADER_END_PATTERN.search(snapshot, start, end)
+
+    if match is None:
+        return (parse_headers(snapshot[start:end]), end)
+
+    return (parse_headers(snapshot[start : match.start()]), match.end())
+
+
+def iter_mhtml_parts(snapshot):
+    """
+    Splits an MHTML snapshot into its parts without copying their bodies.
+    Returns the snapshot's headers and a generator over its MHTMLParts.
+    """
+
+    headers, position = split_headers(snapshot, 0, len(snapshot))
+
+    boundary = BOUNDARY_PATTERN.search(headers.get("content-type", ""))
+
+    def parts():
+        if boundary is None:
+            return
+
+        delimiter = "--" + boundary.group(1)
+
+        start = snapshot.find(delimiter, position)
+
+        while start != -1:
+            start += len(delimiter)
+
+            # The closing delimiter is followed by two dashes
+            if snapshot.startswith("--", start):
+                return
+
+            start = snapshot.find("\n", start)
+
+            if start == -1:
+                return
+
+            start += 1
+
+            end = snapshot.find("\n" + delimiter, start)
+
+            body_end = len(snapshot) if end == -1 else end
+
+            if body_end > start and snapshot[body_end - 1] == "\r":
+                body_end -= 1
+
+            part_headers, body_start = split_headers(snapshot, start, body_end)
+
+            yield MHTMLPart(snapshot, part_headers, body_start, body_end)
+
+            start = end if end == -1 else end + 1
+
+    return (headers, parts())
+
+
+def substitute_frames(content, contents, depth=0):
+    # Splice the content of the part with the linked cid directly after the
+    #  start tag which links to it
+    pieces = []
+    position = 0
+
+    for match in CID_LINK_PATTERN.finditer(content):
+        if match.start() < position:
+            continue
+
+        inner_part = contents.get(f"<{match.group(1)}>")
+
+        if inner_part is None or depth >= MAX_FRAME_DEPTH:
+            continue
+
+        tag_end = content.find(">", match.end())
+
+        if tag_end == -1:
+            break
+
+        pieces.append(content[position : tag_end + 1])
+        pieces.append(substitute_frames(inner_part.decode(), contents, depth + 1))
+
+        position = tag_end + 1
+
+    if position == 0:
+        return content
+
+    pieces.append(content[position:])
+
+    return "".join(pieces)
+
+
+def extract_html_content(snapshot):
+    """
+    Extracts the HTML content of the root document of an MHTML snapshot,
+    with the contents of its frames spliced into their frame tags
+    """
+
+    headers, parts = iter_mhtml_parts(snapshot)
+
+    location = headers.get("snapshot-content-location")
+
+    root = None
+    contents = dict()
+
+    for part in parts:
+        if "content-id" in part.headers:
+            contents[part.headers["content-id"]] = part
+
+        if root is None and part.headers.get("content-location") == location:
+            root = part
+
+    if root is None:
+        raise ValueError("The MHTML snapshot does not contain its root document")
+
+    return substitute_frames(root.decode(), contents)
@@ -6,8 +6,10 @@ from tempfile import TemporaryDirectory
 
 import pyppeteer
 
-from ..content_type import decode_content, get_content_type, get_encoding, get_mime_type
+from ..content_type import content_detector, get_content_type, get_mime_type
 from .html import fetch_html_content
+from .redirects import is_proxy_error
+from .settle import setup_settle_monitoring
 from .url import normaliseURL
 
 
@@ -42,6 +44,8 @@ async def navigate_http_resource(
             },
         )
 
+        settle_monitor = await setup_settle_monitoring(page)
+
         start_time = time.time()
 
         request_date = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
@@ -52,22 +56,9 @@ async def navigate_http_resource(
                 url, timeout=(timeout * 1000), waitUntil=["domcontentloaded"]
             )
 
-            old_html = None
-            new_html = await fetch_html_content(page)
-
-            early_stop = 0
-
-            while early_stop < 10 and (time.time() - start_time) < timeout:
-                old_html = new_html
-
-                await page.waitFor(500)
-
-                new_html = await fetch_html_content(page)
-
-                if len(new_html) == len(old_html):
-                    early_stop += 1
-                else:
-                    early_stop = 0
+            # Wait until the page's DOM and network activity have settled,
+            #  the HTML content is then only snapshotted once at the end
+            await settle_monitor.wait(start_time + timeout)
 
             response = True
         except pyppeteer.errors.PageError as err:
@@ -89,22 +80,17 @@ async def navigate_http_resource(
 
                         _url, response = responses.popitem(last=True)
 
-                        mime_type = get_mime_type(content, response.url)
-                        encoding = get_encoding(content)
-
-                        content_type = get_content_type(mime_type, encoding)
-                        content = decode_content(content, mime_type, encoding)
+                        content_type, content = content_detector.decode(
+                            content,
+                            response.url,
+                            response.headers.get("content-type"),
+                        )
 
                         failures.pop(normaliseURL(response.url), None)
                 else:
                     _url, _response = responses.popitem(last=True)
 
-                    if (
-                        _response.headers.get("x-ssl-error", False)
-                        or _response.headers.get("x-invalid-response", False)
-                        or _response.headers.get("x-dns-error", False)
-                        or _response.headers.get("x-request-timeout", False)
-                    ):
+                    if is_proxy_error(_response.headers):
                         # The scraping proxy has responded with a destructive error message
                         response = _response
                         content = None
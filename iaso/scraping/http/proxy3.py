@@ -34,7 +34,6 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import ipaddress
 import logging
-import os
 import select
 import signal
 import socket
@@ -44,13 +43,14 @@ import time
 import urllib.parse
 
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from pathlib import Path
-from subprocess import PIPE, Popen
-from tempfile import NamedTemporaryFile, TemporaryDirectory
+from tempfile import TemporaryDirectory
 
 import click
 import urllib3
 
+from .certificates import CertificateAuthority
+from .proxy_cache import ResourceCache, is_cacheable_request, lower_headers
+
 urllib3.disable_warnings(category=urllib3.exceptions.InsecureRequestWarning)
 
 urllib3.util.ssl_.DEFAULT_CIPHERS = "ALL:!aNULL:!eNULL"  #'ALL'
@@ -70,6 +70,86 @@ def new_wrap_socket(self, *args, **kwargs):
 ssl.SSLContext.wrap_socket = new_wrap_socket
 
 
+# http://tools.ietf.org/html/rfc2616#section-13.5.1
+HOP_BY_HOP_HEADERS = (
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+)
+
+SUPPORTED_ENCODINGS = ("identity", "gzip", "x-gzip", "deflate")
+
+BODY_CHUNK_SIZE = 1024 * 64  # 64kB
+NO_BODY_STATUSES = (204, 304)
+
+# Diagnostics which are only known after a streamed body has been forwarded
+STREAMED_TRAILERS = "X-Invalid-Response, X-Truncated-Response"
+
+
+def filter_accept_encoding(accept_encoding):
+    return ", ".join(
+        x.strip()
+        for x in accept_encoding.split(",")
+        if x.strip() in SUPPORTED_ENCODINGS
+    )
+
+
+def has_response_body(method, status):
+    return (
+        method != "HEAD"
+        and status not in NO_BODY_STATUSES
+        and not (100 <= status < 200)
+    )
+
+
+def exceeds_body_size(content_length, max_body_size):
+    try:
+        return max_body_size is not None and int(content_length) > max_body_size
+    except (TypeError, ValueError):
+        return False
+
+
+def encode_chunk(chunk):
+    return b"%x\r\n%s\r\n" % (len(chunk), chunk)
+
+
+def encode_last_chunk(trailers):
+    return (
+        b"0\r\n"
+        + b"".join(f"{key}: {value}\r\n".encode("ascii") for key, value in trailers)
+        + b"\r\n"
+    )
+
+
+class BodyLimit:
+    """
+    Truncates the chunks of a forwarded response body once their total size
+    exceeds the max_body_size (if it is not None)
+    """
+
+    def __init__(self, max_body_size):
+        self.remaining = max_body_size
+        self.truncated = False
+
+    def truncate(self, chunk):
+        if self.remaining is None:
+            return chunk
+
+        if len(chunk) > self.remaining:
+            chunk = chunk[: self.remaining]
+
+            self.truncated = True
+
+        self.remaining -= len(chunk)
+
+        return chunk
+
+
 class ProxyRequestHandler(BaseHTTPRequestHandler):
     lock = threading.Lock()
 
@@ -122,59 +202,11 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
         self.connect_intercept()
 
     def connect_intercept(self):
-        hostname = self.path.split(":")[0]
-
-        # In the (very infrequent) case that the hostname is longer than
-        # 64 characters, truncate it with a wildcard
-        if len(hostname) > 64:
-            hostname = f"*{hostname[-63:]}"
-
-        certpath = f"{Path(self.certdir) / hostname}.crt"
-
-        with self.lock:
-            if not os.path.isfile(certpath):
-                epoch = "%d" % (time.time() * 1000)
-
-                p1 = Popen(
-                    [
-                        "openssl",
-                        "req",
-                        "-new",
-                        "-key",
-                        self.certkey,
-                        "-subj",
-                        "/CN=%s" % hostname,
-                    ],
-                    stdout=PIPE,
-                )
-                p2 = Popen(
-                    [
-                        "openssl",
-                        "x509",
-                        "-req",
-                        "-days",
-                        "3650",
-                        "-CA",
-                        self.cacert,
-                        "-CAkey",
-                        self.cakey,
-                        "-set_serial",
-                        epoch,
-                        "-out",
-                        certpath,
-                    ],
-                    stdin=p1.stdout,
-                    stderr=PIPE,
-                )
-
-                p2.communicate()
+        context = self.certificates.context(self.path.rpartition(":")[0])
 
         self.send_response(200, "Connection Established")
         self.end_headers()
 
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS)  # ssl.PROTOCOL_TLSv1_2
-        context.load_cert_chain(certpath, keyfile=self.certkey)
-
         self.connection = context.wrap_socket(
             self.connection, server_side=True, do_handshake_on_connect=False
         )
@@ -223,6 +255,19 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
 
         setattr(req, "headers", self.filter_headers(req.headers))
 
+        cache_request_headers = None
+
+        if self.cache is not None:
+            request_headers = lower_headers(req.headers.items())
+
+            if is_cacheable_request(req.command, request_headers):
+                cache_request_headers = request_headers
+
+                cached = self.cache.lookup(req.path, request_headers)
+
+                if cached is not None:
+                    return self.send_cached_response(cached)
+
         try:
             try:
                 request_time = time.perf_counter()
@@ -282,25 +327,35 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
             except Exception as err:
                 self.log_error(1, repr(err))
 
-            res.release_conn()
-
             version_table = {10: "HTTP/1.0", 11: "HTTP/1.1"}
             setattr(res, "response_version", version_table[res.version])
 
-            res_body = []
+            if not self.stream:
+                res_body = []
 
-            try:
-                while True:
-                    chunk = res.read(32, decode_content=False)
+                limit = BodyLimit(self.max_body_size)
+                invalid = False
+
+                try:
+                    for chunk in res.stream(BODY_CHUNK_SIZE, decode_content=False):
+                        res_body.append(limit.truncate(chunk))
+
+                        if limit.truncated:
+                            self.send_header("X-Truncated-Response", True)
+
+                            break
+                except urllib3.exceptions.ProtocolError as err:
+                    self.send_header("X-Invalid-Response", True)
 
-                    if not chunk:
-                        break
+                    invalid = True
 
-                    res_body.append(chunk)
-            except urllib3.exceptions.ProtocolError as err:
-                self.send_header("X-Invalid-Response", True)
+                # Only completely read upstream connections can be reused
+                if limit.truncated or invalid:
+                    res.close()
+                else:
+                    res.release_conn()
 
-            res_body = b"".join(res_body)
+                res_body = b"".join(res_body)
         except urllib3.exceptions.ConnectTimeoutError:
             # Egregious DNS error such that we could not even connect to the resource
             self.wfile.write(
@@ -358,10 +413,26 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
 
             return self.end_headers()
 
+        if cache_request_headers is not None:
+            self.send_header("X-Cache", "MISS")
+
+        if self.stream:
+            return self.stream_response(res, cache_request_headers)
+
         res.headers["Content-Length"] = str(len(res_body))
 
         setattr(res, "headers", self.filter_headers(res.headers))
 
+        if cache_request_headers is not None and not (limit.truncated or invalid):
+            self.cache.store(
+                req.path,
+                cache_request_headers,
+                res.status,
+                res.reason,
+                list(res.headers.items()),
+                res_body,
+            )
+
         self.wfile.write(
             ("%s %d %s\r\n" % (self.protocol_version, res.status, res.reason)).encode(
                 "ascii"
@@ -377,6 +448,120 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
 
         self.wfile.flush()
 
+    def stream_response(self, res, cache_request_headers=None):
+        setattr(res, "headers", self.filter_headers(res.headers))
+
+        has_body = has_response_body(self.command, res.status)
+        chunked = self.request_version == "HTTP/1.1"
+
+        limit = BodyLimit(self.max_body_size)
+
+        # The streamed body is only kept if it can fit into the cache
+        cache_body = [] if cache_request_headers is not None else None
+        cache_body_size = 0
+
+        if has_body:
+            content_length = res.headers.pop("Content-Length", None)
+
+            if exceeds_body_size(content_length, self.max_body_size):
+                self.send_header("X-Truncated-Response", True)
+
+        response_headers = list(res.headers.items())
+
+        if has_body:
+            if chunked:
+                res.headers["Transfer-Encoding"] = "chunked"
+                res.headers["Trailer"] = STREAMED_TRAILERS
+            else:
+                # HTTP/1.0 clients only support bodies delimited by closing
+                res.headers["Connection"] = "close"
+
+                self.close_connection = 1
+
+        self.wfile.write(
+            ("%s %d %s\r\n" % (self.protocol_version, res.status, res.reason)).encode(
+                "ascii"
+            )
+        )
+
+        for key, value in res.headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        if not has_body:
+            res.release_conn()
+
+            return self.wfile.flush()
+
+        self.wfile.flush()
+
+        trailers = []
+
+        try:
+            for chunk in res.stream(BODY_CHUNK_SIZE, decode_content=False):
+                chunk = limit.truncate(chunk)
+
+                if len(chunk) > 0:
+                    self.wfile.write(encode_chunk(chunk) if chunked else chunk)
+
+                if cache_body is not None:
+                    cache_body.append(chunk)
+                    cache_body_size += len(chunk)
+
+                    if cache_body_size > self.cache.max_entry_size:
+                        cache_body = None
+
+                if limit.truncated:
+                    trailers.append(("X-Truncated-Response", True))
+
+                    break
+        except (
+            urllib3.exceptions.ProtocolError,
+            urllib3.exceptions.ReadTimeoutError,
+        ) as err:
+            self.log_error(repr(err))
+
+            trailers.append(("X-Invalid-Response", True))
+
+        # Only completely read upstream connections can be reused
+        if len(trailers) > 0:
+            res.close()
+        else:
+            res.release_conn()
+
+        if chunked:
+            self.wfile.write(encode_last_chunk(trailers))
+
+        self.wfile.flush()
+
+        if cache_body is not None and len(trailers) == 0:
+            self.cache.store(
+                self.path,
+                cache_request_headers,
+                res.status,
+                res.reason,
+                response_headers,
+                b"".join(cache_body),
+            )
+
+    def send_cached_response(self, cached):
+        self.wfile.write(
+            (
+                "%s %d %s\r\n" % (self.protocol_version, cached.status, cached.reason)
+            ).encode("ascii")
+        )
+
+        for key, value in cached.headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", len(cached.body))
+        self.send_header("X-Cache", "HIT")
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(cached.body)
+
+        self.wfile.flush()
+
     do_HEAD = do_GET
     do_POST = do_GET
     do_PUT = do_GET
@@ -384,35 +569,18 @@ class ProxyRequestHandler(BaseHTTPRequestHandler):
     do_OPTIONS = do_GET
 
     def filter_headers(self, headers):
-        # http://tools.ietf.org/html/rfc2616#section-13.5.1
-        hop_by_hop = (
-            "connection",
-            "keep-alive",
-            "proxy-authenticate",
-            "proxy-authorization",
-            "te",
-            "trailers",
-            "transfer-encoding",
-            "upgrade",
-        )
-
-        for k in hop_by_hop:
+        for k in HOP_BY_HOP_HEADERS:
             if k in headers:
                 del headers[k]
 
         # accept only supported encodings
         if "Accept-Encoding" in headers:
-            ae = headers["Accept-Encoding"]
-            filtered_encodings = [
-                x.strip()
-                for x in ae.split(",")
-                if x.strip() in ("identity", "gzip", "x-gzip", "deflate")
-            ]
+            filtered_encodings = filter_accept_encoding(headers["Accept-Encoding"])
 
             if isinstance(headers, urllib3.connection.HTTPHeaderDict):
-                headers["Accept-Encoding"] = ", ".join(filtered_encodings)
+                headers["Accept-Encoding"] = filtered_encodings
             else:
-                headers.replace_header("Accept-Encoding", ", ".join(filtered_encodings))
+                headers.replace_header("Accept-Encoding", filtered_encodings)
 
         return headers
 
@@ -425,53 +593,45 @@ def serve(
     ignore_sigint=False,
     tempdir=None,
     log=None,
+    engine="threading",
+    certificate_cache=None,
+    prewarm=None,
+    stream=False,
+    max_body_size=None,
+    cache_size=None,
+    cache_disk_size=0,
 ):
     if ignore_sigint:
         signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-    with NamedTemporaryFile(dir=tempdir) as cakey, NamedTemporaryFile(
+    with TemporaryDirectory(dir=tempdir) as certdir, TemporaryDirectory(
         dir=tempdir
-    ) as cacert, NamedTemporaryFile(dir=tempdir) as certkey, TemporaryDirectory(
-        dir=tempdir
-    ) as certdir:
-        devnull = open(os.devnull, "w")
-
-        Popen(
-            ["openssl", "genrsa", "-out", cakey.name, "2048"],
-            stdout=devnull,
-            stderr=devnull,
-        ).wait()
-        Popen(
-            [
-                "openssl",
-                "req",
-                "-new",
-                "-x509",
-                "-days",
-                "3650",
-                "-key",
-                cakey.name,
-                "-out",
-                cacert.name,
-                "-subj",
-                "/CN=proxy3 CA",
-            ],
-            stdout=devnull,
-            stderr=devnull,
-        ).wait()
-        Popen(
-            ["openssl", "genrsa", "-out", certkey.name, "2048"],
-            stdout=devnull,
-            stderr=devnull,
-        ).wait()
-
-        setattr(ProxyRequestHandler, "cakey", cakey.name)
-        setattr(ProxyRequestHandler, "cacert", cacert.name)
-        setattr(ProxyRequestHandler, "certkey", certkey.name)
-        setattr(ProxyRequestHandler, "certdir", certdir)
+    ) as cachedir:
+        certificates = CertificateAuthority(
+            certdir if certificate_cache is None else certificate_cache
+        )
+
+        if prewarm is not None:
+            # Mint the certificates for the expected hostnames in the background
+            threading.Thread(
+                target=certificates.prewarm, args=(prewarm,), daemon=True
+            ).start()
+
+        setattr(ProxyRequestHandler, "certificates", certificates)
 
         setattr(ProxyRequestHandler, "timeout", timeout)
 
+        setattr(ProxyRequestHandler, "stream", stream)
+        setattr(ProxyRequestHandler, "max_body_size", max_body_size)
+
+        cache = (
+            ResourceCache(cache_size, cache_disk_size, cachedir)
+            if cache_size is not None
+            else None
+        )
+
+        setattr(ProxyRequestHandler, "cache", cache)
+
         server_address = ("", port)
 
         ProxyRequestHandler.protocol_version = protocol
@@ -489,6 +649,13 @@ def serve(
 
         logger.addHandler(log)
 
+        if engine == "asyncio":
+            from .proxy3_async import serve_async
+
+            return serve_async(
+                port, timeout, certificates, stream, max_body_size, cache
+            )
+
         try:
             httpd = ServerClass(server_address, ProxyRequestHandler)
         except OSError as err:
@@ -500,6 +667,10 @@ def serve(
 
         click.echo(f"Serving HTTPS Proxy on {sa[0]}:{sa[1]} ...")
 
-        httpd.serve_forever()
+        try:
+            httpd.serve_forever()
+        finally:
+            if cache is not None:
+                click.echo(f"HTTPS Proxy cache: {cache.stats()}")
 
         click.echo(f"HTTPS Proxy on {sa[0]}:{sa[1]} was shut down.")
@@ -0,0 +1,854 @@
+"""
+asyncio engine for the proxy3 HTTPS intercepting data scraping proxy.
+
+All client connections are served by a single event loop, and the upstream
+keep-alive connections are shared process-wide in per-host pools. The
+responses carry the same X-* diagnostic headers as the threading engine.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import ssl
+import sys
+import time
+import urllib.parse
+
+from collections import OrderedDict, deque
+
+import click
+import urllib3
+
+from .proxy3 import (
+    BODY_CHUNK_SIZE,
+    HOP_BY_HOP_HEADERS,
+    STREAMED_TRAILERS,
+    BodyLimit,
+    encode_chunk,
+    encode_last_chunk,
+    exceeds_body_size,
+    filter_accept_encoding,
+    has_response_body,
+)
+from .proxy_cache import is_cacheable_request, lower_headers
+
+STREAM_LIMIT = 1024 * 1024  # 1MB
+MAX_IDLE_CONNECTIONS_PER_HOST = 64
+MAX_IDLE_CONNECTIONS = 512
+MAX_IDLE_TIME = 30  # seconds
+
+
+class UpstreamProtocolError(Exception):
+    pass
+
+
+class UpstreamConnectError(Exception):
+    pass
+
+
+def create_upstream_ssl_context(verify):
+    if verify:
+        context = ssl.create_default_context()
+    else:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+        # Allow all SSL and TLS versions (even unsecure ones)
+        context.options = ssl.OP_ALL
+
+    context.set_ciphers(urllib3.util.ssl_.DEFAULT_CIPHERS)
+
+    return context
+
+
+async def start_tls(reader, writer, context):
+    """
+    Upgrades the client connection of the streams to TLS and returns the
+    streams which must be used from then on
+    """
+
+    if sys.version_info >= (3, 11):
+        await writer.start_tls(context)
+
+        return reader, writer
+
+    return await wrap_tls_streams(writer, context)
+
+
+async def wrap_tls_streams(writer, context):
+    """
+    Upgrades the connection of the writer to TLS using loop.start_tls, as
+    streams can only be upgraded since Python 3.11, and wraps the upgraded
+    transport in new streams
+    """
+
+    loop = asyncio.get_event_loop()
+
+    await writer.drain()
+
+    reader = asyncio.StreamReader(limit=STREAM_LIMIT)
+    protocol = asyncio.StreamReaderProtocol(reader)
+
+    transport = await loop.start_tls(
+        writer.transport, protocol, context, server_side=True
+    )
+
+    # loop.start_tls does not announce the upgraded transport to the protocol
+    protocol.connection_made(transport)
+
+    return reader, asyncio.StreamWriter(transport, protocol, reader, loop)
+
+
+def parse_head(head):
+    lines = head.decode("latin-1").split("\r\n")
+
+    headers = []
+
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+
+        if sep and name.strip():
+            headers.append((name.strip(), value.strip()))
+
+    return (lines[0], headers)
+
+
+def get_header(headers, name, default=None):
+    name = name.lower()
+
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+
+    return default
+
+
+def filter_headers(headers):
+    filtered = []
+
+    for name, value in headers:
+        lower = name.lower()
+
+        if lower in HOP_BY_HOP_HEADERS or lower == "proxy-connection":
+            continue
+
+        # accept only supported encodings
+        if lower == "accept-encoding":
+            value = filter_accept_encoding(value)
+
+        filtered.append((name, value))
+
+    return filtered
+
+
+def encode_head(start_line, headers):
+    return (
+        "\r\n".join([start_line] + [f"{name}: {value}" for name, value in headers])
+        + "\r\n\r\n"
+    ).encode("latin-1", "replace")
+
+
+def format_peer(peername):
+    ip_address, port = peername[:2]
+    ip_address = ipaddress.ip_address(ip_address.split("%")[0])
+
+    return (
+        f"[{ip_address}]:{port}" if ip_address.version == 6 else f"{ip_address}:{port}"
+    )
+
+
+class UpstreamConnectionPools:
+    """
+    Process-wide pools of idle upstream keep-alive connections, which are
+    keyed by their scheme, host, port and whether they verify certificates.
+    The least recently used idle connections are closed once there are too
+    many of them across all hosts.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+        self.idle = OrderedDict()
+        self.num_idle = 0
+
+        self.ssl_contexts = {
+            True: create_upstream_ssl_context(True),
+            False: create_upstream_ssl_context(False),
+        }
+
+    async def acquire(self, key):
+        idle = self.idle.get(key)
+
+        while idle:
+            reader, writer, released = idle.pop()
+
+            self.num_idle -= 1
+
+            if (
+                not reader.at_eof()
+                and not writer.is_closing()
+                and (time.monotonic() - released) < MAX_IDLE_TIME
+            ):
+                return (reader, writer, True)
+
+            writer.close()
+
+        scheme, host, port, verify = key
+
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    host,
+                    port,
+                    ssl=(self.ssl_contexts[verify] if scheme == "https" else None),
+                    server_hostname=(host if scheme == "https" else None),
+                    limit=STREAM_LIMIT,
+                ),
+                self.timeout,
+            )
+        except ssl.SSLError:
+            raise
+        except (asyncio.TimeoutError, OSError) as err:
+            raise UpstreamConnectError(repr(err))
+
+        return (reader, writer, False)
+
+    def release(self, key, reader, writer):
+        idle = self.idle.setdefault(key, deque())
+        self.idle.move_to_end(key)
+
+        if len(idle) >= MAX_IDLE_CONNECTIONS_PER_HOST:
+            idle.popleft()[1].close()
+
+            self.num_idle -= 1
+
+        idle.append((reader, writer, time.monotonic()))
+
+        self.num_idle += 1
+
+        while self.num_idle > MAX_IDLE_CONNECTIONS:
+            lru_key, lru_idle = next(iter(self.idle.items()))
+
+            if len(lru_idle) > 0:
+                lru_idle.popleft()[1].close()
+
+                self.num_idle -= 1
+
+            if len(lru_idle) == 0:
+                del self.idle[lru_key]
+
+
+async def iter_response_body(reader, method, status, headers, timeout):
+    """
+    Yields the (de-chunked) body of an upstream response in chunks and raises
+    an UpstreamProtocolError if the body is malformed or incomplete
+    """
+
+    if not has_response_body(method, status):
+        return
+
+    transfer_encoding = get_header(headers, "Transfer-Encoding", "").lower()
+    content_length = get_header(headers, "Content-Length")
+
+    try:
+        if "chunked" in transfer_encoding:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+
+                try:
+                    size = int(line.split(b";")[0].strip(), 16)
+                except ValueError:
+                    raise UpstreamProtocolError(f"Invalid chunk size {line!r}")
+
+                if size == 0:
+                    # Discard the trailers
+                    while line not in (b"\r\n", b"\n", b""):
+                        line = await asyncio.wait_for(reader.readline(), timeout)
+
+                    return
+
+                while size > 0:
+                    chunk = await asyncio.wait_for(
+                        reader.read(min(size, BODY_CHUNK_SIZE)), timeout
+                    )
+
+                    if not chunk:
+                        raise UpstreamProtocolError("Incomplete chunked response")
+
+                    size -= len(chunk)
+
+                    yield chunk
+
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+        elif content_length is not None:
+            try:
+                remaining = int(content_length)
+            except ValueError:
+                raise UpstreamProtocolError(f"Invalid Content-Length {content_length}")
+
+            while remaining > 0:
+                chunk = await asyncio.wait_for(
+                    reader.read(min(remaining, BODY_CHUNK_SIZE)), timeout
+                )
+
+                # Like the threading engine, a short body is not an error
+                if not chunk:
+                    return
+
+                remaining -= len(chunk)
+
+                yield chunk
+        else:
+            # The response is delimited by the closing of the connection
+            while True:
+                chunk = await asyncio.wait_for(reader.read(BODY_CHUNK_SIZE), timeout)
+
+                if not chunk:
+                    return
+
+                yield chunk
+    except (asyncio.IncompleteReadError, ConnectionError) as err:
+        raise UpstreamProtocolError(repr(err))
+
+
+def is_reusable(method, status, headers):
+    if get_header(headers, "Connection", "").lower() == "close":
+        return False
+
+    if not has_response_body(method, status):
+        return True
+
+    return (
+        "chunked" in get_header(headers, "Transfer-Encoding", "").lower()
+        or get_header(headers, "Content-Length") is not None
+    )
+
+
+class AsyncProxy:
+    def __init__(
+        self, timeout, certificates, stream=False, max_body_size=None, cache=None
+    ):
+        self.timeout = timeout
+
+        self.stream = stream
+        self.max_body_size = max_body_size
+
+        self.cache = cache
+
+        self.certificates = certificates
+
+        self.pools = UpstreamConnectionPools(timeout)
+
+        self.logger = logging.getLogger("proxy3")
+
+        self.last_error = None
+
+    def log_error(self, method, url, msg):
+        if msg == self.last_error:
+            return
+
+        self.last_error = msg
+
+        self.logger.error(f"{method} {url} - {msg}")
+
+    async def certificate_context(self, hostname):
+        context = self.certificates.cached_context(hostname)
+
+        if context is None:
+            # Minting a new certificate should not block the event loop
+            context = await asyncio.get_event_loop().run_in_executor(
+                None, self.certificates.context, hostname
+            )
+
+        return context
+
+    async def handle_client(self, reader, writer):
+        over_tls = False
+
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), self.timeout
+                    )
+                except (
+                    asyncio.TimeoutError,
+                    asyncio.IncompleteReadError,
+                    asyncio.LimitOverrunError,
+                    ConnectionError,
+                ):
+                    break
+
+                request_line, headers = parse_head(head)
+
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    break
+
+                if method == "CONNECT":
+                    # The certificate must be ready before the connection is
+                    #  established, as the client's TLS handshake would
+                    #  otherwise be consumed by the plain stream reader
+                    context = await self.certificate_context(target.rpartition(":")[0])
+
+                    writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+
+                    reader, writer = await start_tls(reader, writer, context)
+
+                    over_tls = True
+
+                    continue
+
+                content_length = int(get_header(headers, "Content-Length", 0))
+                body = (
+                    await asyncio.wait_for(
+                        reader.readexactly(content_length), self.timeout
+                    )
+                    if content_length > 0
+                    else b""
+                )
+
+                if target.startswith("/"):
+                    target = "{}://{}{}".format(
+                        "https" if over_tls else "http",
+                        get_header(headers, "Host", ""),
+                        target,
+                    )
+
+                keep_alive = await self.forward(
+                    writer, method, target, version, headers, body
+                )
+
+                connection = get_header(
+                    headers, "Proxy-Connection", get_header(headers, "Connection", "")
+                )
+
+                if (
+                    not keep_alive
+                    or version != "HTTP/1.1"
+                    or connection.lower() == "close"
+                ):
+                    break
+        except Exception as err:
+            self.log_error("-", "-", repr(err))
+        finally:
+            writer.close()
+
+    async def request(self, key, request):
+        while True:
+            reader, writer, reused = await self.pools.acquire(key)
+
+            try:
+                writer.write(request)
+
+                await asyncio.wait_for(writer.drain(), self.timeout)
+
+                while True:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), self.timeout
+                    )
+
+                    status_line, headers = parse_head(head)
+
+                    try:
+                        version, status, reason = (status_line.split(" ", 2) + [""])[:3]
+                        status = int(status)
+                    except ValueError:
+                        raise UpstreamProtocolError(
+                            f"Invalid status line {status_line!r}"
+                        )
+
+                    # Skip informational responses such as 100 Continue
+                    if not (100 <= status < 200):
+                        break
+
+                return (reader, writer, status, reason, headers)
+            except (
+                asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError,
+                ConnectionError,
+            ) as err:
+                writer.close()
+
+                # A reused keep-alive connection might have been closed by
+                #  the server in the meantime, so retry on a new connection
+                if reused:
+                    continue
+
+                raise UpstreamProtocolError(repr(err))
+            except BaseException:
+                writer.close()
+
+                raise
+
+    async def forward(self, writer, method, url, version, headers, body):
+        u = urllib.parse.urlsplit(url)
+
+        scheme = u.scheme
+        host = u.hostname or ""
+        port = u.port or (443 if scheme == "https" else 80)
+        path = u.path or "/"
+        path = path + "?" + u.query if u.query else path
+
+        if scheme not in ("http", "https"):
+            return await self.send_error(
+                writer, "400 Bad Request", "X-Invalid-Response"
+            )
+
+        headers = [
+            (name, value) for name, value in headers if name.lower() != "host"
+        ] + [("Host", u.netloc)]
+        headers = filter_headers(headers)
+
+        request = encode_head(f"{method} {path} HTTP/1.1", headers) + body
+
+        diagnostics = []
+
+        cache_request_headers = None
+
+        if self.cache is not None:
+            request_headers = lower_headers(headers)
+
+            if is_cacheable_request(method, request_headers):
+                cache_request_headers = request_headers
+
+                # A hit might have to be loaded from the disk tier
+                cached = await asyncio.get_event_loop().run_in_executor(
+                    None, self.cache.lookup, url, request_headers
+                )
+
+                if cached is not None:
+                    return await self.send_cached_response(writer, method, cached)
+
+                diagnostics.append(("X-Cache", "MISS"))
+
+        try:
+            key = (scheme, host, port, True)
+
+            try:
+                request_time = time.perf_counter()
+
+                reader, upstream, status, reason, res_headers = await self.request(
+                    key, request
+                )
+            except ssl.SSLError:
+                if scheme != "https":
+                    raise
+
+                key = (scheme, host, port, False)
+
+                request_time = time.perf_counter()
+
+                reader, upstream, status, reason, res_headers = await self.request(
+                    key, request
+                )
+
+                diagnostics.append(("X-SSL-Error", "True"))
+
+            diagnostics.append(
+                ("X-Response-Time", str(time.perf_counter() - request_time))
+            )
+
+            try:
+                diagnostics.append(
+                    ("X-IP-Port", format_peer(upstream.get_extra_info("peername")))
+                )
+            except Exception as err:
+                self.log_error(method, url, repr(err))
+
+            reusable = is_reusable(method, status, res_headers)
+
+            if not self.stream:
+                res_body = []
+
+                limit = BodyLimit(self.max_body_size)
+                invalid = False
+
+                try:
+                    async for chunk in iter_response_body(
+                        reader, method, status, res_headers, self.timeout
+                    ):
+                        res_body.append(limit.truncate(chunk))
+
+                        if limit.truncated:
+                            diagnostics.append(("X-Truncated-Response", "True"))
+
+                            reusable = False
+
+                            break
+                except UpstreamProtocolError:
+                    diagnostics.append(("X-Invalid-Response", "True"))
+
+                    reusable = False
+                    invalid = True
+                except BaseException:
+                    upstream.close()
+
+                    raise
+
+                if reusable:
+                    self.pools.release(key, reader, upstream)
+                else:
+                    upstream.close()
+
+                res_body = b"".join(res_body)
+
+                if cache_request_headers is not None and not (
+                    limit.truncated or invalid
+                ):
+                    await asyncio.get_event_loop().run_in_executor(
+                        None,
+                        self.cache.store,
+                        url,
+                        cache_request_headers,
+                        status,
+                        reason,
+                        filter_headers(res_headers),
+                        res_body,
+                    )
+        except UpstreamConnectError:
+            # Egregious DNS error such that we could not even connect to the resource
+            return await self.send_error(writer, "204 DNS Error", "X-DNS-Error")
+        except asyncio.TimeoutError:
+            # Request timed out since server did not respond in time
+            # Need to send a special message here as Chrome does not handle 408s correctly
+            return await self.send_error(
+                writer, "204 Request Timeout", "X-Request-Timeout"
+            )
+        except ssl.SSLError:
+            # Egregious SSL error such that we could not even perform the request in insecure mode
+            return await self.send_error(writer, "204 SSL Error", "X-SSL-Error")
+        except UpstreamProtocolError:
+            # Egregious protocol error such that we could not even perform the request
+            return await self.send_error(
+                writer, "204 Protocol Error", "X-Invalid-Response"
+            )
+        except Exception as err:
+            self.log_error(method, url, repr(err))
+
+            # Egregious *other* error such that we could not even perform the request
+            return await self.send_error(
+                writer, f"204 {err}".splitlines()[0], "X-Invalid-Response"
+            )
+
+        if self.stream:
+            return await self.stream_response(
+                writer,
+                method,
+                version,
+                status,
+                reason,
+                res_headers,
+                diagnostics,
+                key,
+                reader,
+                upstream,
+                reusable,
+                url,
+                cache_request_headers,
+            )
+
+        res_headers = [
+            (name, value)
+            for name, value in res_headers
+            if name.lower() != "content-length"
+        ] + [("Content-Length", str(len(res_body)))]
+
+        writer.write(
+            encode_head(
+                f"HTTP/1.1 {status} {reason}", diagnostics + filter_headers(res_headers)
+            )
+        )
+
+        if len(res_body) > 0 and method != "HEAD":
+            writer.write(res_body)
+
+        await writer.drain()
+
+        return True
+
+    async def stream_response(
+        self,
+        writer,
+        method,
+        version,
+        status,
+        reason,
+        res_headers,
+        diagnostics,
+        key,
+        reader,
+        upstream,
+        reusable,
+        url,
+        cache_request_headers=None,
+    ):
+        has_body = has_response_body(method, status)
+        chunked = version == "HTTP/1.1"
+
+        limit = BodyLimit(self.max_body_size)
+
+        client_headers = filter_headers(res_headers)
+
+        # The streamed body is only kept if it can fit into the cache
+        cache_headers = client_headers
+        cache_body = [] if cache_request_headers is not None else None
+        cache_body_size = 0
+
+        if has_body:
+            if exceeds_body_size(
+                get_header(res_headers, "Content-Length"), self.max_body_size
+            ):
+                diagnostics.append(("X-Truncated-Response", "True"))
+
+            client_headers = [
+                (name, value)
+                for name, value in client_headers
+                if name.lower() != "content-length"
+            ]
+
+            if chunked:
+                client_headers.append(("Transfer-Encoding", "chunked"))
+                client_headers.append(("Trailer", STREAMED_TRAILERS))
+            else:
+                # HTTP/1.0 clients only support bodies delimited by closing
+                client_headers.append(("Connection", "close"))
+
+        try:
+            writer.write(
+                encode_head(f"HTTP/1.1 {status} {reason}", diagnostics + client_headers)
+            )
+
+            await writer.drain()
+
+            trailers = []
+
+            try:
+                async for chunk in iter_response_body(
+                    reader, method, status, res_headers, self.timeout
+                ):
+                    chunk = limit.truncate(chunk)
+
+                    if len(chunk) > 0:
+                        writer.write(encode_chunk(chunk) if chunked else chunk)
+
+                        await writer.drain()
+
+                    if cache_body is not None:
+                        cache_body.append(chunk)
+                        cache_body_size += len(chunk)
+
+                        if cache_body_size > self.cache.max_entry_size:
+                            cache_body = None
+
+                    if limit.truncated:
+                        trailers.append(("X-Truncated-Response", "True"))
+
+                        break
+            except (UpstreamProtocolError, asyncio.TimeoutError) as err:
+                self.log_error(method, key[1], repr(err))
+
+                trailers.append(("X-Invalid-Response", "True"))
+        except BaseException:
+            upstream.close()
+
+            raise
+
+        # Only completely read upstream connections can be reused
+        if reusable and len(trailers) == 0:
+            self.pools.release(key, reader, upstream)
+        else:
+            upstream.close()
+
+        if chunked and has_body:
+            writer.write(encode_last_chunk(trailers))
+
+        await writer.drain()
+
+        if cache_body is not None and len(trailers) == 0:
+            await asyncio.get_event_loop().run_in_executor(
+                None,
+                self.cache.store,
+                url,
+                cache_request_headers,
+                status,
+                reason,
+                cache_headers,
+                b"".join(cache_body),
+            )
+
+        return chunked or not has_body
+
+    async def send_cached_response(self, writer, method, cached):
+        writer.write(
+            encode_head(
+                f"HTTP/1.1 {cached.status} {cached.reason}",
+                cached.headers
+                + [
+                    ("Content-Length", str(len(cached.body))),
+                    ("X-Cache", "HIT"),
+                ],
+            )
+        )
+
+        if method != "HEAD":
+            writer.write(cached.body)
+
+        await writer.drain()
+
+        return True
+
+    async def send_error(self, writer, status, diagnostic):
+        writer.write(
+            encode_head(
+                f"HTTP/1.1 {status}",
+                [
+                    ("Date", time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())),
+                    (diagnostic, "True"),
+                    ("Connection", "close"),
+                ],
+            )
+        )
+
+        await writer.drain()
+
+        return False
+
+
+def serve_async(
+    port, timeout, certificates, stream=False, max_body_size=None, cache=None
+):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL + 1)
+
+    proxy = AsyncProxy(timeout, certificates, stream, max_body_size, cache)
+
+    try:
+        server = loop.run_until_complete(
+            asyncio.start_server(proxy.handle_client, port=port, limit=STREAM_LIMIT)
+        )
+    except OSError as err:
+        raise click.UsageError(
+            click.style(f"Could not open port {port}: {err}.", fg="red")
+        )
+
+    sa = server.sockets[0].getsockname()
+
+    click.echo(f"Serving HTTPS Proxy on {sa[0]}:{sa[1]} ...")
+
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+        if cache is not None:
+            click.echo(f"HTTPS Proxy cache: {cache.stats()}")
+
+    click.echo(f"HTTPS Proxy on {sa[0]}:{sa[1]} was shut down.")
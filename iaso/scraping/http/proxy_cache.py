@@ -0,0 +1,450 @@
+"""
+Opt-in cache of static sub-resources for the proxy3 scraping proxy.
+
+The browser workers start every job with an empty profile and would fetch
+the same scripts, stylesheets, fonts and images of a provider again and
+again. Only such static sub-resources are cached, the main documents (and
+any other responses) are always fetched fresh from the Internet.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+CACHEABLE_DESTINATIONS = ("script", "style", "font", "image")
+DOCUMENT_DESTINATIONS = ("document", "iframe", "frame", "embed", "object")
+CACHEABLE_CONTENT_TYPES = (
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+    "application/x-javascript",
+    "application/wasm",
+    "font/",
+    "application/font",
+    "application/x-font",
+    "image/",
+)
+
+MAX_ENTRY_FRACTION = 8  # An entry may take up at most 1/8 of a tier
+MAX_HEURISTIC_LIFETIME = 60 * 60 * 24  # 1 day
+STATS_INTERVAL = 1000
+
+
+def lower_headers(headers):
+    return {name.lower(): value for name, value in headers}
+
+
+def parse_cache_control(cache_control):
+    directives = dict()
+
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.partition("=")
+        name = name.strip().lower()
+
+        if len(name) > 0:
+            directives[name] = value.strip().strip('"')
+
+    return directives
+
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_cacheable_request(method, headers):
+    """
+    Returns whether a request (with lowercase headers) is for a static
+    sub-resource which might be served from the cache
+    """
+
+    if method != "GET" or "range" in headers or "authorization" in headers:
+        return False
+
+    if "no-store" in parse_cache_control(headers.get("cache-control")):
+        return False
+
+    destination = headers.get("sec-fetch-dest", "").lower()
+
+    if destination in CACHEABLE_DESTINATIONS:
+        return True
+
+    # Main documents must always be fetched fresh to keep the measurements
+    #  honest, including over plain http where there are no Sec-Fetch-* headers
+    return (
+        destination not in DOCUMENT_DESTINATIONS
+        and headers.get("sec-fetch-mode", "").lower() != "navigate"
+        and "text/html" not in headers.get("accept", "")
+    )
+
+
+def freshness_lifetime(headers, now):
+    """
+    Returns for how many more seconds a response (with lowercase headers)
+    may be served from the cache, or None if it must not be cached
+    """
+
+    directives = parse_cache_control(headers.get("cache-control"))
+
+    if any(
+        directive in directives for directive in ("no-store", "no-cache", "private")
+    ):
+        return None
+
+    try:
+        age = max(0, int(headers.get("age", 0)))
+    except ValueError:
+        age = 0
+
+    date = parse_http_date(headers.get("date")) or now
+
+    lifetime = None
+
+    for directive in ("s-maxage", "max-age"):
+        if directive in directives:
+            try:
+                lifetime = int(directives[directive])
+            except ValueError:
+                return None
+
+            break
+
+    if lifetime is None and "expires" in headers:
+        expires = parse_http_date(headers["expires"])
+
+        lifetime = expires - date if expires is not None else 0
+
+    if lifetime is None and "last-modified" in headers:
+        last_modified = parse_http_date(headers["last-modified"])
+
+        if last_modified is not None:
+            lifetime = min((date - last_modified) / 10, MAX_HEURISTIC_LIFETIME)
+
+    if lifetime is None or lifetime - age <= 0:
+        return None
+
+    return lifetime - age
+
+
+def is_cacheable_response(status, headers):
+    if status != 200 or "set-cookie" in headers:
+        return False
+
+    vary = headers.get("vary", "").lower()
+
+    # The cache key only distinguishes requests by their Accept-Encoding
+    if any(name.strip() not in ("", "accept-encoding") for name in vary.split(",")):
+        return False
+
+    content_type = headers.get("content-type", "").lower()
+
+    return any(content_type.startswith(prefix) for prefix in CACHEABLE_CONTENT_TYPES)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class CachedResponse:
+    __slots__ = ("status", "reason", "headers", "body", "expires")
+
+    def __init__(self, status, reason, headers, body, expires):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+
+    def encode_head(self):
+        return json.dumps(
+            [self.status, self.reason, self.headers, self.expires]
+        ).encode("utf-8")
+
+
+class ResourceCache:
+    """
+    Thread-safe size-bounded LRU cache of static sub-resources with a memory
+    tier and an optional disk tier inside the cachedir. Entries which are
+    evicted from memory are demoted to the disk and promoted back on a hit.
+
+    The lock only guards the bookkeeping of both tiers. The disk tier's
+    files are read, written and removed after the lock has been released,
+    such that the proxy's threads never wait for another thread's file I/O.
+    """
+
+    def __init__(self, memory_size, disk_size=0, cachedir=None):
+        self.memory_size = memory_size
+        self.disk_size = disk_size if cachedir is not None else 0
+
+        self.cachedir = Path(cachedir) if cachedir is not None else None
+
+        if self.disk_size > 0:
+            self.cachedir.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+
+        self.memory = OrderedDict()
+        self.memory_used = 0
+
+        self.disk = OrderedDict()
+        self.disk_used = 0
+
+        # Every disk entry gets its own file, such that a pending write can
+        #  never overwrite the file of a newer entry with the same key
+        self.disk_files = itertools.count()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        self.logger = logging.getLogger("proxy3")
+
+    @property
+    def max_entry_size(self):
+        return max(self.memory_size, self.disk_size) // MAX_ENTRY_FRACTION
+
+    @staticmethod
+    def key(url, headers):
+        return f"{url} {headers.get('accept-encoding', '')}"
+
+    def lookup(self, url, headers):
+        """
+        Returns the fresh CachedResponse for the URL of a cacheable request
+        (with lowercase headers) or None on a miss
+        """
+
+        key = self.key(url, headers)
+        now = time.time()
+
+        disk_io = []
+
+        with self.lock:
+            response = self.memory.get(key)
+
+            if response is not None and response.expires <= now:
+                self.remove_from_memory(key)
+
+                response = None
+
+            if response is not None:
+                self.memory.move_to_end(key)
+
+            # The entry is taken out of the disk tier before its file is read
+            path = self.take_from_disk(key) if response is None else None
+
+            if path is None:
+                self.count_lookup(response)
+
+        if path is None:
+            return response
+
+        response = self.read_from_disk(path)
+
+        if response is not None and response.expires <= now:
+            response = None
+
+        with self.lock:
+            if response is not None:
+                self.add_to_memory(key, response, disk_io)
+
+            self.count_lookup(response)
+
+        self.perform_disk_io(disk_io)
+
+        return response
+
+    def count_lookup(self, response):
+        if response is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        if (self.hits + self.misses) % STATS_INTERVAL == 0:
+            self.logger.info(f"cache: {self.stats()}")
+
+    def store(self, url, request_headers, status, reason, headers, body):
+        """
+        Stores a completely received response in the cache if it is a
+        cacheable static sub-resource
+        """
+
+        response_headers = lower_headers(headers)
+
+        if len(body) > self.max_entry_size or not is_cacheable_response(
+            status, response_headers
+        ):
+            return False
+
+        now = time.time()
+
+        lifetime = freshness_lifetime(response_headers, now)
+
+        if lifetime is None:
+            return False
+
+        response = CachedResponse(
+            status,
+            reason,
+            [
+                [name, value]
+                for name, value in headers
+                if name.lower() not in ("content-length", "age")
+            ],
+            body,
+            now + lifetime,
+        )
+
+        key = self.key(url, request_headers)
+
+        disk_io = []
+
+        with self.lock:
+            self.remove_from_memory(key)
+            self.remove_from_disk(key, disk_io)
+
+            self.add_to_memory(key, response, disk_io)
+
+            self.stores += 1
+
+        self.perform_disk_io(disk_io)
+
+        return True
+
+    def add_to_memory(self, key, response, disk_io):
+        if len(response.body) > self.memory_size // MAX_ENTRY_FRACTION:
+            return self.add_to_disk(key, response, disk_io)
+
+        self.memory[key] = response
+        self.memory_used += len(response.body)
+
+        while self.memory_used > self.memory_size:
+            lru_key, lru_response = self.memory.popitem(last=False)
+            self.memory_used -= len(lru_response.body)
+
+            if lru_key != key:
+                self.add_to_disk(lru_key, lru_response, disk_io)
+
+    def remove_from_memory(self, key):
+        response = self.memory.pop(key, None)
+
+        if response is not None:
+            self.memory_used -= len(response.body)
+
+    def add_to_disk(self, key, response, disk_io):
+        """
+        Adds the entry to the disk tier, whose file is only written once the
+        lock has been released by perform_disk_io
+        """
+
+        size = len(response.body)
+
+        if size > self.disk_size // MAX_ENTRY_FRACTION or key in self.disk:
+            return
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        path = self.cachedir / f"{digest}.{next(self.disk_files)}"
+
+        self.disk[key] = (path, size)
+        self.disk_used += size
+
+        disk_io.append((key, path, response))
+
+        while self.disk_used > self.disk_size:
+            self.remove_from_disk(next(iter(self.disk)), disk_io)
+
+    def take_from_disk(self, key):
+        entry = self.disk.pop(key, None)
+
+        if entry is None:
+            return None
+
+        path, size = entry
+
+        self.disk_used -= size
+
+        return path
+
+    def remove_from_disk(self, key, disk_io):
+        path = self.take_from_disk(key)
+
+        if path is not None:
+            disk_io.append((key, path, None))
+
+    def read_from_disk(self, path):
+        try:
+            with open(path, "rb") as file:
+                head, _, body = file.read().partition(b"\n")
+
+            os.remove(path)
+        except FileNotFoundError:
+            # The entry was taken before its pending write had finished
+            return None
+        except OSError as err:
+            return self.logger.error(f"cache: {err!r}")
+
+        status, reason, headers, expires = json.loads(head)
+
+        return CachedResponse(status, reason, headers, body, expires)
+
+    def perform_disk_io(self, disk_io):
+        """
+        Writes the files of new disk entries and removes the files of evicted
+        ones without holding the lock
+        """
+
+        for key, path, response in disk_io:
+            if response is not None:
+                self.write_to_disk(key, path, response)
+            else:
+                remove_file(path)
+
+    def write_to_disk(self, key, path, response):
+        temp_path = path.with_name(f"{path.name}.tmp")
+
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(response.encode_head())
+                file.write(b"\n")
+                file.write(response.body)
+
+            os.replace(temp_path, path)
+        except OSError as err:
+            self.logger.error(f"cache: {err!r}")
+
+            remove_file(temp_path)
+
+            with self.lock:
+                if self.disk.get(key, (None,))[0] == path:
+                    self.take_from_disk(key)
+
+            return
+
+        # The entry might have been evicted or taken while it was written
+        with self.lock:
+            current = self.disk.get(key, (None,))[0] == path
+
+        if not current:
+            remove_file(path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+
+        return (
+            f"{self.hits} hits, {self.misses} misses "
+            f"({self.hits / max(lookups, 1):.1%} hit rate), {self.stores} stores, "
+            f"{len(self.memory)} entries ({self.memory_used} bytes) in memory, "
+            f"{len(self.disk)} entries ({self.disk_used} bytes) on disk"
+        )
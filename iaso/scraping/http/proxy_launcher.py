@@ -13,9 +13,32 @@ def find_free_port():
 
 
 class ProxyLauncher:
-    def __init__(self, ctx, timeout, proxy_address, tempdir):
+    def __init__(
+        self,
+        ctx,
+        timeout,
+        proxy_address,
+        tempdir,
+        engine="threading",
+        certificate_cache=None,
+        prewarm=None,
+        stream=False,
+        max_body_size=None,
+        cache_size=None,
+        cache_disk_size=0,
+    ):
         self.ctx = ctx
         self.timeout = timeout
+        self.engine = engine
+
+        self.certificate_cache = certificate_cache
+        self.prewarm = prewarm
+
+        self.stream = stream
+        self.max_body_size = max_body_size
+
+        self.cache_size = cache_size
+        self.cache_disk_size = cache_disk_size
 
         self.proxy_address = proxy_address
         self.proxy = None
@@ -29,7 +52,17 @@ class ProxyLauncher:
             self.proxy = self.ctx.Process(
                 target=proxy3.serve,
                 args=(proxy_port, self.timeout),
-                kwargs={"ignore_sigint": True, "tempdir": self.tempdir},
+                kwargs={
+                    "ignore_sigint": True,
+                    "tempdir": self.tempdir,
+                    "engine": self.engine,
+                    "certificate_cache": self.certificate_cache,
+                    "prewarm": self.prewarm,
+                    "stream": self.stream,
+                    "max_body_size": self.max_body_size,
+                    "cache_size": self.cache_size,
+                    "cache_disk_size": self.cache_disk_size,
+                },
                 daemon=True,
             )
             self.proxy.start()
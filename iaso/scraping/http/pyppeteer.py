@@ -1,3 +1,9 @@
+import asyncio
+import os
+import shutil
+import tempfile
+
+import psutil
 import pyppeteer
 
 from async_generator import asynccontextmanager
@@ -34,3 +40,109 @@ async def new_page(browser):
             await context.close()
         except:
             pass
+
+
+class PersistentBrowser:
+    """
+    A headless Chromium browser which is launched lazily and then kept open
+    across several scraping jobs. Every job should still run inside its own
+    incognito context, e.g. using new_page(await browser.get()).
+    """
+
+    def __init__(self, tempdir, proxy_address, chrome):
+        self.tempdir = tempdir
+        self.proxy_address = proxy_address
+        self.chrome = chrome
+
+        self.browser = None
+        self.userDataDir = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def get(self):
+        if self.browser is not None and self.browser.process.poll() is not None:
+            # The browser has crashed or was killed, so it needs to be relaunched
+            await self.close()
+
+        if self.browser is None:
+            options = {}
+
+            if self.chrome is not None:
+                options["executablePath"] = self.chrome
+
+            self.userDataDir = tempfile.mkdtemp(dir=self.tempdir)
+
+            try:
+                self.browser = await pyppeteer.launch(
+                    headless=True,
+                    ignoreHTTPSErrors=True,
+                    userDataDir=self.userDataDir,
+                    autoClose=True,
+                    handleSIGINT=False,
+                    handleSIGTERM=False,
+                    handleSIGHUP=False,
+                    args=[
+                        "--no-sandbox",
+                        f"--proxy-server={self.proxy_address}",
+                        "--disable-gpu",
+                    ],
+                    **options,
+                )
+            except Exception as err:
+                await self.close()
+
+                raise pyppeteer.errors.BrowserError(err)
+
+        return self.browser
+
+    async def restart(self):
+        await self.close()
+
+        return await self.get()
+
+    async def close(self):
+        browser, self.browser = self.browser, None
+
+        if browser is not None:
+            try:
+                await browser.close()
+            except:
+                pass
+
+        userDataDir, self.userDataDir = self.userDataDir, None
+
+        if userDataDir is not None:
+            for retry in range(100):
+                if os.path.exists(userDataDir):
+                    shutil.rmtree(userDataDir, ignore_errors=True)
+
+                    if os.path.exists(userDataDir):
+                        await asyncio.sleep(0.01)
+                else:
+                    break
+
+    def memory(self):
+        """Returns the resident memory of the browser's process tree in bytes"""
+
+        if self.browser is None:
+            return 0
+
+        try:
+            process = psutil.Process(pid=self.browser.process.pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.Error:
+            return 0
+
+        memory = 0
+
+        for process in processes:
+            try:
+                memory += process.memory_info().rss
+            except psutil.Error:
+                pass
+
+        return memory
@@ -0,0 +1,50 @@
+from requests import codes as status_code_values
+
+
+def redirect_from_response(url, status, headers):
+    """
+    Builds one entry of a ping's redirects from the status and headers of a
+    response that has passed through the scraping proxy
+    """
+
+    return {
+        "url": url,
+        "ip_port": headers.get("x-ip-port"),
+        "response_time": int(round(float(headers["x-response-time"]), 3) * 1000)
+        if "x-response-time" in headers
+        else None,
+        "status": status
+        if status != status_code_values.no_content
+        else status_code_values.request_timeout
+        if bool(headers.get("x-request-timeout", False))
+        else None,
+        "dns_error": bool(headers.get("x-dns-error", False)),
+        "ssl_error": bool(headers.get("x-ssl-error", False)),
+        "invalid_response": bool(headers.get("x-invalid-response", False)),
+    }
+
+
+def redirect_from_timeout(url, timeout):
+    return {
+        "url": url,
+        "ip_port": None,
+        "response_time": int(round(float(timeout), 3) * 1000),
+        "status": status_code_values.timeout,
+        "dns_error": False,
+        "ssl_error": False,
+        "invalid_response": False,
+    }
+
+
+def is_proxy_error(headers):
+    """
+    Returns whether the scraping proxy has responded with a destructive error
+    message instead of forwarding a response
+    """
+
+    return bool(
+        headers.get("x-ssl-error", False)
+        or headers.get("x-invalid-response", False)
+        or headers.get("x-dns-error", False)
+        or headers.get("x-request-timeout", False)
+    )
@@ -0,0 +1,31 @@
+function (name, throttle) {
+    const binding = window[name];
+
+    if (typeof binding !== 'function' || binding.settleObserver) {
+        return;
+    }
+
+    let pending = false;
+
+    const report = () => {
+        pending = false;
+
+        binding();
+    };
+
+    binding.settleObserver = new MutationObserver(() => {
+        // Coalesce bursts of mutations into a single report
+        if (!pending) {
+            pending = true;
+
+            setTimeout(report, throttle);
+        }
+    });
+
+    binding.settleObserver.observe(document, {
+        attributes: true,
+        characterData: true,
+        childList: true,
+        subtree: true,
+    });
+}
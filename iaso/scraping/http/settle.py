@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from importlib.resources import read_text
+
+SETTLE_BINDING = "__iasoSettleMutation"
+SETTLE_SCRIPT = read_text("iaso.scraping.http", "settle.js")
+
+MUTATION_THROTTLE = 0.05  # seconds
+QUIET_PERIOD = 0.5  # seconds
+STALLED_NETWORK_PERIOD = 2.0  # seconds
+
+
+class PageSettleMonitor:
+    """
+    Tracks the DOM mutations and in-flight network requests of a page to
+    detect when it has settled, i.e. when neither has changed for a while.
+    Long-polling requests which never finish are tolerated once the network
+    has been silent for the STALLED_NETWORK_PERIOD.
+    """
+
+    def __init__(self, page):
+        self.in_flight = set()
+
+        self.last_mutation = time.time()
+        self.last_network = time.time()
+
+        page.on("request", self.onRequest)
+        page.on("requestfinished", self.onRequestDone)
+        page.on("requestfailed", self.onRequestDone)
+
+    def onMutation(self):
+        self.last_mutation = time.time()
+
+    def onRequest(self, request):
+        self.in_flight.add(request)
+
+        self.last_network = time.time()
+
+    def onRequestDone(self, request):
+        self.in_flight.discard(request)
+
+        self.last_network = time.time()
+
+    def settled_at(self):
+        return max(
+            self.last_mutation + QUIET_PERIOD,
+            self.last_network
+            + (QUIET_PERIOD if len(self.in_flight) == 0 else STALLED_NETWORK_PERIOD),
+        )
+
+    async def wait(self, deadline):
+        # No polling is required as the earliest possible settle time is known
+        while True:
+            now = time.time()
+
+            settled_at = self.settled_at()
+
+            if settled_at <= now or deadline <= now:
+                return
+
+            await asyncio.sleep(min(settled_at, deadline) - now)
+
+
+async def setup_settle_monitoring(page):
+    monitor = PageSettleMonitor(page)
+
+    await page.exposeFunction(SETTLE_BINDING, monitor.onMutation)
+    await page.evaluateOnNewDocument(
+        SETTLE_SCRIPT, SETTLE_BINDING, int(MUTATION_THROTTLE * 1000)
+    )
+
+    return monitor
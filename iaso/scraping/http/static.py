@@ -0,0 +1,169 @@
+import re
+
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+
+import httpx
+
+from requests import codes as status_code_values
+
+from ..content_type import (
+    content_detector,
+    decode_content,
+    get_content_type,
+    is_text_mime_type,
+)
+from .redirects import is_proxy_error, redirect_from_response, redirect_from_timeout
+
+MAX_REDIRECTS = 20
+
+STATIC_HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4209.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+# Errors after which the browser might still be able to scrape the resource
+STATIC_HTTP_ERRORS = (
+    httpx.HTTPError,
+    httpx.NetworkError,
+    httpx.ProtocolError,
+    httpx.ProxyError,
+)
+
+STATIC_HTTP_TIMEOUTS = (
+    httpx.ConnectTimeout,
+    httpx.ReadTimeout,
+    httpx.WriteTimeout,
+    httpx.PoolTimeout,
+)
+
+HTML_MIME_TYPES = {"text/html", "application/xhtml+xml"}
+
+META_REFRESH_PATTERN = re.compile(
+    r"<meta[^>]+http-equiv\s*=\s*[\"']?refresh", re.IGNORECASE
+)
+SCRIPT_NAVIGATION_PATTERN = re.compile(
+    r"(?:window|document|top|self)\.location(?:\.href)?\s*=(?!=)|location\.(?:replace|assign)\s*\(",
+    re.IGNORECASE,
+)
+FRAME_PATTERN = re.compile(r"<(?:i?frame|frameset)\b", re.IGNORECASE)
+SCRIPT_PATTERN = re.compile(r"<script\b", re.IGNORECASE)
+NOSCRIPT_JAVASCRIPT_PATTERN = re.compile(
+    r"<noscript\b[^>]*>(?:(?!</noscript).){0,1024}?javascript",
+    re.IGNORECASE | re.DOTALL,
+)
+INVISIBLE_PATTERN = re.compile(
+    r"<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+MIN_VISIBLE_TEXT_LENGTH = 256
+
+
+def static_http_client(proxy_address, timeout):
+    # All requests go through the scraping proxy, which provides the X-*
+    #  headers that the redirects are built from
+    return httpx.AsyncClient(
+        headers=STATIC_HTTP_HEADERS,
+        proxies=f"http://{proxy_address}",
+        verify=False,
+        timeout=timeout,
+        trust_env=False,
+    )
+
+
+def requires_javascript(html):
+    """
+    Heuristically decides whether an HTML page needs to be rendered by a
+    browser before its content or its final URL are known
+    """
+
+    if META_REFRESH_PATTERN.search(html) is not None:
+        return True
+
+    if SCRIPT_NAVIGATION_PATTERN.search(html) is not None:
+        return True
+
+    if FRAME_PATTERN.search(html) is not None:
+        return True
+
+    if NOSCRIPT_JAVASCRIPT_PATTERN.search(html) is not None:
+        return True
+
+    if SCRIPT_PATTERN.search(html) is None:
+        return False
+
+    # Pages whose content is mostly generated by scripts are empty shells
+    visible_text = WHITESPACE_PATTERN.sub(" ", INVISIBLE_PATTERN.sub(" ", html))
+
+    return len(visible_text.strip()) < MIN_VISIBLE_TEXT_LENGTH
+
+
+async def scrape_static_http_resource(client, timeout, url):
+    # Every job starts without cookies, just like a fresh incognito context
+    client.cookies.clear()
+
+    request_date = datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+
+    redirects = []
+
+    # Follow the redirects manually to record every hop of the chain
+    for _ in range(MAX_REDIRECTS + 1):
+        try:
+            response = await client.get(url, allow_redirects=False, timeout=timeout)
+        except STATIC_HTTP_TIMEOUTS:
+            redirects.append(redirect_from_timeout(url, timeout))
+
+            return (request_date, redirects, None, None, False)
+
+        redirects.append(
+            redirect_from_response(url, response.status_code, response.headers)
+        )
+
+        location = response.headers.get("location")
+
+        if not response.is_redirect or location is None:
+            break
+
+        url = urljoin(url, location)
+
+    if response.status_code == status_code_values.no_content and is_proxy_error(
+        response.headers
+    ):
+        # The scraping proxy has responded with a destructive error message
+        return (request_date, redirects, None, None, False)
+
+    body = response.content
+
+    header_content_type = response.headers.get("content-type")
+
+    # Only a bounded sample of the body is inspected if the header is missing
+    #  or inconsistent with the body
+    mime_type, encoding = content_detector.detect(body, url, header_content_type)
+
+    if is_text_mime_type(mime_type):
+        try:
+            content = body.decode(
+                encoding if encoding != "binary" else "utf-8", "replace"
+            )
+        except LookupError:
+            content = body.decode("utf-8", "replace")
+
+        content_type = header_content_type or get_content_type(mime_type, "utf-8")
+
+        if mime_type in HTML_MIME_TYPES and requires_javascript(content):
+            return (request_date, redirects, content, content_type, True)
+    else:
+        # Binary resources are stored like the files downloaded by the browser
+        try:
+            content = decode_content(body, mime_type, encoding)
+        except (UnicodeDecodeError, LookupError):
+            encoding = "binary"
+
+            content = decode_content(body, mime_type, encoding)
+
+        content_type = header_content_type or get_content_type(mime_type, encoding)
+
+    return (request_date, redirects, content, content_type, False)
@@ -1,12 +1,68 @@
+import hashlib
 import json
+import os
 
 from collections import Counter
 
 import click
 
+JOB_HASH_SIZE = 16
 
-def filter_completed_jobs(jobs, progress_path):
-    click.echo("Checking for already completed jobs ...")
+
+def job_hash(job):
+    """Returns the compact identity of a (rid, lui, random, url) job"""
+
+    return hashlib.blake2b(
+        json.dumps(list(job)).encode("utf-8"), digest_size=JOB_HASH_SIZE
+    ).hexdigest()
+
+
+def write_completed_job(file, job):
+    file.write(job_hash(job))
+    file.write("\n")
+
+
+def truncate_incomplete_progress(progress_path):
+    """Discards a truncated final line of the PROGRESS journal before appending"""
+
+    if not os.path.exists(progress_path) or is_legacy_progress(progress_path):
+        return
+
+    with open(progress_path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+
+        end = file.tell()
+        position = end
+
+        # Only the final line can be incomplete, so search backwards
+        while position > 0:
+            step = min(position, 4096)
+
+            file.seek(position - step)
+
+            newline = file.read(step).rfind(b"\n")
+
+            if newline != -1:
+                position = position - step + newline + 1
+
+                break
+
+            position -= step
+
+    if position != end:
+        os.truncate(progress_path, position)
+
+
+def is_legacy_progress(progress_path):
+    with open(progress_path, "r") as file:
+        return file.read(1) == "["
+
+
+def read_legacy_completed_jobs(progress_path):
+    """
+    Reads the legacy PROGRESS format of concatenated JSON job lists in
+    linear time and returns the completed job hashes.
+    """
 
     with open(progress_path, "r") as file:
         progress = file.read()
@@ -18,23 +74,78 @@ def filter_completed_jobs(jobs, progress_path):
 
     try:
         while json_parse_pos < len(progress):
-            parsed, json_len = json_decoder.raw_decode(progress[json_parse_pos:])
-
-            completed_jobs.update((tuple(parsed),))
+            parsed, json_parse_pos = json_decoder.raw_decode(progress, json_parse_pos)
 
-            json_parse_pos += json_len
+            completed_jobs[job_hash(parsed)] += 1
     except Exception as err:
         raise click.UsageError(
             click.style(f"{progress_path} has been corrupted.", fg="red")
         )
 
+    return completed_jobs
+
+
+def read_completed_jobs(progress_path):
+    """
+    Streams the PROGRESS journal of completed job hashes, one per line.
+    A truncated final line, e.g. from an interrupted scraping run, is ignored.
+    """
+
+    completed_jobs = Counter()
+
+    with open(progress_path, "r") as file:
+        for line in file:
+            if not line.endswith("\n"):
+                break
+
+            line = line[:-1]
+
+            if len(line) != (JOB_HASH_SIZE * 2):
+                raise click.UsageError(
+                    click.style(f"{progress_path} has been corrupted.", fg="red")
+                )
+
+            completed_jobs[line] += 1
+
+    return completed_jobs
+
+
+def upgrade_legacy_progress(progress_path):
+    """Rewrites a legacy PROGRESS file as a journal of completed job hashes"""
+
+    completed_jobs = read_legacy_completed_jobs(progress_path)
+
+    with open(f"{progress_path}.tmp", "w") as file:
+        for job, count in completed_jobs.items():
+            for _ in range(count):
+                file.write(job)
+                file.write("\n")
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(f"{progress_path}.tmp", progress_path)
+
+    return completed_jobs
+
+
+def filter_completed_jobs(jobs, progress_path):
+    click.echo("Checking for already completed jobs ...")
+
+    if is_legacy_progress(progress_path):
+        completed_jobs = upgrade_legacy_progress(progress_path)
+    else:
+        completed_jobs = read_completed_jobs(progress_path)
+
     filtered_jobs = []
 
     for job in jobs:
         job = tuple(job)
 
-        if completed_jobs[job] > 0:
-            completed_jobs[job] -= 1
+        hashed_job = job_hash(job)
+
+        if completed_jobs[hashed_job] > 0:
+            completed_jobs[hashed_job] -= 1
         else:
             filtered_jobs.append(job)
 
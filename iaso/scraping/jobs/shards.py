@@ -0,0 +1,70 @@
+import hashlib
+import heapq
+
+from collections import Counter
+
+from ..scheduler import job_host
+
+
+def host_hash(host):
+    return hashlib.blake2b(host.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def assign_hosts_to_shards(jobs, num_shards):
+    """
+    Assigns every host of the jobs to one of num_shards shards, such that all
+    jobs of a host are scraped by the same shard and the shards are balanced
+    by their number of jobs. The assignment only depends on the jobs and is
+    independent of their order, so every shard computes the same partition.
+    """
+
+    hosts = Counter(job_host(job) for job in jobs)
+
+    shards = [(0, index) for index in range(num_shards)]
+
+    assignment = dict()
+
+    # The largest hosts are placed first into the least loaded shard
+    for host, count in sorted(
+        hosts.items(), key=lambda item: (-item[1], host_hash(item[0]), item[0])
+    ):
+        load, index = heapq.heappop(shards)
+
+        assignment[host] = index
+
+        heapq.heappush(shards, (load + count, index))
+
+    return assignment
+
+
+def shard_jobs(jobs, index, num_shards):
+    """
+    Returns the jobs of the 1-based shard index out of num_shards in their
+    original order
+    """
+
+    assignment = assign_hosts_to_shards(jobs, num_shards)
+
+    return [job for job in jobs if assignment[job_host(job)] == index - 1]
+
+
+def split_jobs_into_shards(jobs, num_shards):
+    assignment = assign_hosts_to_shards(jobs, num_shards)
+
+    shards = [[] for _ in range(num_shards)]
+
+    for job in jobs:
+        shards[assignment[job_host(job)]].append(job)
+
+    return shards
+
+
+def shard_jobs_path(jobs_path, index, num_shards):
+    """Returns the path of the JOBS file of one shard next to the JOBS file"""
+
+    stem, dot, suffix = str(jobs_path).rpartition(".")
+
+    if dot == "" or "/" in suffix:
+        return f"{jobs_path}.{index}-of-{num_shards}"
+
+    return f"{stem}.{index}-of-{num_shards}.{suffix}"
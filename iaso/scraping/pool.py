@@ -1,23 +1,111 @@
 import asyncio
-import multiprocessing as mp
+import heapq
+import itertools
+import os
 import signal
 import time
 
+from multiprocessing.connection import wait
 from tempfile import TemporaryDirectory
 
 import psutil
 
-from filelock import FileLock
 from tqdm import tqdm
 
-from .worker import fetch_resource_worker
+from .scheduler import HostScheduler, job_host
+from .worker import scraping_worker
+
+
+class ScrapingWorker:
+    def __init__(self, ctx, tempdir, args):
+        self.conn, worker_conn = ctx.Pipe()
+
+        self.tempdir = TemporaryDirectory(dir=tempdir)
+
+        self.process = ctx.Process(
+            target=scraping_worker,
+            args=(worker_conn, self.tempdir.name, *args),
+        )
+        self.process.start()
+
+        # The worker leads its own process group which its browser inherits,
+        #  such that the entire tree can be killed without scanning for it
+        if hasattr(os, "setpgid"):
+            try:
+                os.setpgid(self.process.pid, self.process.pid)
+            except OSError:
+                pass
+
+        worker_conn.close()
+
+        self.job = None
+        self.timeout = None
+        self.deadline = None
+
+        self.orphans = []
+
+    def submit(self, job, timeout, deadline):
+        self.job = job
+        self.timeout = timeout
+        self.deadline = deadline
+
+        self.conn.send((job, timeout))
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except:
+            pass
+
+    def retire(self):
+        if not hasattr(os, "killpg"):
+            # Without process groups, remember the browser processes in case
+            #  they outlive the worker itself
+            try:
+                self.orphans = psutil.Process(pid=self.process.pid).children(
+                    recursive=True
+                )
+            except psutil.Error:
+                self.orphans = []
+
+    def kill(self):
+        if not hasattr(os, "killpg"):
+            self.retire()
+
+        self.process.kill()
+
+        self.sweep()
+
+    def sweep(self):
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        else:
+            for child in self.orphans:
+                try:
+                    child.kill()
+                except psutil.Error:
+                    pass
+
+            self.orphans = []
+
+    def cleanup(self):
+        self.sweep()
+
+        self.conn.close()
+
+        try:
+            self.tempdir.cleanup()
+        except:
+            pass
 
 
 async def scrape_resources_pool(
     ctx,
-    dump,
+    sink,
     tempdir,
-    proxy,
     proxy_address,
     chrome,
     jobs,
@@ -25,154 +113,327 @@ async def scrape_resources_pool(
     workers,
     timeout,
     log,
+    recycle_jobs,
+    recycle_memory,
+    engine,
+    block,
+    host_concurrency,
+    host_gap,
+    timeouts,
+    breaker,
+    feed,
 ):
-    coordinating_processes = set([proxy]) if proxy is not None else set()
+    loop = asyncio.get_event_loop()
+
+    # Jobs are only handed out while their host has a free slot
+    scheduler = HostScheduler(jobs, host_concurrency, host_gap)
 
-    scraping_pings_lock = tempdir / "pings.lock"
+    scraping_log_lock = tempdir / "log.lock"
+    scraping_log_lock.touch()
 
-    with tqdm(initial=(total_jobs - len(jobs)), total=total_jobs) as progress:
-        processes_timeout = dict()
-        cleanup_timeout = dict()
-        processes_tempdir = dict()
+    worker_args = (
+        proxy_address,
+        chrome,
+        timeout,
+        scraping_log_lock,
+        log,
+        recycle_jobs,
+        recycle_memory,
+        engine,
+        block,
+    )
+
+    with tqdm(initial=(total_jobs - len(scheduler)), total=total_jobs) as progress:
+        running_workers = set()
+        retiring_workers = dict()
+
+        # Timer heap of (deadline, tiebreaker, worker, job) entries, where
+        #  job is None for the shutdown deadline of a retiring worker
+        timers = []
+        tiebreaker = itertools.count()
+
+        wakeup_recv, wakeup_send = ctx.Pipe(False)
 
         final_timeout = [time.time() - 1]
 
+        def next_job():
+            job = scheduler.pop(time.time())
+
+            # Jobs of hosts which have failed to connect are short-circuited
+            while job is not None and breaker is not None:
+                if breaker.allows(job, time.time()):
+                    break
+
+                sink.put(job[0], breaker.short_circuit(job), job)
+
+                scheduler.complete(job, time.time())
+
+                progress.update(1)
+
+                # The running jobs must still be waited for
+                if len(scheduler) == 0:
+                    final_timeout[0] = time.time() + timeout * 4
+
+                job = scheduler.pop(time.time())
+
+            return job
+
+        def retire_worker(worker):
+            running_workers.discard(worker)
+
+            worker.retire()
+
+            retiring_workers[worker] = time.time() + timeout
+
+            heapq.heappush(
+                timers, (retiring_workers[worker], next(tiebreaker), worker, None)
+            )
+
+        def drop_job(job):
+            # Jobs without a ping are retried by the coordinator
+            if feed is not None:
+                feed.fail([job])
+
+        async def refill():
+            # Keep enough leased jobs queued to hand out to all workers
+            if (
+                feed is None
+                or feed.finished
+                or len(scheduler) >= workers
+                or time.time() < feed.next_poll
+            ):
+                return
+
+            leased = await loop.run_in_executor(None, feed.lease, workers * 2)
+
+            if len(leased) > 0:
+                scheduler.extend(leased, time.time())
+
+                progress.total += len(leased)
+                progress.refresh()
+
+            if feed.finished:
+                final_timeout[0] = time.time() + timeout * 4
+
         try:
 
             def signal_handler(signal, frame):
                 final_timeout[0] = time.time() + timeout * 4
-                jobs.clear()
+                scheduler.clear()
+
+                if feed is not None:
+                    feed.close()
 
                 print()
                 print("Shutting down the scraping worker pool ...")
                 print("Waiting for all running workers to complete ...")
                 print()
 
+                wakeup_send.send(None)
+
             signal.signal(signal.SIGINT, signal_handler)
 
-            while len(jobs) > 0 or (
-                len(processes_timeout) > 0 and time.time() < final_timeout[0]
-            ):
-                active_processes = set(mp.active_children()).difference(
-                    coordinating_processes
+            while (
+                len(scheduler) > 0
+                or (feed is not None and not feed.finished)
+                or (
+                    any(worker.job is not None for worker in running_workers)
+                    and time.time() < final_timeout[0]
                 )
+                or len(retiring_workers) > 0
+            ):
+                await refill()
 
-                finished_processes = []
+                # Spawn new long-lived workers if there is more work to do
+                idle_workers = [
+                    worker for worker in running_workers if worker.job is None
+                ]
 
-                with FileLock(scraping_pings_lock):
-                    for process, ptimeout in processes_timeout.items():
-                        if process not in active_processes:
-                            pass
-                        elif time.time() > ptimeout:
-                            process.kill()
-                        else:
-                            continue
+                for _ in range(
+                    min(
+                        workers - len(running_workers),
+                        len(scheduler) - len(idle_workers),
+                    )
+                ):
+                    worker = ScrapingWorker(ctx, tempdir, worker_args)
+
+                    running_workers.add(worker)
+                    idle_workers.append(worker)
 
-                        finished_processes.append(process)
+                for worker in idle_workers:
+                    job = next_job()
 
-                for _ in range(min(workers - len(active_processes), len(jobs))):
-                    try:
-                        rid, lui, random, url = jobs.pop()
-                    except IndexError:
+                    if job is None:
                         break
 
-                    worker_tempdir = TemporaryDirectory(dir=tempdir)
-
-                    process = ctx.Process(
-                        target=fetch_resource_worker,
-                        args=(
-                            dump,
-                            proxy_address,
-                            chrome,
-                            timeout,
-                            worker_tempdir.name,
-                            scraping_pings_lock,
-                            log,
-                            rid,
-                            lui,
-                            random,
-                            url,
-                        ),
+                    # Adaptive timeouts are derived from the latency of the host
+                    job_timeout = (
+                        timeouts.timeout(job_host(job))
+                        if timeouts is not None
+                        else timeout
                     )
 
-                    processes_timeout[process] = time.time() + timeout * 3
-                    processes_tempdir[process] = worker_tempdir
+                    worker.submit(job, job_timeout, time.time() + job_timeout * 3)
 
-                    process.start()
+                    heapq.heappush(
+                        timers, (worker.deadline, next(tiebreaker), worker, job)
+                    )
 
-                    if len(jobs) == 0:
+                    if len(scheduler) == 0:
                         final_timeout[0] = time.time() + timeout * 4
 
-                for process in finished_processes:
-                    try:
-                        for child in psutil.Process(pid=process.pid).children(
-                            recursive=True
-                        ):
-                            try:
-                                child.kill()
-                            except:
-                                pass
-                    except:
-                        pass
-
-                    try:
-                        processes_tempdir.pop(process).cleanup()
-                    except:
-                        pass
+                if len(scheduler) == 0 and (feed is None or feed.finished):
+                    # Idle workers can be shut down once all jobs have been handed out
+                    for worker in idle_workers:
+                        if worker.job is None and worker in running_workers:
+                            worker.stop()
 
-                    processes_timeout.pop(process)
-
-                    progress.update(1)
-
-                child_pids = set(
-                    process.pid for process in psutil.Process().children(recursive=True)
-                ).difference(process.pid for process in coordinating_processes)
-
-                active_pids = set(psutil.pids())
+                            retire_worker(worker)
 
                 progress.set_postfix(
                     {
-                        "workers": len(processes_timeout),
-                        "processes": len(cleanup_timeout),
+                        "workers": len(running_workers),
+                        "retiring": len(retiring_workers),
+                        **scheduler.depths(),
+                        **(
+                            {"open": breaker.open_hosts()}
+                            if breaker is not None
+                            else {}
+                        ),
                     }
                 )
 
-                finished_processes = []
+                # Sleep until a worker reports back, a process exits, a timer
+                #  expires or the pool is interrupted
+                wakeup = (
+                    final_timeout[0]
+                    if len(scheduler) == 0 and final_timeout[0] > time.time()
+                    else None
+                )
+
+                if len(timers) > 0:
+                    wakeup = min(timers[0][0], wakeup or timers[0][0])
+
+                # Wake up once the next host becomes available for idle workers
+                if any(worker.job is None for worker in running_workers):
+                    ready_time = scheduler.next_ready_time(time.time())
+
+                    if ready_time is not None:
+                        wakeup = min(ready_time, wakeup or ready_time)
+
+                # Wake up to lease more jobs from the coordinator
+                if feed is not None and not feed.finished and len(scheduler) < workers:
+                    wakeup = min(feed.next_poll, wakeup or feed.next_poll)
+
+                ready = set(
+                    await loop.run_in_executor(
+                        None,
+                        wait,
+                        [wakeup_recv]
+                        + [
+                            worker.conn
+                            for worker in running_workers
+                            if worker.job is not None
+                        ]
+                        + [
+                            worker.process.sentinel
+                            for worker in itertools.chain(
+                                running_workers, retiring_workers
+                            )
+                        ],
+                        None if wakeup is None else max(0, wakeup - time.time()),
+                    )
+                )
+
+                while wakeup_recv.poll():
+                    wakeup_recv.recv()
+
+                for worker in list(running_workers):
+                    if worker.job is not None and worker.conn in ready:
+                        try:
+                            ping, retire = worker.conn.recv()
+                        except EOFError:
+                            ping, retire = None, True
+
+                        if ping is not None:
+                            sink.put(worker.job[0], ping, worker.job)
+                        else:
+                            drop_job(worker.job)
+
+                        if breaker is not None:
+                            breaker.record(worker.job, ping, time.time())
+
+                        if timeouts is not None:
+                            if ping is not None:
+                                timeouts.observe_redirects(
+                                    job_host(worker.job), ping["redirects"]
+                                )
+                            else:
+                                timeouts.observe(job_host(worker.job), worker.timeout)
+
+                        scheduler.complete(worker.job, time.time())
+
+                        worker.job = None
+
+                        progress.update(1)
+
+                        if retire:
+                            retire_worker(worker)
+                    elif worker.process.sentinel in ready:
+                        if worker.job is not None:
+                            scheduler.complete(worker.job, time.time())
+
+                            drop_job(worker.job)
+
+                            if breaker is not None:
+                                breaker.record(worker.job, None, time.time())
+
+                            worker.job = None
 
-                with FileLock(scraping_pings_lock):
-                    for pid, ptimeout in cleanup_timeout.items():
-                        if pid not in active_pids:
-                            finished_processes.append(pid)
-                        elif time.time() > ptimeout:
-                            try:
-                                psutil.Process(pid=pid).kill()
-                            except:
-                                pass
+                            progress.update(1)
 
-                for process in finished_processes:
-                    cleanup_timeout.pop(process)
+                        retire_worker(worker)
 
-                for child in child_pids:
-                    if child not in cleanup_timeout:
-                        cleanup_timeout[child] = time.time() + timeout * 4
+                for worker in list(retiring_workers):
+                    if worker.process.sentinel in ready:
+                        retiring_workers.pop(worker)
 
-                await asyncio.sleep(0.1)
+                        worker.process.join()
+                        worker.cleanup()
+
+                # Kill all workers whose job or shutdown has timed out
+                while len(timers) > 0 and timers[0][0] <= time.time():
+                    deadline, _, worker, job = heapq.heappop(timers)
+
+                    if (
+                        job is not None
+                        and worker.job is job
+                        and worker.deadline == deadline
+                    ):
+                        worker.kill()
+
+                        scheduler.complete(job, time.time())
+
+                        drop_job(job)
+
+                        if timeouts is not None:
+                            timeouts.observe(job_host(job), worker.timeout)
+
+                        if breaker is not None:
+                            breaker.record(job, None, time.time())
+
+                        progress.update(1)
+
+                        retire_worker(worker)
+                    elif job is None and retiring_workers.get(worker) == deadline:
+                        worker.kill()
         finally:
             # Final cleanup of processes
-            with FileLock(scraping_pings_lock):
-                active_processes = set(mp.active_children()).difference(
-                    coordinating_processes
-                )
+            for worker in set(running_workers).union(retiring_workers):
+                if worker.process.is_alive():
+                    worker.kill()
 
-                for process, ptimeout in processes_timeout.items():
-                    if process in active_processes:
-                        process.kill()
+                worker.cleanup()
 
-                active_pids = set(psutil.pids())
-
-                for pid, ptimeout in cleanup_timeout.items():
-                    if pid in active_pids:
-                        try:
-                            psutil.Process(pid=pid).kill()
-                        except:
-                            pass
+            wakeup_recv.close()
+            wakeup_send.close()
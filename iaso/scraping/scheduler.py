@@ -0,0 +1,173 @@
+import hashlib
+import heapq
+import itertools
+import math
+
+from collections import deque
+from urllib.parse import urlparse
+
+
+def job_host(job):
+    rid, lui, random, url = job
+
+    return urlparse(url).hostname or ""
+
+
+def host_phase(host):
+    """Returns a stable pseudo-random phase in [0, 1) for the host"""
+
+    digest = hashlib.blake2b(host.encode("utf-8"), digest_size=8).digest()
+
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+class HostScheduler:
+    """
+    Hands out the scraping jobs such that at most max_per_host of them run
+    against the same host concurrently and that consecutive requests to the
+    same host are started at least min_gap seconds apart. If max_per_host is
+    None, the number of concurrent jobs per host is not limited.
+
+    Every host which has queued jobs and a free slot is either ready, or
+    waiting for its min_gap to pass. The ready hosts are served in
+    proportion to their number of jobs by stride scheduling: every host
+    advances its pass by 1 / its number of jobs whenever it is served, and
+    the ready host with the lowest pass is served next. The hosts are thus
+    interleaved like in the shuffled job order and all finish at about the
+    same time, instead of one host being served in a burst. Ties are broken
+    in round-robin order.
+    """
+
+    def __init__(self, jobs, max_per_host, min_gap):
+        self.max_per_host = max_per_host if max_per_host is not None else math.inf
+        self.min_gap = min_gap
+
+        self.queues = dict()
+        self.running = dict()
+        self.available_at = dict()
+
+        self.passes = dict()
+        self.totals = dict()
+        self.virtual_time = 0.0
+
+        self.queued = 0
+
+        self.tiebreaker = itertools.count()
+
+        self.ready = []
+        self.waiting = []
+
+        self.extend(jobs, 0)
+
+    def __len__(self):
+        return self.queued
+
+    def extend(self, jobs, now):
+        new_hosts = []
+
+        # Jobs are handed out per host in the same order as jobs.pop()
+        for job in reversed(jobs):
+            host = job_host(job)
+
+            if host not in self.queues:
+                self.queues[host] = deque()
+
+                new_hosts.append(host)
+
+            self.queues[host].append(job)
+            self.totals[host] = self.totals.get(host, 0) + 1
+
+        self.queued += len(jobs)
+
+        # Hosts which already had queued jobs are ready, waiting or capped
+        for host in new_hosts:
+            # New hosts join at the current pass instead of catching up in a
+            #  burst, and are staggered within their first stride
+            self.passes[host] = self.virtual_time + host_phase(host) / self.totals[host]
+
+            if self.running.get(host, 0) < self.max_per_host:
+                self.enqueue(host, now)
+
+    def enqueue(self, host, now):
+        available_at = self.available_at.get(host, now)
+
+        if available_at <= now:
+            heapq.heappush(self.ready, (self.passes[host], next(self.tiebreaker), host))
+        else:
+            heapq.heappush(self.waiting, (available_at, next(self.tiebreaker), host))
+
+    def pop(self, now):
+        """
+        Returns the next job which may be started at time now, or None if
+        all hosts with queued jobs are at their limit or are waiting
+        """
+
+        while len(self.waiting) > 0 and self.waiting[0][0] <= now:
+            _, _, host = heapq.heappop(self.waiting)
+
+            self.enqueue(host, now)
+
+        if len(self.ready) == 0:
+            return None
+
+        pass_, _, host = heapq.heappop(self.ready)
+
+        self.virtual_time = max(self.virtual_time, pass_)
+
+        self.passes[host] += 1.0 / self.totals[host]
+
+        queue = self.queues[host]
+
+        job = queue.popleft()
+
+        self.queued -= 1
+        self.running[host] = self.running.get(host, 0) + 1
+        self.available_at[host] = now + self.min_gap
+
+        if len(queue) == 0:
+            del self.queues[host]
+            del self.passes[host]
+            del self.totals[host]
+        elif self.running[host] < self.max_per_host:
+            self.enqueue(host, now)
+
+        return job
+
+    def complete(self, job, now):
+        host = job_host(job)
+
+        self.running[host] -= 1
+
+        if self.running[host] == 0:
+            del self.running[host]
+
+        # The host has just dropped below its limit and can be served again
+        if host in self.queues and self.running.get(host, 0) == self.max_per_host - 1:
+            self.enqueue(host, now)
+
+    def next_ready_time(self, now):
+        if len(self.ready) > 0:
+            return now
+
+        if len(self.waiting) > 0:
+            return self.waiting[0][0]
+
+        return None
+
+    def clear(self):
+        self.queues.clear()
+        self.passes.clear()
+        self.totals.clear()
+
+        self.ready.clear()
+        self.waiting.clear()
+
+        self.queued = 0
+
+    def depths(self):
+        return {
+            "queued": self.queued,
+            "ready": len(self.ready),
+            "waiting": len(self.waiting),
+            "capped": len(self.queues) - len(self.ready) - len(self.waiting),
+        }
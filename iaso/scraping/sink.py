@@ -0,0 +1,192 @@
+import os
+import queue
+import threading
+import time
+
+from collections import OrderedDict, defaultdict
+
+from ..dump import records_path
+from ..dump.blobs import BlobStoreWriter
+from ..dump.codecs import ZstdProviderCodec
+from ..dump.writer import ProviderDumpWriter
+from .jobs.resume import truncate_incomplete_progress, write_completed_job
+
+MAX_OPEN_WRITERS = 128
+MAX_BATCH_SIZE = 256
+
+
+class DumpSink:
+    """
+    Single writer for the scraping DUMP. Finished pings are handed to the
+    sink from the scraping pool, batched per provider and appended to the
+    provider's records file, of which at most MAX_OPEN_WRITERS are kept open.
+
+    Every flush_interval seconds, all written records are fsynced and
+    indexed before the flushed jobs are recorded in the PROGRESS file,
+    such that --resume never skips a job whose ping has not reached the disk.
+    The optional on_flush callback is called with the flushed jobs afterwards.
+
+    Every unique content is stored only once in the DUMP's blob store, and
+    the pings only keep the digest of their content.
+
+    With the zstd codec, the records and blobs of every provider are
+    compressed with a dictionary trained from the provider's first pings
+    while its writer is open, or taken from the previous zstd_dictionaries
+    DUMP.
+    """
+
+    def __init__(
+        self,
+        dump,
+        flush_interval,
+        on_flush=None,
+        codec="zlib",
+        zstd_dictionaries=None,
+    ):
+        self.dump = dump
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.codec = codec
+        self.zstd_dictionaries = zstd_dictionaries
+
+        self.queue = queue.Queue()
+
+        self.blobs = None
+        self.writers = OrderedDict()
+        self.dirty_writers = set()
+        self.unflushed_jobs = []
+
+        self.thread = None
+        self.error = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None and type is None:
+            raise self.error
+
+    def put(self, rid, ping, job):
+        # The pings must not pile up in the queue once the writer has failed
+        if self.error is not None:
+            raise self.error
+
+        self.queue.put((rid, ping, job))
+
+    def run(self):
+        try:
+            truncate_incomplete_progress(self.dump / "PROGRESS")
+
+            self.blobs = BlobStoreWriter(self.dump)
+
+            with open(self.dump / "PROGRESS", "a") as progress:
+                last_flush = time.time()
+
+                running = True
+
+                while running:
+                    batch = []
+
+                    try:
+                        batch.append(
+                            self.queue.get(
+                                timeout=max(
+                                    0, last_flush + self.flush_interval - time.time()
+                                )
+                            )
+                        )
+
+                        while len(batch) < MAX_BATCH_SIZE:
+                            batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        pass
+
+                    if None in batch:
+                        running = False
+
+                    self.write_batch(item for item in batch if item is not None)
+
+                    if not running or time.time() >= last_flush + self.flush_interval:
+                        self.flush(progress)
+
+                        last_flush = time.time()
+        except Exception as err:
+            self.error = err
+        finally:
+            while len(self.writers) > 0:
+                self.close_writer(*self.writers.popitem(last=False))
+
+            if self.blobs is not None:
+                self.blobs.close()
+
+    def write_batch(self, batch):
+        pings_per_provider = defaultdict(list)
+
+        for rid, ping, job in batch:
+            pings_per_provider[rid].append(ping)
+
+            self.unflushed_jobs.append(job)
+
+        for rid, pings in pings_per_provider.items():
+            writer = self.open_writer(rid)
+
+            self.dirty_writers.add(rid)
+
+            for ping in pings:
+                writer.write(ping)
+
+    def open_writer(self, rid):
+        writer = self.writers.get(rid)
+
+        if writer is not None:
+            self.writers.move_to_end(rid, last=True)
+
+            return writer
+
+        if len(self.writers) >= MAX_OPEN_WRITERS:
+            self.close_writer(*self.writers.popitem(last=False))
+
+        codec = (
+            ZstdProviderCodec(self.dump, rid, self.zstd_dictionaries)
+            if self.codec == "zstd"
+            else None
+        )
+
+        writer = self.writers[rid] = ProviderDumpWriter(
+            records_path(self.dump, rid), self.blobs, codec
+        )
+
+        return writer
+
+    def close_writer(self, rid, writer):
+        self.dirty_writers.discard(rid)
+
+        # Closing the writer flushes its records, which must reach the disk
+        #  before any of its jobs are recorded as completed
+        writer.close()
+
+    def flush(self, progress):
+        if len(self.unflushed_jobs) == 0:
+            return
+
+        for rid in self.dirty_writers:
+            self.writers[rid].flush()
+
+        self.dirty_writers.clear()
+
+        for job in self.unflushed_jobs:
+            write_completed_job(progress, job)
+
+        progress.flush()
+        os.fsync(progress.fileno())
+
+        if self.on_flush is not None:
+            self.on_flush(self.unflushed_jobs)
+
+        self.unflushed_jobs.clear()
@@ -0,0 +1,111 @@
+import math
+
+from collections import deque
+from urllib.parse import urlparse
+
+from ..datamine import Datamine
+
+ADAPTIVE_PERCENTILE = 0.95
+ADAPTIVE_MARGIN = 5.0
+ADAPTIVE_MIN_SAMPLES = 5
+ADAPTIVE_WINDOW = 100
+
+MIN_TIMEOUT = 5.0
+
+
+def url_host(url):
+    return urlparse(url).hostname or ""
+
+
+def total_response_time(response_times):
+    """
+    Returns the total response time in seconds of a redirection chain from
+    the response times in milliseconds of its hops, or None if none of them
+    has been recorded
+    """
+
+    response_times = [
+        response_time for response_time in response_times if response_time is not None
+    ]
+
+    if len(response_times) == 0:
+        return None
+
+    return sum(response_times) / 1000
+
+
+class AdaptiveTimeouts:
+    """
+    Learns the distribution of response times of every host during the run
+    and derives the per-job timeout for the next request to that host from a
+    high percentile plus a safety margin. The timeouts are clamped to the
+    global maximum, which is also used for hosts without enough samples.
+    """
+
+    def __init__(
+        self,
+        maximum,
+        minimum=MIN_TIMEOUT,
+        percentile=ADAPTIVE_PERCENTILE,
+        margin=ADAPTIVE_MARGIN,
+        min_samples=ADAPTIVE_MIN_SAMPLES,
+        window=ADAPTIVE_WINDOW,
+    ):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.window = window
+
+        self.samples = dict()
+
+    def observe(self, host, seconds):
+        samples = self.samples.get(host)
+
+        if samples is None:
+            samples = self.samples[host] = deque(maxlen=self.window)
+
+        # Requests which have timed out only tell us that the host took at
+        #  least as long as the maximum
+        samples.append(min(seconds, self.maximum))
+
+    def observe_redirects(self, host, redirects):
+        response_time = total_response_time(
+            redirect.get("response_time") for redirect in redirects
+        )
+
+        if response_time is not None:
+            self.observe(host, response_time)
+
+    def timeout(self, host):
+        samples = self.samples.get(host)
+
+        if samples is None or len(samples) < self.min_samples:
+            return self.maximum
+
+        samples = sorted(samples)
+
+        latency = samples[
+            min(len(samples) - 1, math.ceil(self.percentile * len(samples)) - 1)
+        ]
+
+        return max(self.minimum, min(self.maximum, latency + self.margin))
+
+    def seed_from_datamine(self, filepath):
+        """
+        Seeds the latency distributions from the response times recorded in
+        the pings of a previous DATAMINE file
+        """
+
+        for provider in Datamine(filepath).providers:
+            for ping in provider.pings:
+                if len(ping.redirects) == 0 or ping.redirects[0].url is None:
+                    continue
+
+                response_time = total_response_time(
+                    redirect.response_time for redirect in ping.redirects
+                )
+
+                if response_time is not None:
+                    self.observe(url_host(ping.redirects[0].url), response_time)
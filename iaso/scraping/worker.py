@@ -1,9 +1,6 @@
 import asyncio
-import gzip
-import json
 import logging
 import os
-import pickle
 import signal
 import sys
 import traceback
@@ -11,97 +8,199 @@ import warnings
 
 from urllib.parse import urlparse
 
+import psutil
+
 from filelock import FileLock
 
-from .ftp import scrape_ftp_resource
+from .ftp import FtpConnectionPool, scrape_ftp_resource
 from .http import scrape_http_resource
+from .http.pyppeteer import PersistentBrowser
+from .http.static import (
+    STATIC_HTTP_ERRORS,
+    scrape_static_http_resource,
+    static_http_client,
+)
 
 
-def fetch_resource_worker(
-    dump,
+def scraping_worker(
+    conn,
+    tempdir,
     proxy_address,
     chrome,
     timeout,
-    tempdir,
-    scraping_pings_lock,
+    scraping_log_lock,
     log,
-    rid,
-    lui,
-    random,
-    url,
+    recycle_jobs,
+    recycle_memory,
+    engine,
+    block,
 ):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Lead a new process group which the browser will inherit
+    if hasattr(os, "setpgid"):
+        try:
+            os.setpgid(0, 0)
+        except OSError:
+            pass
+
+    loop = asyncio.new_event_loop()
+
+    coro = scraping_worker_loop(
+        conn,
+        proxy_address,
+        chrome,
+        timeout,
+        tempdir,
+        scraping_log_lock,
+        log,
+        recycle_jobs,
+        recycle_memory,
+        engine,
+        block,
+    )
+
+    asyncio.set_event_loop(loop)
+
+    logging.getLogger("asyncio").setLevel(logging.CRITICAL + 1)
+    warnings.filterwarnings("ignore")
+
     try:
-        signal.signal(signal.SIGINT, signal.SIG_IGN)
-
-        loop = asyncio.new_event_loop()
-
-        coro = fetch_resource(
-            dump,
-            proxy_address,
-            chrome,
-            timeout,
-            tempdir,
-            scraping_pings_lock,
-            rid,
-            lui,
-            random,
-            url,
-        )
-
-        asyncio.set_event_loop(loop)
-
-        logging.getLogger("asyncio").setLevel(logging.CRITICAL + 1)
-        warnings.filterwarnings("ignore")
-
-        return loop.run_until_complete(coro)
-    except:
-        if log != "null":
-            if os.path.exists(scraping_pings_lock):
-                with FileLock(scraping_pings_lock):
-                    try:
-                        if log == "stderr":
-                            logf = sys.stderr
-                        else:
-                            logf = open("scrape.log", "a")
-
-                        logf.write(
-                            f"Error at rid={rid} lui={lui} url={url} random={random}:\n"
-                        )
-
-                        traceback.print_exc(file=logf)
-                    finally:
-                        if log == "scrape.log":
-                            logf.close()
+        loop.run_until_complete(coro)
+    finally:
+        conn.close()
 
 
-async def fetch_resource(
-    dump,
+async def scraping_worker_loop(
+    conn,
     proxy_address,
     chrome,
     timeout,
     tempdir,
-    scraping_pings_lock,
-    rid,
-    lui,
-    random,
-    url,
+    scraping_log_lock,
+    log,
+    recycle_jobs,
+    recycle_memory,
+    engine,
+    block,
+):
+    loop = asyncio.get_event_loop()
+
+    # The browser is only launched once the first job requires it
+    async with PersistentBrowser(
+        tempdir, proxy_address, chrome
+    ) as browser, static_http_client(
+        proxy_address, timeout
+    ) as client, FtpConnectionPool() as ftp:
+        completed_jobs = 0
+
+        while True:
+            # Wait for the next job without blocking the browser connection
+            try:
+                job = await loop.run_in_executor(None, conn.recv)
+            except EOFError:
+                break
+
+            if job is None:
+                break
+
+            # Every job comes with its own, possibly adaptive, timeout
+            (rid, lui, random, url), job_timeout = job
+
+            try:
+                ping = await fetch_resource(
+                    browser,
+                    client,
+                    ftp,
+                    engine,
+                    block,
+                    job_timeout,
+                    tempdir,
+                    lui,
+                    random,
+                    url,
+                )
+            except:
+                ping = None
+
+                log_worker_error(scraping_log_lock, log, rid, lui, random, url)
+
+            completed_jobs += 1
+
+            # Recycle this worker after too many jobs or if it has grown too large
+            retire = completed_jobs >= recycle_jobs or (
+                psutil.Process().memory_info().rss + browser.memory()
+            ) > (recycle_memory * 1024 * 1024)
+
+            # The finished ping is written to the DUMP by the scraping pool
+            conn.send((ping, retire))
+
+            if retire:
+                break
+
+
+def log_worker_error(scraping_log_lock, log, rid, lui, random, url):
+    if log != "null":
+        if os.path.exists(scraping_log_lock):
+            with FileLock(scraping_log_lock):
+                try:
+                    if log == "stderr":
+                        logf = sys.stderr
+                    else:
+                        logf = open("scrape.log", "a")
+
+                    logf.write(
+                        f"Error at rid={rid} lui={lui} url={url} random={random}:\n"
+                    )
+
+                    traceback.print_exc(file=logf)
+                finally:
+                    if log == "scrape.log":
+                        logf.close()
+
+
+async def fetch_http_resource(browser, client, engine, block, timeout, tempdir, url):
+    if engine != "browser":
+        try:
+            (
+                request_date,
+                redirects,
+                content,
+                content_type,
+                requires_browser,
+            ) = await scrape_static_http_resource(client, timeout, url)
+
+            if engine == "http" or not requires_browser:
+                return (request_date, redirects, content, content_type)
+        except STATIC_HTTP_ERRORS:
+            if engine == "http":
+                raise
+
+    # Fall back to rendering the resource in the browser
+    return await scrape_http_resource(tempdir, browser, timeout, url, block)
+
+
+async def fetch_resource(
+    browser, client, ftp, engine, block, timeout, tempdir, lui, random, url
 ):
     try:
         parsed = urlparse(url)
 
         if parsed.scheme == "http" or parsed.scheme == "https":
             request_date, redirects, content, content_type = await asyncio.wait_for(
-                scrape_http_resource(tempdir, proxy_address, chrome, timeout, url),
+                fetch_http_resource(
+                    browser, client, engine, block, timeout, tempdir, url
+                ),
                 timeout=(timeout * 2),
             )
         elif parsed.scheme == "ftp":
             request_date, redirects, content, content_type = await asyncio.wait_for(
-                scrape_ftp_resource(url, timeout), timeout=(timeout * 2)
+                scrape_ftp_resource(ftp, tempdir, url, timeout), timeout=(timeout * 2)
             )
         else:
             raise Exception(f"Unknown resource scheme {parsed.scheme}")
 
-        ping = {
+        return {
             "lui": lui,
             "random": random,
             "date": str(request_date),
@@ -109,14 +208,5 @@ async def fetch_resource(
             "content": content,
             "content-type": content_type,
         }
-
-        if os.path.exists(scraping_pings_lock):
-            with FileLock(scraping_pings_lock):
-                with gzip.open(dump / f"pings_{rid}.gz", "ab") as file:
-                    pickle.dump(ping, file)
-
-                with open(dump / "PROGRESS", "a") as file:
-                    json.dump((rid, lui, random, url), file)
-
     except asyncio.TimeoutError:
-        pass
+        return None
@@ -139,20 +139,21 @@ setup_kwargs.update(
         ],
     },
     packages=(find_packages(exclude=["*.tests", "*.tests.*", "tests.*", "tests"])),
-    package_data={"iaso.curation.pyppeteer": ["*.js", "*.css"]},
+    package_data={
+        "iaso.curation.pyppeteer": ["*.js", "*.css"],
+        "iaso.scraping.http": ["*.js"],
+    },
     install_requires=[
         "aioconsole==0.1.16",
         "async-generator==1.10",
-        "beautifulsoup4==4.9.1",
         "certifi==2020.4.5.1",
         "chardet==3.0.4",
         "click==7.1.2",
         "click-completion==0.5.2",
-        "eml-parser==1.14.1",
+        "cryptography==3.1",
         "filelock==3.0.12",
         "httpx==0.13.3",
         "jsonschema==3.2.0",
-        "lxml==4.5.2",
         "psutil==5.7.0",
         "puremagic==1.8",
         "py-cpuinfo==5.0.0",
@@ -165,6 +166,10 @@ setup_kwargs.update(
         "urllib3==1.25.9",
         "xeger==0.3.5",
     ],
+    extras_require={
+        "benchmarks": ["beautifulsoup4==4.9.1", "eml-parser==1.14.1", "lxml==4.5.2"],
+        "zstd": ["zstandard==0.14.0"],
+    },
     setup_requires=(
         [
             "setuptools >= 40.8.0",
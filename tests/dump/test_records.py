@@ -0,0 +1,415 @@
+import gzip
+import json
+import os
+import pickle
+import random
+
+from collections import defaultdict
+
+import pytest
+
+from iaso.dump import blobs_path, index_path, records_path
+from iaso.dump.blobs import (
+    BinaryContent,
+    BlobStoreReader,
+    BlobStoreWriter,
+    read_blob_index,
+)
+from iaso.dump.codecs import ZSTD_TRAINING_SAMPLES, find_dictionaries
+from iaso.dump2datamine import generate_datamine_from_dump
+from iaso.dump.index import read_index
+from iaso.dump.legacy import convert_legacy_dump_file
+from iaso.dump.merge import merge_dump_shards
+from iaso.dump.reader import dump2pings, read_dump_index
+from iaso.dump.writer import ProviderDumpWriter
+
+
+def generate_ping(lui, status=200, content="<html></html>"):
+    return {
+        "lui": lui,
+        "random": False,
+        "date": "2020-07-01 12:00:00",
+        "redirects": [
+            {
+                "url": f"https://example.org/{lui}",
+                "ip_port": "127.0.0.1:443",
+                "response_time": 42,
+                "status": status,
+                "dns_error": False,
+                "ssl_error": False,
+                "invalid_response": False,
+            }
+        ],
+        "content": content,
+        "content-type": "text/html; charset=utf-8",
+    }
+
+
+def write_pings(path, pings, blobs=None, codec=None):
+    writer = ProviderDumpWriter(path, blobs, codec)
+
+    for ping in pings:
+        writer.write(ping)
+
+    writer.close()
+
+
+class TestDumpRecords:
+    def test_pings_roundtrip_through_records_and_index(self, tmp_path):
+        pings = [generate_ping("a"), generate_ping("b", 404, None), generate_ping("a")]
+
+        write_pings(records_path(tmp_path, 1), pings)
+
+        errors = defaultdict(list)
+
+        assert list(dump2pings(records_path(tmp_path, 1), errors)) == pings
+        assert len(errors) == 0
+
+        entries = read_index(index_path(records_path(tmp_path, 1)))
+
+        assert [(entry.lui, entry.ping) for entry in entries] == [
+            ("a", 0),
+            ("b", 0),
+            ("a", 1),
+        ]
+        assert [entry.status for entry in entries] == [200, 404, 200]
+        assert [entry.empty_content for entry in entries] == [False, True, False]
+
+    def test_unflushed_records_are_not_indexed(self, tmp_path):
+        writer = ProviderDumpWriter(records_path(tmp_path, 1))
+
+        writer.write(generate_ping("a"))
+        writer.flush()
+        writer.write(generate_ping("b"))
+
+        assert [entry.lui for entry in read_index(writer.index_path)] == ["a"]
+
+        writer.close()
+
+        assert [entry.lui for entry in read_index(writer.index_path)] == ["a", "b"]
+
+    def test_reopening_discards_unindexed_data(self, tmp_path):
+        path = records_path(tmp_path, 1)
+
+        write_pings(path, [generate_ping("a")])
+
+        # Simulate an interrupted write of an unindexed record
+        with open(path, "ab") as file:
+            file.write(b"\xa7\x1d\x01garbage")
+
+        with open(index_path(path), "a") as file:
+            file.write('{"lui": "trunc')
+
+        write_pings(path, [generate_ping("a")])
+
+        errors = defaultdict(list)
+
+        assert len(list(dump2pings(path, errors))) == 2
+        assert len(errors) == 0
+        assert [entry.ping for entry in read_dump_index(path)] == [0, 1]
+
+    def test_reopening_discards_unflushed_pings_and_blobs(self, tmp_path):
+        path = records_path(tmp_path, 1)
+
+        blobs = BlobStoreWriter(tmp_path)
+        writer = ProviderDumpWriter(path, blobs)
+
+        writer.write(generate_ping("a", content="<p>a</p>"))
+        writer.flush()
+        writer.write(generate_ping("b", content="<p>b</p>"))
+
+        # Simulate a crash after the unflushed records reached the disk
+        writer.records.flush()
+        blobs.records.flush()
+
+        write_pings(
+            path, [generate_ping("c", content="<p>c</p>")], BlobStoreWriter(tmp_path)
+        )
+
+        errors = defaultdict(list)
+
+        assert [ping["lui"] for ping in dump2pings(path, errors)] == ["a", "c"]
+        assert len(errors) == 0
+
+    def test_missing_index_is_reconstructed(self, tmp_path):
+        path = records_path(tmp_path, 1)
+
+        write_pings(path, [generate_ping("a"), generate_ping("b")])
+
+        os.remove(index_path(path))
+
+        assert [(entry.lui, entry.ping) for entry in read_dump_index(path)] == [
+            ("a", 0),
+            ("b", 0),
+        ]
+
+    def test_reopening_without_index_keeps_the_valid_records(self, tmp_path):
+        path = records_path(tmp_path, 1)
+
+        write_pings(path, [generate_ping("a"), generate_ping("b")])
+
+        os.remove(index_path(path))
+
+        # Simulate an interrupted write after the index had been lost
+        with open(path, "ab") as file:
+            file.write(b"\xa7\x1d\x01garbage")
+
+        write_pings(path, [generate_ping("a")])
+
+        errors = defaultdict(list)
+
+        assert len(list(dump2pings(path, errors))) == 3
+        assert len(errors) == 0
+        assert [(entry.lui, entry.ping) for entry in read_index(index_path(path))] == [
+            ("a", 0),
+            ("b", 0),
+            ("a", 1),
+        ]
+
+    def test_legacy_dumps_are_converted(self, tmp_path):
+        legacy_path = tmp_path / "pings_1.gz"
+
+        pings = [generate_ping("a"), generate_ping("b"), generate_ping("c")]
+
+        for ping in pings:
+            with gzip.open(legacy_path, "ab") as file:
+                pickle.dump(ping, file)
+
+        errors = defaultdict(list)
+
+        convert_legacy_dump_file(legacy_path, records_path(tmp_path, 1), errors)
+
+        assert len(errors) == 0
+        assert list(dump2pings(records_path(tmp_path, 1), errors)) == pings
+
+    def test_shards_are_merged(self, tmp_path):
+        shards = [tmp_path / "shard0", tmp_path / "shard1"]
+
+        for i, shard in enumerate(shards):
+            shard.mkdir()
+
+            write_pings(records_path(shard, 1), [generate_ping("a", 200 + i)])
+            (shard / "PROGRESS").write_text(f"{i:032x}\n")
+
+        (shards[0] / "ENVIRONMENT").write_text("{}")
+
+        dump = tmp_path / "dump"
+        dump.mkdir()
+
+        errors = defaultdict(list)
+
+        merge_dump_shards(dump, shards, errors)
+
+        pings = list(dump2pings(records_path(dump, 1), errors))
+
+        assert len(errors) == 0
+        assert [ping["redirects"][0]["status"] for ping in pings] == [200, 201]
+        assert [entry.ping for entry in read_dump_index(records_path(dump, 1))] == [
+            0,
+            1,
+        ]
+        assert (dump / "PROGRESS").read_text() == f"{0:032x}\n{1:032x}\n"
+        assert (dump / "ENVIRONMENT").exists()
+
+    def test_shard_dumps_are_combined_into_datamine(self, tmp_path):
+        dumps = [tmp_path / "dump1", tmp_path / "dump2"]
+
+        for i, dump in enumerate(dumps):
+            dump.mkdir()
+
+            write_pings(records_path(dump, 1), [generate_ping("a", 200 + i)])
+            write_pings(records_path(dump, 2 + i), [generate_ping("b")])
+            (dump / "ENVIRONMENT").write_text(json.dumps({"shard": f"{i + 1}/2"}))
+
+        errors = generate_datamine_from_dump(dumps, tmp_path / "datamine.json", False)
+
+        with open(tmp_path / "datamine.json", "r") as file:
+            datamine = json.load(file)
+
+        assert len(errors) == 0
+        assert datamine["environment"] == {"shard": "1/2, 2/2"}
+        assert sorted(provider["id"] for provider in datamine["providers"]) == [1, 2, 3]
+
+        (provider,) = [p for p in datamine["providers"] if p["id"] == 1]
+
+        assert [ping["redirects"][0]["status"] for ping in provider["pings"]] == [
+            200,
+            201,
+        ]
+
+    def test_parallel_conversion_matches_sequential_conversion(self, tmp_path):
+        dump = tmp_path / "dump"
+        dump.mkdir()
+
+        for rid in range(1, 6):
+            write_pings(
+                records_path(dump, rid),
+                [generate_ping(str(lui), 200 + rid) for lui in range(rid * 3)],
+            )
+
+        (dump / "ENVIRONMENT").write_text(json.dumps({}))
+
+        # Corrupt the payload of one record of the second provider
+        with open(records_path(dump, 2), "r+b") as file:
+            file.seek(-1, os.SEEK_END)
+            file.write(b"\x00")
+
+        sequential_errors = generate_datamine_from_dump(
+            dump, tmp_path / "sequential.json", False
+        )
+        parallel_errors = generate_datamine_from_dump(
+            dump, tmp_path / "parallel.json", False, jobs=3
+        )
+
+        assert (tmp_path / "parallel.json").read_text() == (
+            tmp_path / "sequential.json"
+        ).read_text()
+        assert {path: len(errs) for path, errs in parallel_errors.items()} == {
+            records_path(dump, 2): 1
+        }
+        assert {path: len(errs) for path, errs in sequential_errors.items()} == {
+            records_path(dump, 2): 1
+        }
+
+    def test_unchanged_providers_are_spliced_from_the_cache(self, tmp_path):
+        dump = tmp_path / "dump"
+        dump.mkdir()
+
+        for rid in (1, 2):
+            write_pings(records_path(dump, rid), [generate_ping("a")])
+
+        (dump / "ENVIRONMENT").write_text(json.dumps({}))
+
+        cache = tmp_path / "cache"
+
+        generate_datamine_from_dump(
+            dump, tmp_path / "datamine.json", False, cache=cache
+        )
+
+        # Mark the cached pings of the first provider to detect their reuse
+        (cached_pings,) = cache.glob("provider_1.*.pings.json")
+        cached_pings.write_text("[]")
+
+        write_pings(records_path(dump, 2), [generate_ping("b")])
+
+        errors = generate_datamine_from_dump(
+            dump, tmp_path / "datamine.json", False, jobs=2, cache=cache
+        )
+
+        with open(tmp_path / "datamine.json", "r") as file:
+            datamine = json.load(file)
+
+        assert len(errors) == 0
+        assert [
+            [ping["lui"] for ping in provider["pings"]]
+            for provider in datamine["providers"]
+        ] == [[], ["a", "b"]]
+        assert len(list(cache.glob("provider_2.*.pings.json"))) == 1
+
+    def test_identical_contents_are_stored_once(self, tmp_path):
+        pings = [generate_ping("a"), generate_ping("b"), generate_ping("c", 404, None)]
+
+        blobs = BlobStoreWriter(tmp_path)
+        write_pings(records_path(tmp_path, 1), pings, blobs)
+        blobs.close()
+
+        entries = read_dump_index(records_path(tmp_path, 1))
+
+        assert len(read_blob_index(tmp_path)) == 1
+        assert [entry.empty_content for entry in entries] == [False, False, True]
+
+        errors = defaultdict(list)
+
+        contents = [
+            ping["content"] for ping in dump2pings(records_path(tmp_path, 1), errors)
+        ]
+
+        assert contents == ["<html></html>", "<html></html>", None]
+        assert len(errors) == 0
+
+        # Merged shards resolve their contents through the merged blob store
+        dump = tmp_path / "dump"
+        dump.mkdir()
+
+        merge_dump_shards(dump, [tmp_path], errors)
+
+        (ping, *_) = dump2pings(records_path(dump, 1), errors)
+
+        assert blobs_path(dump).exists()
+        assert ping["content"] == "<html></html>"
+        assert len(errors) == 0
+
+    def test_binary_contents_are_kept_in_the_blob_store(self, tmp_path):
+        data = bytes(range(256)) * 4
+
+        # The binary content is sent from the scraping workers to the sink
+        content = pickle.loads(pickle.dumps(BinaryContent(data, "image/png")))
+
+        blobs = BlobStoreWriter(tmp_path)
+        write_pings(
+            records_path(tmp_path, 1), [generate_ping("a", content=content)], blobs
+        )
+        blobs.close()
+
+        errors = defaultdict(list)
+
+        (ping,) = dump2pings(records_path(tmp_path, 1), errors)
+
+        assert ping["content"] == content
+        assert content.startswith("blob:image/png;blake2b=")
+
+        digest = content.split("blake2b=")[1].split(";")[0]
+
+        with BlobStoreReader(tmp_path) as reader:
+            assert reader.get(digest) == data
+
+    def test_zstd_records_use_trained_provider_dictionaries(self, tmp_path):
+        pytest.importorskip("zstandard")
+
+        from iaso.dump.codecs import ZstdProviderCodec
+
+        rng = random.Random(42)
+
+        boilerplate = " ".join(str(rng.random()) for _ in range(500))
+
+        pings = [
+            generate_ping(str(i), content=f"{boilerplate} {rng.random()}")
+            for i in range(ZSTD_TRAINING_SAMPLES + 10)
+        ]
+
+        shard = tmp_path / "shard"
+        shard.mkdir()
+
+        blobs = BlobStoreWriter(shard)
+        write_pings(records_path(shard, 1), pings, blobs, ZstdProviderCodec(shard, 1))
+        blobs.close()
+
+        ((rid, dict_id),) = find_dictionaries(shard)
+
+        assert rid == 1 and dict_id != 0
+
+        errors = defaultdict(list)
+
+        contents = [ping["content"] for ping in pings]
+
+        assert [
+            ping["content"] for ping in dump2pings(records_path(shard, 1), errors)
+        ] == contents
+        assert len(errors) == 0
+
+        # A later run reuses the dictionary of the previous DUMP right away
+        codec = ZstdProviderCodec(tmp_path, 1, previous=shard)
+
+        assert codec.trained
+        assert list(find_dictionaries(tmp_path)) == [(1, dict_id)]
+
+        # Merged shards keep the dictionaries of their zstd records
+        dump = tmp_path / "dump"
+        dump.mkdir()
+
+        merge_dump_shards(dump, [shard], errors)
+
+        assert [
+            ping["content"] for ping in dump2pings(records_path(dump, 1), errors)
+        ] == contents
+        assert len(errors) == 0
@@ -0,0 +1,21 @@
+from iaso.scraping.http.blocking import create_blocking_profile
+
+
+class TestBlockingProfile:
+    def test_resource_types_and_hosts_are_blocked(self, tmp_path):
+        block_hosts = tmp_path / "hosts"
+        block_hosts.write_text("# Blocked hosts\ncdn.example.org\n\n")
+
+        profile = create_blocking_profile(["image", "trackers"], block_hosts)
+
+        assert profile.blocks("Image", "https://example.org/logo.png")
+        assert not profile.blocks("Script", "https://example.org/app.js")
+        assert profile.blocks("Script", "https://www.google-analytics.com/ga.js")
+        assert profile.blocks("Script", "https://cdn.example.org/app.js")
+        assert profile.blocks("Script", "https://a.cdn.example.org/app.js")
+        assert not profile.blocks("Script", "https://evilcdn.example.org/app.js")
+
+        assert {"urlPattern": "*", "resourceType": "Image"} in profile.patterns()
+
+    def test_nothing_is_blocked_by_default(self):
+        assert create_blocking_profile([], None) is None
@@ -0,0 +1,64 @@
+from iaso.scraping.breaker import HostCircuitBreaker
+
+
+def make_ping(dns_error):
+    return {
+        "redirects": [
+            {
+                "url": "http://dead.org/x",
+                "ip_port": None,
+                "response_time": 10,
+                "status": None if dns_error else 200,
+                "dns_error": dns_error,
+                "ssl_error": False,
+                "invalid_response": False,
+            }
+        ]
+    }
+
+
+def make_job(lui):
+    return (1, lui, False, f"http://dead.org/{lui}")
+
+
+class TestHostCircuitBreaker:
+    def test_host_is_short_circuited_and_probed(self):
+        breaker = HostCircuitBreaker(2, 10)
+
+        breaker.record(make_job("a"), make_ping(True), 0)
+        assert breaker.allows(make_job("b"), 0)
+
+        breaker.record(make_job("b"), make_ping(True), 0)
+        assert not breaker.allows(make_job("c"), 5)
+
+        ping = breaker.short_circuit(make_job("c"))
+
+        assert ping["short_circuited"] is True
+        assert ping["lui"] == "c"
+        assert ping["redirects"][0]["url"] == "http://dead.org/c"
+        assert ping["redirects"][0]["dns_error"] is True
+
+        # Only a single probe is let through after the cooldown
+        probe = make_job("d")
+
+        assert breaker.allows(probe, 10)
+        assert not breaker.allows(make_job("e"), 10)
+
+        breaker.record(probe, make_ping(False), 11)
+
+        assert breaker.allows(make_job("e"), 11)
+        assert breaker.open_hosts() == 0
+
+    def test_failed_probe_reopens_the_host(self):
+        breaker = HostCircuitBreaker(1, 10)
+
+        breaker.record(make_job("a"), make_ping(True), 0)
+
+        probe = make_job("b")
+
+        assert breaker.allows(probe, 10)
+
+        breaker.record(probe, make_ping(True), 12)
+
+        assert not breaker.allows(make_job("c"), 21)
+        assert breaker.allows(make_job("c"), 22)
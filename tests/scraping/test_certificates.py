@@ -0,0 +1,40 @@
+from iaso.scraping.http.certificates import (
+    CertificateAuthority,
+    collect_https_hostnames,
+)
+
+
+class TestCertificateAuthority:
+    def test_certificates_are_minted_once_and_cached(self, tmp_path):
+        certificates = CertificateAuthority(tmp_path)
+
+        certpath = certificates.certificate("example.org")
+        minted = certpath.read_bytes()
+
+        assert certificates.certificate("example.org") == certpath
+        assert certpath.read_bytes() == minted
+
+        context = certificates.context("example.org")
+
+        assert certificates.cached_context("example.org") is context
+        assert certificates.context("[::1]") is not context
+
+        # The certificate authority and its certificates are reused across runs
+        reloaded = CertificateAuthority(tmp_path)
+
+        assert reloaded.cacert == certificates.cacert
+        assert reloaded.certificate("example.org").read_bytes() == minted
+
+    def test_https_hostnames_are_collected(self):
+        assert (
+            collect_https_hostnames(
+                [
+                    "https://example.org/a",
+                    "http://example.com/",
+                    "https://example.org/b",
+                    "ftp://example.net/",
+                    "https://127.0.0.1:8443/",
+                ]
+            )
+            == ["127.0.0.1", "example.org"]
+        )
@@ -0,0 +1,103 @@
+import tempfile
+
+from iaso.scraping.content_type import (
+    CONTENT_PREFIX_SIZE,
+    ContentDetector,
+    content_reference,
+    content_sample,
+    file_sample,
+    url_pattern,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + bytes(64)
+
+
+class TestContentDetector:
+    def test_samples_are_bounded(self):
+        content = b"a" * (10 * CONTENT_PREFIX_SIZE)
+
+        assert len(content_sample(content)) < 2 * CONTENT_PREFIX_SIZE
+        assert content_sample(b"short") == b"short"
+
+        with tempfile.TemporaryFile() as file:
+            file.write(content)
+
+            assert file_sample(file) == content_sample(content)
+
+    def test_consistent_headers_are_trusted(self):
+        detector = ContentDetector()
+
+        assert detector.detect(
+            "Grüße".encode("latin-1"), "https://a.org/1", "text/plain; charset=latin-1"
+        ) == ("text/plain", "latin-1")
+
+        # A text header is not trusted for binary content
+        assert detector.detect(PNG, "https://a.org/2", "text/html") == (
+            "image/png",
+            "binary",
+        )
+
+    def test_detections_are_memoised_per_url_pattern(self):
+        detector = ContentDetector()
+
+        assert url_pattern("https://a.org/entry/12/x.txt") == url_pattern(
+            "https://a.org/entry/34/y.txt"
+        )
+
+        mime_type, encoding = detector.detect(b"plain text", "https://a.org/e/1.txt")
+
+        assert detector.memo[(url_pattern("https://a.org/e/1.txt"), None)] == (
+            mime_type,
+            encoding,
+        )
+        assert detector.detect(b"more text", "https://a.org/e/2.txt") == (
+            mime_type,
+            encoding,
+        )
+
+    def test_binary_contents_are_referenced(self):
+        content_type, content = ContentDetector().decode(PNG, "https://a.org/1.png")
+
+        assert content_type == "image/png; charset=binary"
+        assert content == content_reference(PNG, "image/png")
+        assert content.endswith(f";length={len(PNG)}")
+
+    def test_misleading_samples_are_decoded(self):
+        content = b"a" * (2 * CONTENT_PREFIX_SIZE) + "é".encode("utf-8")
+
+        content_type, decoded = ContentDetector().decode(content, "https://a.org/1.txt")
+
+        assert decoded.endswith("é")
+
+    def test_ascii_samples_are_decoded_as_utf_8(self):
+        # The non-ASCII text lies outside of the sampled prefix and suffix
+        content = (
+            b"a" * (2 * CONTENT_PREFIX_SIZE)
+            + "Müller".encode("utf-8")
+            + b"a" * (2 * CONTENT_PREFIX_SIZE)
+        )
+
+        detector = ContentDetector()
+
+        mime_type, encoding = detector.detect(content, "https://a.org/1.txt")
+
+        assert encoding == "utf-8"
+        assert "Müller" in content.decode(encoding, "replace")
+
+        content_type, decoded = detector.decode(content, "https://a.org/2.txt")
+
+        assert content_type.endswith("charset=utf-8")
+        assert "Müller" in decoded
+
+    def test_files_are_decoded_like_contents(self):
+        text = ("Grüße " * (CONTENT_PREFIX_SIZE // 4)).encode("utf-8")
+        # The non-UTF-8 character lies outside of the sampled prefix and suffix
+        misleading = b"a" * CONTENT_PREFIX_SIZE + "é".encode("latin-1") + b"a" * 8192
+
+        for content in [text, misleading, PNG]:
+            with tempfile.TemporaryFile() as file:
+                file.write(content)
+
+                assert ContentDetector().decode_file(
+                    file, "https://a.org/1"
+                ) == ContentDetector().decode(content, "https://a.org/1")
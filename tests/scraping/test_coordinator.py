@@ -0,0 +1,107 @@
+from iaso.scraping.coordinator import (
+    JobLeases,
+    journal_completed_jobs,
+    restore_completed_jobs,
+)
+from iaso.scraping.jobs.resume import job_hash
+
+JOB_A = (1, "a", False, "https://example.org/a")
+JOB_B = (1, "b", False, "https://example.org/b")
+
+
+class TestJobLeases:
+    def test_jobs_are_leased_in_batches(self):
+        leases = JobLeases(5, 10)
+
+        lease, jobs = leases.lease("a", 3, 0)
+
+        assert jobs == [0, 1, 2]
+        assert leases.lease("b", 3, 0)[1] == [3, 4]
+        assert leases.lease("b", 3, 0) == (None, [])
+
+        leases.complete([0, 1])
+
+        assert leases.status()["completed"] == 2
+        assert not leases.finished()
+
+    def test_expired_leases_are_reissued(self):
+        leases = JobLeases(3, 10)
+
+        lease, jobs = leases.lease("a", 2, 0)
+
+        leases.complete([jobs[0]])
+
+        # Renewed leases survive their original expiry
+        assert leases.renew([lease], 5) == [lease]
+        assert leases.lease("b", 1, 12)[1] == [2]
+
+        assert leases.lease("b", 3, 15)[1] == [1]
+        assert leases.renew([lease], 15) == []
+
+        # Late completions of expired leases are still accepted
+        leases.complete([1, 2])
+
+        assert leases.finished()
+
+    def test_released_jobs_are_handed_out_first(self):
+        leases = JobLeases(4, 10)
+
+        lease, jobs = leases.lease("a", 2, 0)
+
+        leases.release(lease, jobs)
+
+        assert leases.lease("b", 4, 0)[1] == [0, 1, 2, 3]
+
+    def test_failed_jobs_are_retried_until_given_up(self):
+        leases = JobLeases(3, 10, max_attempts=2)
+
+        lease, jobs = leases.lease("a", 2, 0)
+
+        # Failed jobs are retried after all other pending jobs
+        assert leases.fail([(lease, 0)]) == []
+        assert leases.lease("a", 3, 0)[1] == [2, 0]
+
+        # Failures of jobs which have been leased again are ignored
+        assert leases.fail([(lease, 0)]) == []
+        assert leases.status()["leased"] == 3
+
+    def test_failed_jobs_are_given_up_after_max_attempts(self):
+        leases = JobLeases(1, 10, max_attempts=2)
+
+        lease, jobs = leases.lease("a", 1, 0)
+        assert leases.fail([(lease, 0)]) == []
+
+        lease, jobs = leases.lease("a", 1, 0)
+        assert leases.fail([(lease, 0)]) == [0]
+
+        assert leases.finished()
+        assert leases.status()["failed"] == 1
+
+
+class TestCoordinatorProgress:
+    def test_completed_jobs_are_restored(self, tmp_path):
+        jobs = [JOB_A, JOB_B, JOB_A]
+        progress_path = tmp_path / "PROGRESS"
+
+        leases = JobLeases(len(jobs), 10)
+
+        with open(progress_path, "a") as progress:
+            journal_completed_jobs(progress, jobs, leases.complete([0, 1, 1]))
+
+            # An interrupted write leaves behind an incomplete line
+            progress.write(job_hash(JOB_A)[:5])
+
+        leases = JobLeases(len(jobs), 10)
+
+        restore_completed_jobs(leases, jobs, progress_path)
+
+        # The duplicated job is only completed as often as it was journaled
+        assert leases.status()["completed"] == 2
+        assert leases.lease("a", 3, 0)[1] == [2]
+
+    def test_missing_progress_is_ignored(self, tmp_path):
+        leases = JobLeases(1, 10)
+
+        restore_completed_jobs(leases, [JOB_A], tmp_path / "PROGRESS")
+
+        assert leases.status()["completed"] == 0
@@ -0,0 +1,128 @@
+import asyncio
+
+from iaso.scraping.content_type import content_reference
+from iaso.scraping.ftp import FtpConnectionPool, scrape_ftp_resource
+
+FILES = {"pub/hello.txt": b"Hello FTP!\n", "pub/large.bin": bytes(range(256)) * 64}
+
+
+async def serve_ftp(logins):
+    async def handle(reader, writer):
+        cwd = ""
+        data = asyncio.get_running_loop().create_future()
+
+        async def accept(data_reader, data_writer):
+            data.set_result(data_writer)
+
+        writer.write(b"220 Welcome\r\n")
+
+        while True:
+            line = (await reader.readline()).decode().strip()
+
+            if not line:
+                break
+
+            command, _, argument = line.partition(" ")
+
+            if command == "USER":
+                logins.append(argument)
+                writer.write(b"331 Password required\r\n")
+            elif command == "PASS":
+                writer.write(b"230-Logged in\r\n230 Welcome\r\n")
+            elif command == "PWD":
+                writer.write(b'257 "/" is the current directory\r\n')
+            elif command == "TYPE":
+                writer.write(b"200 Binary mode\r\n")
+            elif command == "EPSV":
+                data = asyncio.get_running_loop().create_future()
+                server = await asyncio.start_server(accept, "127.0.0.1", 0)
+                port = server.sockets[0].getsockname()[1]
+                writer.write(f"229 Entering passive mode (|||{port}|)\r\n".encode())
+            elif command == "CWD":
+                path = argument.strip("/")
+
+                if path == "" or path == "pub":
+                    cwd = path
+                    writer.write(b"250 OK\r\n")
+                else:
+                    writer.write(b"550 No such directory\r\n")
+            elif command in ("RETR", "LIST"):
+                if command == "RETR" and argument not in FILES:
+                    writer.write(b"550 No such file\r\n")
+                    (await data).close()
+                    continue
+
+                content = (
+                    FILES[argument]
+                    if command == "RETR"
+                    else "\r\n".join(f for f in FILES if f.startswith(cwd)).encode()
+                )
+
+                writer.write(b"150 Opening data connection\r\n")
+                data_writer = await data
+                data_writer.write(content)
+                await data_writer.drain()
+                data_writer.close()
+                server.close()
+                writer.write(b"226 Transfer complete\r\n")
+
+            await writer.drain()
+
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def scrape(*urls, max_size=1024):
+    async def run():
+        logins = []
+
+        server = await serve_ftp(logins)
+        port = server.sockets[0].getsockname()[1]
+
+        async with FtpConnectionPool() as pool:
+            results = [
+                await scrape_ftp_resource(
+                    pool, None, f"ftp://127.0.0.1:{port}/{url}", 5, max_size
+                )
+                for url in urls
+            ]
+
+        server.close()
+
+        return results, logins
+
+    return asyncio.run(run())
+
+
+class TestFtpScraping:
+    def test_control_connections_are_reused(self):
+        results, logins = scrape("pub/hello.txt", "pub/missing.txt", "pub/hello.txt")
+
+        assert [result[1][0]["status"] for result in results] == [200, 550, 200]
+        assert results[0][2] == "Hello FTP!\n"
+        assert results[0][3] == "text/plain; charset=utf-8"
+        assert "truncated_response" not in results[0][1][0]
+        assert logins == ["anonymous"]
+
+    def test_directories_are_listed(self):
+        ((_, redirects, content, _), (_, _, hello, _)), logins = scrape(
+            "pub/", "pub/hello.txt"
+        )
+
+        assert redirects[0]["status"] == 200
+        assert "pub/hello.txt" in content
+        assert hello == "Hello FTP!\n"
+        assert logins == ["anonymous"]
+
+    def test_downloads_are_capped(self):
+        ((_, redirects, content, content_type),), _ = scrape(
+            "pub/large.bin", max_size=100
+        )
+
+        assert redirects[0]["status"] == 200
+        assert redirects[0]["truncated_response"] is True
+        assert content_type.endswith("charset=binary")
+        assert content == content_reference(
+            FILES["pub/large.bin"][:100], "application/octet-stream"
+        )
@@ -0,0 +1,76 @@
+import quopri
+
+from iaso.scraping.http.mhtml import extract_html_content, iter_mhtml_parts
+
+BOUNDARY = "----MultipartBoundary--test----"
+
+ROOT = '<html><head><link rel="stylesheet" href="cid:css-1@mhtml.blink"></head><body><p>Café = café</p><iframe src="cid:frame-2@mhtml.blink"></iframe></body></html>'
+FRAME = '<html><body><iframe src="cid:frame-3@mhtml.blink"></iframe></body></html>'
+NESTED_FRAME = "<html><body><h1>Nested</h1></body></html>"
+CSS = "p { color: red; }"
+
+
+def quoted_printable(text):
+    return quopri.encodestring(text.encode("utf-8")).decode("ascii")
+
+
+def create_snapshot():
+    parts = [
+        ("text/html", "frame-1", "https://example.org/", ROOT),
+        ("text/css", "css-1", "cid:css-1@mhtml.blink", CSS),
+        ("text/html", "frame-2", "about:blank", FRAME),
+        ("text/html", "frame-3", "about:blank", NESTED_FRAME),
+    ]
+
+    snapshot = [
+        "From: <Saved by Blink>\r\n",
+        "Snapshot-Content-Location: https://example.org/\r\n",
+        "MIME-Version: 1.0\r\n",
+        f'Content-Type: multipart/related;\r\n\ttype="text/html";\r\n\tboundary="{BOUNDARY}"\r\n\r\n\r\n',
+    ]
+
+    for content_type, cid, location, content in parts:
+        snapshot.append(
+            f"--{BOUNDARY}\r\nContent-Type: {content_type}\r\n"
+            + f"Content-ID: <{cid}@mhtml.blink>\r\n"
+            + "Content-Transfer-Encoding: quoted-printable\r\n"
+            + f"Content-Location: {location}\r\n\r\n"
+            + quoted_printable(content).replace("\n", "\r\n")
+            + "\r\n"
+        )
+
+    snapshot.append(f"--{BOUNDARY}--\r\n")
+
+    return "".join(snapshot)
+
+
+class TestMHTML:
+    def test_parts_are_split_and_decoded(self):
+        headers, parts = iter_mhtml_parts(create_snapshot())
+
+        assert headers["snapshot-content-location"] == "https://example.org/"
+
+        parts = list(parts)
+
+        assert [part.headers["content-id"] for part in parts] == [
+            "<frame-1@mhtml.blink>",
+            "<css-1@mhtml.blink>",
+            "<frame-2@mhtml.blink>",
+            "<frame-3@mhtml.blink>",
+        ]
+        assert [part.decode() for part in parts] == [ROOT, CSS, FRAME, NESTED_FRAME]
+
+    def test_frames_are_spliced_into_the_root_document(self):
+        content = extract_html_content(create_snapshot())
+
+        assert content == ROOT.replace(
+            '<link rel="stylesheet" href="cid:css-1@mhtml.blink">',
+            '<link rel="stylesheet" href="cid:css-1@mhtml.blink">' + CSS,
+        ).replace(
+            '<iframe src="cid:frame-2@mhtml.blink">',
+            '<iframe src="cid:frame-2@mhtml.blink">'
+            + FRAME.replace(
+                '<iframe src="cid:frame-3@mhtml.blink">',
+                '<iframe src="cid:frame-3@mhtml.blink">' + NESTED_FRAME,
+            ),
+        )
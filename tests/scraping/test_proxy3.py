@@ -0,0 +1,34 @@
+from iaso.scraping.http.proxy3 import (
+    BodyLimit,
+    encode_chunk,
+    encode_last_chunk,
+    exceeds_body_size,
+)
+
+
+class TestProxyStreaming:
+    def test_bodies_are_truncated_at_the_limit(self):
+        limit = BodyLimit(8)
+
+        assert limit.truncate(b"hello") == b"hello"
+        assert not limit.truncated
+        assert limit.truncate(b" world") == b" wo"
+        assert limit.truncated
+
+        unlimited = BodyLimit(None)
+
+        assert unlimited.truncate(b"hello world") == b"hello world"
+        assert not unlimited.truncated
+
+        assert exceeds_body_size("9", 8)
+        assert not exceeds_body_size("8", 8)
+        assert not exceeds_body_size(None, 8)
+        assert not exceeds_body_size("9", None)
+
+    def test_chunks_are_encoded(self):
+        assert encode_chunk(b"hello world") == b"b\r\nhello world\r\n"
+        assert encode_last_chunk([]) == b"0\r\n\r\n"
+        assert (
+            encode_last_chunk([("X-Invalid-Response", True)])
+            == b"0\r\nX-Invalid-Response: True\r\n\r\n"
+        )
@@ -0,0 +1,105 @@
+import asyncio
+import ssl
+
+import pytest
+
+from iaso.scraping.http.certificates import CertificateAuthority
+from iaso.scraping.http.proxy3_async import (
+    UpstreamProtocolError,
+    filter_headers,
+    iter_response_body,
+    wrap_tls_streams,
+)
+
+
+def read_body(data, headers, method="GET", status=200):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+
+        return b"".join(
+            [
+                chunk
+                async for chunk in iter_response_body(
+                    reader, method, status, headers, 1
+                )
+            ]
+        )
+
+    return asyncio.run(read())
+
+
+class TestAsyncProxy:
+    def test_bodies_are_delimited(self):
+        assert read_body(b"hello world", [("Content-Length", "5")]) == b"hello"
+        assert (
+            read_body(
+                b"5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n",
+                [("Transfer-Encoding", "chunked")],
+            )
+            == b"hello world"
+        )
+        assert read_body(b"until closed", []) == b"until closed"
+        assert read_body(b"ignored", [("Content-Length", "7")], method="HEAD") == b""
+
+    def test_truncated_chunked_bodies_are_invalid(self):
+        with pytest.raises(UpstreamProtocolError):
+            read_body(b"a\r\nhello", [("Transfer-Encoding", "chunked")])
+
+        with pytest.raises(UpstreamProtocolError):
+            read_body(b"zz\r\nhello\r\n", [("Transfer-Encoding", "chunked")])
+
+    def test_hop_by_hop_headers_are_filtered(self):
+        assert (
+            filter_headers(
+                [
+                    ("Host", "example.org"),
+                    ("Connection", "keep-alive"),
+                    ("Proxy-Connection", "keep-alive"),
+                    ("Accept-Encoding", "gzip, br, deflate"),
+                ]
+            )
+            == [("Host", "example.org"), ("Accept-Encoding", "gzip, deflate")]
+        )
+
+    def test_connections_are_upgraded_to_tls_in_new_streams(self, tmp_path):
+        certificates = CertificateAuthority(tmp_path)
+
+        async def handle(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+
+            writer.write(b"HTTP/1.1 200 Connection Established\r\n\r\n")
+
+            reader, writer = await wrap_tls_streams(
+                writer, certificates.context("localhost")
+            )
+
+            writer.write(b"upgraded " + await reader.readline())
+            await writer.drain()
+            writer.close()
+
+        async def connect():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+            writer.write(b"CONNECT localhost:443 HTTP/1.1\r\n\r\n")
+
+            await reader.readuntil(b"\r\n\r\n")
+
+            context = ssl.create_default_context(cafile=str(tmp_path / "ca.crt"))
+
+            await writer.start_tls(context, server_hostname="localhost")
+
+            writer.write(b"hello\n")
+
+            response = await reader.read()
+
+            writer.close()
+            server.close()
+
+            return response
+
+        assert asyncio.run(connect()) == b"upgraded hello\n"
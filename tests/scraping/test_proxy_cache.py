@@ -0,0 +1,95 @@
+import threading
+import time
+
+from iaso.scraping.http.proxy_cache import (
+    ResourceCache,
+    freshness_lifetime,
+    is_cacheable_request,
+)
+
+SCRIPT_HEADERS = [
+    ("Content-Type", "application/javascript"),
+    ("Cache-Control", "public, max-age=60"),
+]
+
+
+class TestResourceCache:
+    def test_only_sub_resources_are_cacheable(self):
+        assert is_cacheable_request("GET", {"sec-fetch-dest": "script"})
+        assert is_cacheable_request("GET", {"accept": "image/webp,*/*"})
+        assert not is_cacheable_request("GET", {"sec-fetch-dest": "document"})
+        assert not is_cacheable_request("GET", {"sec-fetch-mode": "navigate"})
+        assert not is_cacheable_request("GET", {"accept": "text/html,*/*"})
+        assert not is_cacheable_request("POST", {"sec-fetch-dest": "script"})
+        assert not is_cacheable_request(
+            "GET", {"sec-fetch-dest": "script", "cache-control": "no-store"}
+        )
+
+    def test_cache_control_is_respected(self):
+        now = time.time()
+
+        assert freshness_lifetime({"cache-control": "max-age=60"}, now) == 60
+        assert (
+            freshness_lifetime({"cache-control": "max-age=60", "age": "50"}, now) == 10
+        )
+        assert freshness_lifetime({"cache-control": "no-store"}, now) is None
+        assert freshness_lifetime({"cache-control": "private"}, now) is None
+        assert freshness_lifetime({"cache-control": "max-age=0"}, now) is None
+        assert freshness_lifetime({}, now) is None
+
+    def test_evicted_entries_are_demoted_to_disk(self, tmp_path):
+        cache = ResourceCache(64, 1024, tmp_path)
+
+        for i in range(10):
+            assert cache.store(
+                f"http://example.org/{i}.js",
+                {},
+                200,
+                "OK",
+                SCRIPT_HEADERS,
+                b"x" * 8,
+            )
+
+        assert not cache.store(
+            "http://example.org/page",
+            {},
+            200,
+            "OK",
+            [("Content-Type", "text/html")],
+            b"",
+        )
+
+        # Only the most recently used entries fit into the memory tier
+        assert len(cache.memory) == 8
+        assert len(cache.disk) == 2
+
+        assert cache.lookup("http://example.org/0.js", {}).body == b"x" * 8
+        assert len(cache.memory) == 8
+        assert len(cache.disk) == 2
+
+        assert cache.lookup("http://example.org/10.js", {}) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_disk_files_match_the_disk_tier_under_concurrency(self, tmp_path):
+        cache = ResourceCache(64, 256, tmp_path)
+
+        def scrape(thread):
+            for i in range(200):
+                url = f"http://example.org/{(i * (thread + 1)) % 40}.js"
+
+                if cache.lookup(url, {}) is None:
+                    cache.store(url, {}, 200, "OK", SCRIPT_HEADERS, b"x" * 8)
+
+        threads = [threading.Thread(target=scrape, args=(i,)) for i in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        # No file is left behind by entries that were evicted while written
+        assert sorted(tmp_path.iterdir()) == sorted(
+            path for path, _size in cache.disk.values()
+        )
+        assert cache.disk_used == 8 * len(cache.disk) <= 256
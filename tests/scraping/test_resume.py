@@ -0,0 +1,62 @@
+import json
+
+from iaso.scraping.jobs.resume import (
+    filter_completed_jobs,
+    job_hash,
+    truncate_incomplete_progress,
+    write_completed_job,
+)
+
+JOBS = [
+    (1, "a", False, "https://example.org/a"),
+    (1, "b", True, "https://example.org/b"),
+    (2, "a", False, "https://example.com/a"),
+]
+
+
+class TestResume:
+    def test_job_hash_is_stable_across_job_types(self):
+        assert job_hash(JOBS[0]) == job_hash(list(JOBS[0]))
+        assert job_hash(JOBS[0]) != job_hash(JOBS[1])
+
+    def test_completed_jobs_are_filtered_with_multiplicity(self, tmp_path):
+        progress = tmp_path / "PROGRESS"
+
+        with open(progress, "w") as file:
+            write_completed_job(file, JOBS[0])
+            write_completed_job(file, JOBS[2])
+
+        assert filter_completed_jobs(JOBS + JOBS, progress) == [
+            JOBS[1],
+            JOBS[0],
+            JOBS[1],
+            JOBS[2],
+        ]
+
+    def test_truncated_final_record_is_ignored(self, tmp_path):
+        progress = tmp_path / "PROGRESS"
+
+        with open(progress, "w") as file:
+            write_completed_job(file, JOBS[0])
+            file.write(job_hash(JOBS[1])[:7])
+
+        assert filter_completed_jobs(JOBS, progress) == JOBS[1:]
+
+        truncate_incomplete_progress(progress)
+
+        with open(progress, "a") as file:
+            write_completed_job(file, JOBS[1])
+
+        assert filter_completed_jobs(JOBS, progress) == JOBS[2:]
+
+    def test_legacy_progress_is_upgraded(self, tmp_path):
+        progress = tmp_path / "PROGRESS"
+
+        with open(progress, "w") as file:
+            json.dump(JOBS[1], file)
+            json.dump(JOBS[2], file)
+
+        assert filter_completed_jobs(JOBS, progress) == JOBS[:1]
+
+        with open(progress, "r") as file:
+            assert file.read() == f"{job_hash(JOBS[1])}\n{job_hash(JOBS[2])}\n"
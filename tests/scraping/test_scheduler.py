@@ -0,0 +1,81 @@
+from iaso.scraping.scheduler import HostScheduler
+
+
+def make_jobs(host, n):
+    return [(0, f"{host}{i}", False, f"https://{host}/{i}") for i in range(n)]
+
+
+class TestHostScheduler:
+    def test_hosts_are_capped(self):
+        scheduler = HostScheduler(make_jobs("a.org", 3) + make_jobs("b.org", 1), 2, 0)
+
+        started = [scheduler.pop(0) for _ in range(3)]
+
+        assert [job[3] for job in started] == [
+            "https://a.org/2",
+            "https://a.org/1",
+            "https://b.org/0",
+        ]
+        assert scheduler.pop(0) is None
+        assert scheduler.depths() == {
+            "queued": 1,
+            "ready": 0,
+            "waiting": 0,
+            "capped": 1,
+        }
+
+        scheduler.complete(started[0], 0)
+
+        assert scheduler.pop(0)[3] == "https://a.org/0"
+        assert len(scheduler) == 0
+
+    def test_hosts_are_not_capped_by_default(self):
+        scheduler = HostScheduler(make_jobs("a.org", 3), None, 0)
+
+        started = [scheduler.pop(0) for _ in range(3)]
+
+        assert None not in started
+        assert len(scheduler) == 0
+
+        scheduler.complete(started[0], 0)
+
+        assert scheduler.pop(0) is None
+
+    def test_hosts_are_interleaved_by_default(self):
+        jobs = make_jobs("big.org", 20)
+
+        for i in range(20):
+            jobs += make_jobs(f"host{i}.org", 4)
+
+        scheduler = HostScheduler(jobs, None, 0)
+
+        hosts = [scheduler.pop(0)[3].split("/")[2] for _ in range(len(jobs))]
+
+        # Every host is served within the first round
+        assert len(set(hosts[:25])) == 21
+
+        # The big host is spread over the entire run in proportion to its jobs
+        assert all(
+            hosts[i : i + 10].count("big.org") <= 3 for i in range(len(hosts) - 10)
+        )
+        assert "big.org" in hosts[-5:]
+
+    def test_requests_to_a_host_are_spaced(self):
+        scheduler = HostScheduler(make_jobs("a.org", 2), 2, 1.0)
+
+        assert scheduler.pop(0) is not None
+        assert scheduler.pop(0.5) is None
+        assert scheduler.next_ready_time(0.5) == 1.0
+        assert scheduler.pop(1.0) is not None
+        assert scheduler.next_ready_time(1.0) is None
+
+    def test_cleared_jobs_are_not_handed_out(self):
+        scheduler = HostScheduler(make_jobs("a.org", 2), 1, 0)
+
+        job = scheduler.pop(0)
+
+        scheduler.clear()
+        scheduler.complete(job, 0)
+
+        assert scheduler.pop(0) is None
+        assert len(scheduler) == 0
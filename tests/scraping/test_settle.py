@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from iaso.scraping.http.settle import (
+    QUIET_PERIOD,
+    STALLED_NETWORK_PERIOD,
+    PageSettleMonitor,
+)
+
+
+class FakePage:
+    def __init__(self):
+        self.listeners = dict()
+
+    def on(self, event, listener):
+        self.listeners[event] = listener
+
+
+class TestPageSettleMonitor:
+    def test_requests_in_flight_delay_settling(self):
+        page = FakePage()
+        monitor = PageSettleMonitor(page)
+
+        page.listeners["request"]("request")
+
+        assert monitor.settled_at() == monitor.last_network + STALLED_NETWORK_PERIOD
+
+        page.listeners["requestfinished"]("request")
+
+        assert (
+            monitor.settled_at()
+            == max(monitor.last_mutation, monitor.last_network) + QUIET_PERIOD
+        )
+
+    def test_wait_returns_once_settled_or_at_deadline(self):
+        monitor = PageSettleMonitor(FakePage())
+
+        start_time = time.time()
+        asyncio.run(monitor.wait(start_time + 10))
+
+        assert QUIET_PERIOD <= time.time() - start_time < 10
+
+        monitor.onRequest("request")
+
+        start_time = time.time()
+        asyncio.run(monitor.wait(start_time + QUIET_PERIOD))
+
+        assert time.time() - start_time < STALLED_NETWORK_PERIOD
@@ -0,0 +1,58 @@
+from collections import Counter
+
+from iaso.click.shard import Shard, ShardParamType
+from iaso.scraping.jobs.shards import (
+    shard_jobs,
+    shard_jobs_path,
+    split_jobs_into_shards,
+)
+from iaso.scraping.scheduler import job_host
+
+
+def make_jobs(host, n):
+    return [(0, f"{host}{i}", False, f"https://{host}/{i}") for i in range(n)]
+
+
+JOBS = (
+    make_jobs("a.org", 6)
+    + make_jobs("b.org", 4)
+    + make_jobs("c.org", 3)
+    + make_jobs("d.org", 2)
+    + make_jobs("e.org", 1)
+)
+
+
+class TestShards:
+    def test_hosts_belong_to_one_shard(self):
+        shards = split_jobs_into_shards(JOBS, 3)
+
+        assert sum(len(shard) for shard in shards) == len(JOBS)
+
+        hosts = Counter(host for shard in shards for host in {*map(job_host, shard)})
+
+        assert all(count == 1 for count in hosts.values())
+
+    def test_shards_are_balanced(self):
+        shards = split_jobs_into_shards(JOBS, 2)
+
+        assert sorted(len(shard) for shard in shards) == [8, 8]
+
+    def test_sharding_is_stable(self):
+        shards = split_jobs_into_shards(JOBS, 3)
+
+        # The partition does not depend on the order of the jobs
+        reordered = split_jobs_into_shards(list(reversed(JOBS)), 3)
+
+        for index in range(3):
+            assert shard_jobs(JOBS, index + 1, 3) == shards[index]
+            assert set(reordered[index]) == set(shards[index])
+
+    def test_shard_files_are_named_after_the_jobs(self):
+        assert shard_jobs_path("jobs.json", 2, 4) == "jobs.2-of-4.json"
+        assert shard_jobs_path("dir.d/jobs", 1, 2) == "dir.d/jobs.1-of-2"
+
+    def test_shard_option_is_parsed(self):
+        shard = ShardParamType().convert("2/4", None, None)
+
+        assert shard == Shard(2, 4)
+        assert str(shard) == "2/4"
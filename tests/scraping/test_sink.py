@@ -0,0 +1,17 @@
+import pytest
+
+from iaso.scraping.sink import DumpSink
+
+
+class TestDumpSink:
+    def test_writer_errors_are_raised_by_put(self, tmp_path):
+        sink = DumpSink(tmp_path / "missing", flush_interval=5)
+
+        with pytest.raises(FileNotFoundError):
+            with sink:
+                sink.thread.join()
+
+                sink.put(1, None, (1, "a", False, "https://example.org/a"))
+
+        # Only the shutdown of the sink has been queued
+        assert list(sink.queue.queue) == [None]
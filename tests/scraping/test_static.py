@@ -0,0 +1,29 @@
+from iaso.scraping.http.static import requires_javascript
+
+STATIC_PAGE = (
+    "<html><head><script>track();</script></head><body><p>{}</p></body></html>".format(
+        "Some server-rendered content. " * 20
+    )
+)
+
+
+class TestRequiresJavascript:
+    def test_static_pages_do_not_require_javascript(self):
+        assert not requires_javascript(STATIC_PAGE)
+        assert not requires_javascript("<html><body>Not Found</body></html>")
+
+    def test_script_shells_require_javascript(self):
+        assert requires_javascript(
+            '<html><head><script src="app.js"></script></head><body><div id="root"></div></body></html>'
+        )
+
+    def test_navigations_require_javascript(self):
+        assert requires_javascript(
+            '<html><head><meta http-equiv="refresh" content="0; url=/next"></head></html>'
+        )
+        assert requires_javascript(
+            STATIC_PAGE.replace("track();", 'window.location.href = "/next";')
+        )
+        assert not requires_javascript(
+            STATIC_PAGE.replace("track();", 'if (window.location == "/") {}')
+        )
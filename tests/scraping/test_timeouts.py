@@ -0,0 +1,40 @@
+from iaso.scraping.timeouts import AdaptiveTimeouts
+
+
+class TestAdaptiveTimeouts:
+    def test_timeouts_follow_the_host_latency(self):
+        timeouts = AdaptiveTimeouts(30, minimum=5, margin=5, min_samples=5)
+
+        for _ in range(4):
+            timeouts.observe("fast.org", 1.0)
+
+        # Hosts without enough samples use the global maximum
+        assert timeouts.timeout("fast.org") == 30
+        assert timeouts.timeout("unknown.org") == 30
+
+        for _ in range(16):
+            timeouts.observe("fast.org", 1.0)
+
+        timeouts.observe("fast.org", 3.0)
+
+        assert timeouts.timeout("fast.org") == 6.0
+
+        for _ in range(10):
+            timeouts.observe("slow.org", 60.0)
+
+        assert timeouts.timeout("slow.org") == 30
+
+    def test_timeouts_are_learned_from_redirects(self):
+        timeouts = AdaptiveTimeouts(30, minimum=1, margin=1, min_samples=1)
+
+        timeouts.observe_redirects(
+            "a.org",
+            [
+                {"url": "http://a.org", "response_time": 500},
+                {"url": "https://a.org", "response_time": 1500},
+            ],
+        )
+        timeouts.observe_redirects("b.org", [{"url": "http://b.org"}])
+
+        assert timeouts.timeout("a.org") == 3.0
+        assert timeouts.timeout("b.org") == 30